@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import time
+import traceback
+from config import PLAIN, console
+from logger import main_logger, subprocess_logger, log_subprocess_output
+from runner import run_streaming
+from warm import run_warm, stop_warm, reap_idle
+from manifest import packages, get_package
+from ui import say, error_panel
+
+# run, stop and list only read the manifest; they stay clear of container.py and its imports
+# (rich.progress, the stage scheduler, the podman API client), and of rich entirely in plain mode
+
+def run_container(pkg, warm=False, detach=False):
+    record = get_package(pkg)
+    if record is None or "run_script" not in record.get("artifacts", {}):
+        error_panel(f"Błąd: Pakiet {pkg} nie jest zainstalowany!", f"Użyj 'isolator install {pkg}' aby zainstalować pakiet.")
+        main_logger.error(f"Attempted to run non-existent package {pkg}")
+        sys.exit(1)
+    say(f"Uruchamianie {pkg}...", "bold cyan")
+    main_logger.info(f"Starting container for {pkg}")
+    run_script = record["artifacts"]["run_script"]
+    try:
+        if detach:
+            from detached import start_detached
+            entry = start_detached(pkg, record["image"])
+            say(f"{pkg} działa w tle (kontener {entry['cid'][:12]}, PID {entry['pid']})")
+            say(f"Wyjście aplikacji: isolator logs {pkg}\n", "cyan")
+            return
+        if warm:
+            mode, seconds, returncode = run_warm(pkg, record["image"], record.get("image_id"))
+            label = "ciepły" if mode == "warm" else "zimny"
+            say(f"{pkg} zakończony (start {label}: {seconds:.2f} s)\n")
+            main_logger.info(f"{pkg} exited with {returncode} after {mode} start")
+            return
+        if PLAIN:
+            run_streaming([run_script], f"Run container {pkg}", check=True, transcript=False)
+        else:
+            with console.status("[cyan]Uruchamianie...[/cyan]", spinner="runner"):
+                run_streaming([run_script], f"Run container {pkg}", check=True, transcript=False)
+        say(f"{pkg} uruchomiony pomyślnie\n")
+        main_logger.info(f"Successfully ran {pkg}")
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"Run error for {pkg}: {str(e)}")
+        log_subprocess_output(subprocess_logger, e, f"Error running {pkg}")
+        error_panel(f"Błąd podczas uruchamiania {pkg}: {str(e)}", "Sprawdź konfigurację podman i uprawnienia.")
+        if os.environ.get("DEBUG"):
+            say("Szczegóły błędu:", "red")
+            say(traceback.format_exc(), "red")
+        sys.exit(1)
+
+def stop_package(pkg):
+    if pkg == "--idle":
+        reaped = reap_idle()
+        say(f"Zatrzymano bezczynne kontenery: {', '.join(reaped) if reaped else 'brak'}\n")
+        return
+    from detached import stop_detached
+    detached = stop_detached(pkg)
+    warm = stop_warm(pkg)
+    if detached:
+        say(f"Zatrzymano instancje {pkg} działające w tle: {detached}\n")
+    if warm:
+        say(f"Zatrzymano ciepły kontener {pkg}\n")
+    if not (detached or warm):
+        say(f"{pkg} nie ma uruchomionego ciepłego kontenera ani instancji w tle\n", "bold yellow")
+
+def list_packages():
+    records = packages()
+    if not records:
+        if PLAIN:
+            print("Brak zainstalowanych pakietów")
+        else:
+            from rich.panel import Panel
+            from rich.box import ROUNDED
+            console.print(Panel(
+                "[bold yellow]Brak zainstalowanych pakietów[/bold yellow]",
+                border_style="yellow",
+                padding=(1, 2),
+                style="on #2d2a1a",
+                box=ROUNDED
+            ))
+            console.print("\n")
+        main_logger.info("No installed packages found")
+        return
+    rows = []
+    for name in sorted(records):
+        record = records[name]
+        size = f"{record['size'] / 1024 / 1024:.0f} MB" if record.get("size") else "?"
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["updated_at"])) if record.get("updated_at") else "?"
+        source = record.get("source", "?") + (f", zestaw {record['bundle']}" if record.get("bundle") else "")
+        rows.append((name, record.get("version") or "?", source, size, updated))
+    if PLAIN:
+        # Tab separated, one package per line, for scripts
+        print("\n".join("\t".join(row) for row in rows))
+        main_logger.info("Listed installed packages")
+        return
+    from rich.panel import Panel
+    from rich.table import Table
+    from rich.box import ROUNDED
+    table = Table(
+        title="Zainstalowane Pakiety",
+        title_style="bold color(201) on #1a2525",
+        show_lines=True,
+        border_style="bright_cyan",
+        header_style="bold white on #2d3b3b",
+        padding=(0, 1),
+        box=ROUNDED
+    )
+    table.add_column("Pakiet", style="cyan", width=25)
+    table.add_column("Wersja", style="white")
+    table.add_column("Źródło", style="magenta")
+    table.add_column("Rozmiar", style="yellow", justify="right")
+    table.add_column("Zaktualizowano", style="green")
+    for row in rows:
+        table.add_row(*row)
+    console.print(Panel(
+        table,
+        border_style="cyan",
+        padding=(1, 2),
+        style="on #1a2525",
+        box=ROUNDED
+    ))
+    console.print("\n")
+    main_logger.info("Listed installed packages")
@@ -0,0 +1,290 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from config import IMAGES, BASE_IMAGE, AUR_BASE_IMAGE, CACHE_DIR, ensure_dirs
+from logger import main_logger, subprocess_logger, log_subprocess_output
+from runner import run_streaming
+import podman_api as podman
+from base import load_base_state, save_base_state
+from manifest import get_package, update_package, inspect_image, default_artifacts
+from storage import image_layers
+from locks import package_lock, base_lock, LockTimeout
+from ui import say, panel, error_panel, spinner, show_results
+
+# An export is a directory (usable in place as a shared store) or the same tree as a zstd-compressed tar:
+#   isolator.json      what each entry is: its manifest record, layers and launchers
+#   blobs/<hex>        every blob once, shared by all entries
+#   <name>/            the image in podman's dir: transport layout, blobs hard-linked into blobs/
+# dir: keeps layers uncompressed, so a blob's name is its layer's diff ID. Thin exports leave out
+# the base's layers; podman skips layers it already has, so their files are never looked for.
+ARCHIVE_META = "isolator.json"
+ARCHIVE_VERSION = 1
+# Manifest fields that describe the app rather than this host's copy of its image
+CARRIED_FIELDS = ["version", "source", "engine", "base_id", "squashed", "created_at"]
+
+def zstd_path():
+    path = shutil.which("zstd")
+    if path is None:
+        raise FileNotFoundError("zstd nie jest zainstalowany (wymagany do archiwów .tar.zst)")
+    return path
+
+def load_meta(root):
+    try:
+        with open(Path(root) / ARCHIVE_META) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": ARCHIVE_VERSION, "entries": {}}
+
+def read_launchers(record):
+    """The run script and .desktop entry as written on this host, edits included"""
+    texts = {}
+    for kind, path in (record.get("artifacts") or {}).items():
+        try:
+            texts[kind] = Path(path).read_text()
+        except OSError:
+            pass
+    return texts
+
+def base_layers():
+    """Diff IDs of the base images' layers on this host"""
+    layers = set()
+    for image in (BASE_IMAGE, AUR_BASE_IMAGE):
+        if podman.image_exists(image):
+            layers.update((podman.inspect_image(image).get("RootFS") or {}).get("Layers") or [])
+    return layers
+
+def stage_image(root, name, image, omit):
+    """Push image into root/name, moving its blobs into the shared pool; returns the diff IDs left out"""
+    target = root / name
+    pool = root / "blobs"
+    shutil.rmtree(target, ignore_errors=True)
+    ensure_dirs(pool)
+    run_streaming(["podman", "push", str(image), f"dir:{target}"], f"Export {name}", check=True)
+    omitted = []
+    for path in target.iterdir():
+        if path.name in ("manifest.json", "version"):
+            continue
+        if f"sha256:{path.name}" in omit:
+            path.unlink()
+            omitted.append(f"sha256:{path.name}")
+            continue
+        shared = pool / path.name
+        if shared.exists():
+            path.unlink()
+        else:
+            os.replace(path, shared)
+        os.link(shared, path)
+    return omitted
+
+def export_images(names, target, thin=False, with_base=False):
+    """Write the named apps (and with_base the base images) to target: a directory when it is one
+    or ends in a slash, a .tar.zst archive otherwise. Returns the entry names written."""
+    as_directory = str(target).endswith("/") or Path(target).is_dir()
+    target = Path(target)
+    if not as_directory:
+        zstd_path()
+    ensure_dirs(CACHE_DIR)
+    root = target if as_directory else Path(tempfile.mkdtemp(prefix="export-", dir=CACHE_DIR))
+    try:
+        ensure_dirs(root)
+        meta = load_meta(root)
+        omit = base_layers() if thin else set()
+        state = load_base_state()
+        entries = []
+        if with_base:
+            entries.append((BASE_IMAGE, BASE_IMAGE, {"kind": "base", "synced_at": state.get("synced_at"), "size_policy": state.get("size_policy")}))
+            if podman.image_exists(AUR_BASE_IMAGE):
+                entries.append((AUR_BASE_IMAGE, AUR_BASE_IMAGE, {"kind": "aur-base", **state.get("aur_base", {})}))
+        for pkg in names:
+            record = get_package(pkg)
+            entries.append((pkg, record["image"], {
+                "kind": "app",
+                "record": {field: record[field] for field in CARRIED_FIELDS if field in record},
+                "image": record["image"],
+                "artifacts": record.get("artifacts") or default_artifacts(pkg),
+                "launchers": read_launchers(record),
+            }))
+        for name, image, entry in entries:
+            main_logger.info(f"Exporting {name} to {target}")
+            entry["layers"] = (podman.inspect_image(image).get("RootFS") or {}).get("Layers") or []
+            entry["omitted"] = stage_image(root, name, image, omit if entry["kind"] == "app" else set())
+            entry["exported_at"] = time.time()
+            meta["entries"][name] = entry
+        with open(root / ARCHIVE_META, "w") as f:
+            json.dump(meta, f, indent=2)
+        if not as_directory:
+            write_archive(root, target, [name for name, _, _ in entries])
+        main_logger.info(f"Exported {len(entries)} images to {target}{' (thin)' if thin else ''}")
+        return [name for name, _, _ in entries]
+    finally:
+        if not as_directory:
+            shutil.rmtree(root, ignore_errors=True)
+
+def write_archive(root, target, names):
+    """Stream root through `zstd -T0` into target. The pool goes before the image directories so
+    tar stores their blobs as hard links, i.e. once."""
+    tmp = target.with_name(f".{target.name}.part")
+    with open(tmp, "wb") as out:
+        proc = subprocess.Popen([zstd_path(), "-T0", "-q", "-c"], stdin=subprocess.PIPE, stdout=out)
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                tar.add(root / ARCHIVE_META, ARCHIVE_META)
+                tar.add(root / "blobs", "blobs")
+                for name in names:
+                    tar.add(root / name, name)
+        finally:
+            proc.stdin.close()
+            code = proc.wait()
+    if code != 0:
+        tmp.unlink(missing_ok=True)
+        raise subprocess.CalledProcessError(code, ["zstd", "-T0"])
+    os.replace(tmp, target)
+
+def unpack_archive(path, root):
+    """Stream a .tar.zst export into root; returns its metadata"""
+    proc = subprocess.Popen([zstd_path(), "-dc", str(path)], stdout=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+            tar.extraction_filter = getattr(tarfile, "data_filter", None)
+            for member in tar:
+                tar.extract(member, root)
+    finally:
+        proc.stdout.close()
+        code = proc.wait()
+    if code != 0:
+        raise subprocess.CalledProcessError(code, ["zstd", "-dc", str(path)])
+    return load_meta(root)
+
+def write_imported_launchers(pkg, entry, image_name):
+    """The exporter's run script and .desktop entry, pointed at this host's image and paths"""
+    from container import write_launchers
+    artifacts = default_artifacts(pkg)
+    texts = entry.get("launchers") or {}
+    if set(texts) != set(artifacts):
+        return write_launchers(pkg, image_name)
+    ensure_dirs(*(Path(path).parent for path in artifacts.values()))
+    for kind, path in artifacts.items():
+        text = texts[kind].replace(entry["image"], str(image_name))
+        text = text.replace(entry["artifacts"]["run_script"], artifacts["run_script"])
+        Path(path).write_text(text)
+    Path(artifacts["run_script"]).chmod(0o755)
+    return artifacts
+
+def import_entry(root, name, entry):
+    """Load one entry into podman and register it; returns ("installed" | "skipped", detail)"""
+    kind = entry.get("kind", "app")
+    if kind == "app" and get_package(name):
+        return "skipped", "już zainstalowany"
+    if entry.get("omitted"):
+        present = {layer for info in image_layers().values() for layer in info["layers"]}
+        missing = [layer for layer in entry["omitted"] if layer not in present]
+        if missing:
+            return "failed", f"brak {len(missing)} warstw bazowych; zaimportuj najpierw eksport z --base"
+    proc = run_streaming(["podman", "pull", f"dir:{root / name}"], f"Import {name}", check=True)
+    image_id = proc.stdout.decode().split()[-1]
+    if kind == "app":
+        image_name = IMAGES / f"{name}.img"
+        podman.tag(image_id, image_name, f"Tag imported {name}")
+        update_package(name, image=str(image_name), artifacts=write_imported_launchers(name, entry, image_name),
+                       imported_at=time.time(), **entry.get("record", {}), **inspect_image(image_name))
+        return "installed", entry.get("record", {}).get("version") or "?"
+    # A base only takes the tag when this host has none: apps need its layers, not its name
+    if podman.image_exists(name):
+        return "skipped", "obraz bazowy już istnieje (warstwy wczytane)"
+    podman.tag(image_id, name, f"Tag imported {name}")
+    state = load_base_state()
+    if kind == "base":
+        save_base_state({"image_id": podman.inspect_image(name)["Id"], "synced_at": entry.get("synced_at") or time.time(),
+                         "size_policy": entry.get("size_policy") or "full"})
+    elif entry.get("base_id") and entry["base_id"] == state.get("image_id"):
+        state["aur_base"] = {"image_id": podman.inspect_image(name)["Id"], "base_id": entry["base_id"], "built_at": entry.get("built_at") or time.time()}
+        save_base_state(state)
+    return "installed", "obraz bazowy"
+
+def import_images(source, names=None):
+    """Import everything (or names) from an export directory or .tar.zst archive; returns {name: (status, detail)}"""
+    source = Path(source)
+    ensure_dirs(CACHE_DIR)
+    root = source if source.is_dir() else Path(tempfile.mkdtemp(prefix="import-", dir=CACHE_DIR))
+    try:
+        meta = load_meta(root) if source.is_dir() else unpack_archive(source, root)
+        if meta.get("version") != ARCHIVE_VERSION or not meta.get("entries"):
+            raise ValueError(f"{source} nie jest eksportem isolatora")
+        entries = meta["entries"]
+        wanted = [name for name in entries if names is None or name in names]
+        results = {name: ("failed", "brak w eksporcie") for name in names or [] if name not in entries}
+        # Bases first: thin app exports rely on their layers
+        for name in sorted(wanted, key=lambda name: entries[name].get("kind", "app") == "app"):
+            try:
+                with package_lock(name) if entries[name].get("kind", "app") == "app" else base_lock():
+                    results[name] = import_entry(root, name, entries[name])
+            except LockTimeout as e:
+                results[name] = ("failed", e)
+            except subprocess.CalledProcessError as e:
+                log_subprocess_output(subprocess_logger, e, f"Import error for {name}")
+                results[name] = ("failed", e)
+            main_logger.info(f"Import of {name}: {results[name][0]}")
+        return results
+    finally:
+        if not source.is_dir():
+            shutil.rmtree(root, ignore_errors=True)
+
+def export_command(names, target, thin=False, with_base=False):
+    try:
+        missing = [pkg for pkg in names if get_package(pkg) is None]
+        if missing:
+            main_logger.error(f"Export of packages that are not installed: {', '.join(missing)}")
+            error_panel(f"Błąd: Pakiety nie są zainstalowane: {', '.join(missing)}", "Użyj 'isolator list' aby zobaczyć zainstalowane pakiety.")
+            sys.exit(1)
+        # A member's image is the whole bundle's, and the import side would register it as a standalone app
+        bundled = {pkg: get_package(pkg)["bundle"] for pkg in names if get_package(pkg).get("bundle")}
+        if bundled:
+            main_logger.error(f"Export of bundle members refused: {', '.join(bundled)}")
+            error_panel(f"Błąd: Pakiety należą do zestawów: {', '.join(f'{pkg} (zestaw {name})' for pkg, name in bundled.items())}", "Zestawów nie można eksportować; na docelowym komputerze użyj 'isolator bundle add <zestaw> <pakiet>...'.")
+            sys.exit(1)
+        with spinner(f"Eksportowanie do {target}..."):
+            written = export_images(names, target, thin, with_base)
+        panel(
+            f"[bold green]Wyeksportowano: {', '.join(written)}[/bold green]\n"
+            f"[green]Cel: {target}{' (bez warstw bazowych)' if thin else ''}[/green]"
+        )
+    except (subprocess.CalledProcessError, OSError) as e:
+        main_logger.error(f"Export error: {str(e)}")
+        if isinstance(e, subprocess.CalledProcessError):
+            log_subprocess_output(subprocess_logger, e, "Export error")
+        error_panel(f"Błąd podczas eksportu: {str(e)}", "Sprawdź miejsce na dysku i konfigurację podman.")
+        if os.environ.get("DEBUG"):
+            say("Szczegóły błędu:", "red")
+            say(traceback.format_exc(), "red")
+        sys.exit(1)
+
+def import_command(source, names=None):
+    try:
+        with spinner(f"Importowanie z {source}..."):
+            results = import_images(source, names)
+    except (subprocess.CalledProcessError, OSError, ValueError, tarfile.TarError) as e:
+        main_logger.error(f"Import error: {str(e)}")
+        error_panel(f"Błąd podczas importu: {str(e)}", "Sprawdź, czy plik lub katalog pochodzi z 'isolator export'.")
+        if os.environ.get("DEBUG"):
+            say("Szczegóły błędu:", "red")
+            say(traceback.format_exc(), "red")
+        sys.exit(1)
+    rows = []
+    for name in sorted(results):
+        status, detail = results[name]
+        if status == "installed":
+            rows.append((name, f"[green]zaimportowany ({detail})[/green]"))
+        elif status == "skipped":
+            rows.append((name, f"[yellow]pominięty: {detail}[/yellow]"))
+        else:
+            rows.append((name, f"[red]błąd: {detail}[/red]"))
+    show_results("Podsumowanie Importu", rows, column="Obraz")
+    if any(status == "failed" for status, _ in results.values()):
+        sys.exit(1)
@@ -0,0 +1,198 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import traceback
+from config import UPSTREAM_IMAGE, BASE_IMAGE, AUR_BASE_IMAGE, BASE_STATE_FILE, BASE_MAX_AGE_HOURS, SYNC_DB, SIZE_POLICY, KEEP_LOCALES, ensure_dirs
+from logger import main_logger, subprocess_logger, log_subprocess_output
+from cache import pacman_cache_args
+from runner import run_streaming, PacmanProgress
+import podman_api as podman
+from utils import atomic_write_json
+from telemetry import span
+from locks import base_lock
+from ui import say, panel, error_panel, spinner
+
+BUILD_CONTAINER = f"{BASE_IMAGE}-build"
+AUR_BUILD_CONTAINER = f"{AUR_BASE_IMAGE}-build"
+AUR_TOOLCHAIN_STEPS = [
+    "pacman -S --needed --noconfirm git base-devel sudo",
+    "useradd -m builder && echo 'builder ALL=(ALL) NOPASSWD:ALL' >> /etc/sudoers",
+    'su builder -c "git clone https://aur.archlinux.org/yay-bin.git ~/yay-bin && cd ~/yay-bin && makepkg -si --noconfirm" && rm -rf /home/builder/yay-bin',
+]
+AUR_TOOLCHAIN_SCRIPT = " && ".join(AUR_TOOLCHAIN_STEPS)
+TARGET_NOT_FOUND = re.compile(r"^error: target not found: (\S+)$", re.M)
+# Paths pacman never unpacks under the slim size policy; every app image inherits the rule from the base
+SLIM_NOEXTRACT = ["usr/share/doc/*", "usr/share/man/*", "usr/share/info/*", "usr/share/gtk-doc/*", "usr/share/help/*", "usr/share/locale/*"]
+# Left in an image's own layer by installs and builds. The package cache is a bind mount and never committed.
+SLIM_CLEANUP = "rm -rf /tmp/* /var/tmp/* /root/.cache /home/*/.cache"
+
+def load_base_state():
+    try:
+        with open(BASE_STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_base_state(state):
+    atomic_write_json(BASE_STATE_FILE, state)
+
+def image_exists(image):
+    return podman.image_exists(image)
+
+def image_id(image):
+    return podman.inspect_image(image)["Id"]
+
+def base_image_exists():
+    return image_exists(BASE_IMAGE)
+
+def base_age_hours(state=None):
+    state = state if state is not None else load_base_state()
+    if "synced_at" not in state:
+        return None
+    return (time.time() - state["synced_at"]) / 3600
+
+def base_is_fresh():
+    state = load_base_state()
+    age = base_age_hours(state)
+    # A base built under another size policy is rebuilt, so new images follow the current one
+    return age is not None and age < BASE_MAX_AGE_HOURS and state.get("size_policy", "full") == SIZE_POLICY and base_image_exists()
+
+def noextract_rules():
+    rules = list(SLIM_NOEXTRACT)
+    for locale in KEEP_LOCALES:
+        rules += [f"!usr/share/locale/{locale}*", f"!usr/share/help/{locale}*"]
+    return rules + ["!usr/share/locale/locale.alias"]
+
+def sync_command():
+    """The base's -Syu, preceded under the slim policy by a NoExtract line in pacman.conf's [options]"""
+    if SIZE_POLICY != "slim":
+        return ["pacman", "-Syu", "--noconfirm"]
+    return ["/bin/bash", "-c", f"sed -i '/^\\[options\\]/a NoExtract = {' '.join(noextract_rules())}' /etc/pacman.conf && pacman -Syu --noconfirm"]
+
+def build_base_image():
+    """Pull upstream Arch, run a full -Syu once and commit the result as the shared base"""
+    main_logger.info(f"Pulling {UPSTREAM_IMAGE} for {BASE_IMAGE}")
+    previous = load_base_state()
+    with span(None, "pull", "base"):
+        podman.pull(UPSTREAM_IMAGE, f"Pull {UPSTREAM_IMAGE} for {BASE_IMAGE}")
+    upstream_id = image_id(UPSTREAM_IMAGE)
+    # The upstream image carries no isolator label: the ones a newer pull untagged are remembered for gc
+    superseded = previous.get("superseded_upstream", [])
+    if previous.get("upstream_id") not in (None, upstream_id, *superseded):
+        superseded = superseded + [previous["upstream_id"]]
+    # A build container left behind by an interrupted refresh would block --name
+    podman.remove_container(BUILD_CONTAINER, f"Remove stale {BASE_IMAGE} build container")
+    main_logger.info(f"Syncing {BASE_IMAGE}")
+    try:
+        with span(None, "sync", "base") as fields:
+            tracker = PacmanProgress(None, None)
+            run_streaming(["podman", "run", "--name", BUILD_CONTAINER, *pacman_cache_args(), UPSTREAM_IMAGE, *sync_command()], f"Sync {BASE_IMAGE}", check=True, on_line=tracker)
+            fields.update(tracker.fields())
+        podman.commit(BUILD_CONTAINER, BASE_IMAGE, f"Commit {BASE_IMAGE}")
+    finally:
+        podman.remove_container(BUILD_CONTAINER, f"Remove {BASE_IMAGE} build container")
+    base_id = image_id(BASE_IMAGE)
+    # Dropping the aur_base record invalidates the AUR toolchain layer built on the old base
+    save_base_state({"image_id": base_id, "synced_at": time.time(), "size_policy": SIZE_POLICY,
+                     "upstream_id": upstream_id, "superseded_upstream": superseded})
+    main_logger.info(f"{BASE_IMAGE} synced as {base_id}")
+    return base_id
+
+def ensure_base_image(force=False):
+    """Return True when the base had to be (re)built, False when the cached one was reused.
+    Under the base lock, so concurrent isolators build it once and the others reuse it."""
+    with base_lock():
+        if not force and base_is_fresh():
+            main_logger.info(f"Reusing {BASE_IMAGE} synced {base_age_hours():.1f}h ago")
+            return False
+        build_base_image()
+        return True
+
+def sync_db_args(read_only=True):
+    """Bind the host-side sync database shared by update checks over the container one"""
+    ensure_dirs(SYNC_DB)
+    return ["-v", f"{SYNC_DB}:/var/lib/pacman/sync{':ro' if read_only else ''}"]
+
+def sync_database():
+    """Refresh the shared sync database once, so per-image checks need no network"""
+    main_logger.info("Syncing shared pacman database")
+    with base_lock():
+        run_streaming(["podman", "run", "--rm", *sync_db_args(read_only=False), BASE_IMAGE, "pacman", "-Sy"], "Sync shared pacman database", check=True)
+
+def resolve_repo_targets(pkgs):
+    """Split pkgs into targets the repos can install (packages, groups, provides) and the rest,
+    with a single pacman -Sp against the shared sync database; returns (repo, missing)"""
+    proc = run_streaming(["podman", "run", "--rm", *sync_db_args(), BASE_IMAGE, "pacman", "-Sp", "--print-format", "%n", *pkgs], "Resolve install targets")
+    # pacman reports every missing target before giving up, so one run finds them all
+    missing = set(TARGET_NOT_FOUND.findall(proc.stderr.decode()))
+    if proc.returncode != 0 and not missing:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
+    return [pkg for pkg in pkgs if pkg not in missing], [pkg for pkg in pkgs if pkg in missing]
+
+def aur_base_is_valid(state=None):
+    state = state if state is not None else load_base_state()
+    aur_base = state.get("aur_base", {})
+    return bool(aur_base) and aur_base.get("base_id") == state.get("image_id") and image_exists(AUR_BASE_IMAGE)
+
+def build_aur_base_image():
+    """Commit git, base-devel, the builder user and yay on top of the current base"""
+    main_logger.info(f"Building {AUR_BASE_IMAGE}")
+    podman.remove_container(AUR_BUILD_CONTAINER, f"Remove stale {AUR_BASE_IMAGE} build container")
+    try:
+        run_streaming(["podman", "run", "--name", AUR_BUILD_CONTAINER, *pacman_cache_args(), BASE_IMAGE, "/bin/bash", "-c", AUR_TOOLCHAIN_SCRIPT], f"Install AUR toolchain for {AUR_BASE_IMAGE}", check=True)
+        podman.commit(AUR_BUILD_CONTAINER, AUR_BASE_IMAGE, f"Commit {AUR_BASE_IMAGE}")
+    finally:
+        podman.remove_container(AUR_BUILD_CONTAINER, f"Remove {AUR_BASE_IMAGE} build container")
+    state = load_base_state()
+    state["aur_base"] = {"image_id": image_id(AUR_BASE_IMAGE), "base_id": state.get("image_id"), "built_at": time.time()}
+    save_base_state(state)
+    main_logger.info(f"{AUR_BASE_IMAGE} built on {state.get('image_id')}")
+
+def ensure_aur_base_image(force=False):
+    """Return True when the AUR toolchain layer had to be (re)built"""
+    with base_lock():
+        ensure_base_image()
+        if not force and aur_base_is_valid():
+            main_logger.info(f"Reusing {AUR_BASE_IMAGE}")
+            return False
+        build_aur_base_image()
+        return True
+
+def refresh_base():
+    try:
+        with spinner(f"Synchronizacja obrazu {BASE_IMAGE}..."):
+            ensure_base_image(force=True)
+            if image_exists(AUR_BASE_IMAGE):
+                ensure_aur_base_image(force=True)
+        panel(f"[bold green]Sukces: Obraz {BASE_IMAGE} został odświeżony![/bold green]")
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"Base refresh error: {str(e)}")
+        log_subprocess_output(subprocess_logger, e, "Base refresh error")
+        error_panel(f"Błąd podczas odświeżania {BASE_IMAGE}: {str(e)}", "Sprawdź połączenie sieciowe i konfigurację podman.")
+        if os.environ.get("DEBUG"):
+            say("Szczegóły błędu:", "red")
+            say(traceback.format_exc(), "red")
+        sys.exit(1)
+
+def show_base_status():
+    state = load_base_state()
+    age = base_age_hours(state)
+    if age is None or not base_image_exists():
+        panel(
+            f"[bold yellow]Obraz {BASE_IMAGE} nie został jeszcze zbudowany[/bold yellow]\n"
+            f"[yellow]Zostanie utworzony przy następnej instalacji lub przez 'isolator base refresh'.[/yellow]",
+            "yellow",
+            "on #2d2a1a"
+        )
+    else:
+        state_style = "green" if age < BASE_MAX_AGE_HOURS else "yellow"
+        panel(
+            f"[bold cyan]Obraz: {BASE_IMAGE}[/bold cyan]\n"
+            f"[white]ID: {state.get('image_id', '?')[:12]}[/white]\n"
+            f"[{state_style}]Ostatnia synchronizacja: {age:.1f}h temu (limit {BASE_MAX_AGE_HOURS}h)[/{state_style}]\n"
+            f"[white]Warstwa AUR ({AUR_BASE_IMAGE}): {'aktualna' if aur_base_is_valid(state) else 'zostanie zbudowana przy instalacji z AUR'}[/white]",
+            "cyan"
+        )
@@ -0,0 +1,60 @@
+"""Per-operation overhead of the podman REST client versus forking a process per step.
+
+Runs create/commit/rm cycles against bench/fake_podman_api.py over a Unix socket and compares
+them with spawning /bin/true, the floor for every CLI call (before podman's own startup).
+Prints JSON.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        # isolator writes its state and logs under $HOME
+        os.environ["HOME"] = tmp
+        os.environ["ISOLATOR_PODMAN_SOCKET"] = os.path.join(tmp, "podman.sock")
+        sys.path.insert(0, str(ROOT))
+        sys.path.insert(0, str(ROOT / "bench"))
+        from fake_podman_api import FakePodmanServer
+        import podman_api
+        server = FakePodmanServer(os.environ["ISOLATOR_PODMAN_SOCKET"], args.latency_ms / 1000)
+        server.start()
+        assert podman_api.client() is not None, "fake podman socket not reachable"
+        timings = {"create": [], "commit": [], "rm": []}
+        for i in range(args.iterations):
+            started = time.perf_counter()
+            cid = podman_api.create(["-it", "--label", "isolator.temp=1", "-v", f"{tmp}:/var/cache/pacman/pkg", "isolator-base", "/bin/bash"], "bench create")
+            timings["create"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            podman_api.commit(cid, f"bench-{i}", "bench commit")
+            timings["commit"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            podman_api.remove_container(cid, "bench rm", check=True)
+            timings["rm"].append(time.perf_counter() - started)
+        spawn = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            subprocess.run(["true"], check=True)
+            spawn.append(time.perf_counter() - started)
+        server.shutdown()
+    result = {
+        "iterations": args.iterations,
+        "latency_ms": args.latency_ms,
+        "api_ms": {op: 1000 * sum(values) / len(values) for op, values in timings.items()},
+        "process_spawn_ms": 1000 * sum(spawn) / len(spawn),
+    }
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
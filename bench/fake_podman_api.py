@@ -0,0 +1,137 @@
+"""In-memory stand-in for the podman system service's libpod REST API on a Unix socket.
+
+Only the endpoints isolator uses are implemented. Every request sleeps for the configured
+latency first, so client-side overhead can be measured without a real podman:
+
+    python bench/fake_podman_api.py /tmp/fake-podman.sock --latency-ms 0
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+PREFIX = re.compile(r"^/v[\d.]+/libpod")
+
+class FakePodmanState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.images = {}
+        self.containers = {}
+
+    def new_id(self):
+        return f"{next(self.ids):064x}"
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        return "fake-podman"
+
+    def reply(self, status, body=None):
+        data = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, records):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for record in records:
+            chunk = json.dumps(record).encode() + b"\n"
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def handle_request(self, method):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        path = PREFIX.sub("", url.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        state = self.server.state
+        with state.lock:
+            if path == "/_ping":
+                return self.reply(200)
+            if method == "POST" and path == "/images/pull":
+                image_id = state.images.setdefault(query["reference"], state.new_id())
+                return self.stream([{"stream": f"Pulling {query['reference']}\n"}, {"images": [image_id], "id": image_id}])
+            if method == "POST" and path == "/containers/create":
+                cid = state.new_id()
+                state.containers[cid] = {"image": body["image"], "labels": body.get("labels", {}), "name": body.get("name")}
+                return self.reply(201, {"Id": cid, "Warnings": []})
+            if method == "POST" and path == "/commit":
+                if query["container"] not in state.containers:
+                    return self.reply(404, {"cause": "no such container"})
+                image_id = state.new_id()
+                state.images[query["repo"]] = image_id
+                return self.reply(201, {"Id": image_id})
+            if method == "GET" and path == "/images/json":
+                return self.reply(200, [{"Id": image_id, "Names": [name], "Size": 0, "Created": 0} for name, image_id in state.images.items()])
+            if method == "GET" and path == "/containers/json":
+                return self.reply(200, [{"Id": cid, "State": "exited", "Labels": info["labels"]} for cid, info in state.containers.items()])
+            match = re.match(r"^/(images|containers)/(.+?)(/exists|/json)?$", path)
+            if match:
+                kind, name, action = match.group(1), unquote(match.group(2)), match.group(3)
+                store = state.images if kind == "images" else state.containers
+                if name not in store:
+                    return self.reply(404, {"cause": f"no such {kind[:-1]}"})
+                if method == "DELETE":
+                    del store[name]
+                    return self.reply(200, [{"Id": name}])
+                if action == "/exists":
+                    return self.reply(204)
+                if action == "/json":
+                    return self.reply(200, {"Id": store[name], "Digest": f"sha256:{store[name]}", "Size": 0})
+        self.reply(404, {"cause": f"unsupported endpoint {method} {path}"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+class FakePodmanServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, latency=0.0):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, Handler)
+        self.latency = latency
+        self.state = FakePodmanState()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("socket")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakePodmanServer(args.socket, args.latency_ms / 1000)
+    try:
+        server.serve_forever()
+    finally:
+        os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
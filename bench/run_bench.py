@@ -0,0 +1,162 @@
+"""End-to-end benchmark of isolator's own overhead against the fake podman shim.
+
+For every store size (installed packages) a fresh $HOME is seeded with that many packages,
+then install, run, remove, update-all and list are timed through isolator.main() in a child
+process with bench/fake_podman first on PATH. Reported per command: wall time, podman
+spawns, peak RSS of the child; plus interpreter startup and `import isolator` time.
+
+    python bench/run_bench.py --sizes 1 10 100 1000 --output bench-results.json
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH = ROOT / "bench"
+MAIN = "import sys; sys.argv = ['isolator'] + sys.argv[1:]; import isolator; isolator.main()"
+
+def bench_env(home, latency_ms):
+    env = dict(os.environ)
+    shim = home / "shim"
+    shim.mkdir()
+    (shim / "podman").symlink_to(BENCH / "fake_podman")
+    for tool in ("xhost",):
+        (shim / tool).write_text("#!/bin/sh\nexit 0\n")
+        (shim / tool).chmod(0o755)
+    env.update({
+        "HOME": str(home),
+        "PATH": f"{shim}{os.pathsep}{env.get('PATH', '')}",
+        "PYTHONPATH": str(ROOT),
+        "FAKE_PODMAN_STATE": str(home / "fake-podman.json"),
+        "FAKE_PODMAN_CALLS": str(home / "fake-podman.calls"),
+        "FAKE_PODMAN_LATENCY": str(latency_ms),
+        # Spawn counting needs every operation on the CLI
+        "ISOLATOR_PODMAN_API": "0",
+        "TERM": "dumb",
+    })
+    return env
+
+def seed(home, count):
+    """Write a store with count installed packages directly, without running installs"""
+    isolator_dir = home / ".isolator-apps"
+    images, bin_dir = isolator_dir / "images", isolator_dir / "bin"
+    desktop_dir = home / ".local/share/applications"
+    for directory in (images, bin_dir, desktop_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    fake = {"counter": 0, "images": {}, "containers": {}}
+
+    def add_image(name):
+        fake["counter"] += 1
+        image_id = f"{fake['counter']:064x}"
+        fake["images"][name] = {"Id": image_id, "Digest": f"sha256:{image_id}", "Size": 50 * 1024 * 1024, "Created": int(now)}
+        return image_id
+
+    base_id = add_image("isolator-base")
+    add_image("archlinux")
+    packages = {}
+    for i in range(count):
+        pkg = f"app{i:04d}"
+        image = str(images / f"{pkg}.img")
+        image_id = add_image(image)
+        run_script, desktop_file = bin_dir / f"run-{pkg}.sh", desktop_dir / f"{pkg}.desktop"
+        run_script.write_text(f"#!/bin/sh\npodman run --rm {image} {pkg}\n")
+        run_script.chmod(0o755)
+        desktop_file.write_text(f"[Desktop Entry]\nName={pkg}\nExec={run_script}\n")
+        packages[pkg] = {
+            "image": image, "image_id": image_id, "digest": f"sha256:{image_id}", "size": 50 * 1024 * 1024,
+            "version": "1.0-1", "source": "repo", "base_id": base_id, "created_at": now, "updated_at": now,
+            "artifacts": {"run_script": str(run_script), "desktop_file": str(desktop_file)},
+        }
+    (isolator_dir / "manifest.json").write_text(json.dumps({"version": 1, "packages": packages}))
+    # The policy the child's config.SIZE_POLICY will read; with another one the base counts as stale and is rebuilt
+    size_policy = os.environ.get("ISOLATOR_SIZE_POLICY", "slim")
+    (isolator_dir / "base.json").write_text(json.dumps({"image_id": base_id, "synced_at": now, "size_policy": size_policy}))
+    (home / "fake-podman.json").write_text(json.dumps(fake))
+
+def measure(args, env):
+    calls = Path(env["FAKE_PODMAN_CALLS"])
+    calls.write_text("")
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", MAIN, *args], env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    stderr = proc.stderr.read().decode(errors="ignore")
+    proc.stderr.close()
+    return {
+        "wall_s": round(wall, 4),
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "podman_spawns": len(calls.read_text().splitlines()),
+        "peak_rss_kb": usage.ru_maxrss,
+        **({"stderr_tail": stderr[-500:]} if os.waitstatus_to_exitcode(status) else {}),
+    }
+
+def startup(env, repeat):
+    bare = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+        bare.append(time.perf_counter() - started)
+    imported = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import isolator"], env=env, check=True)
+        imported.append(time.perf_counter() - started)
+    importtime = subprocess.run([sys.executable, "-X", "importtime", "-c", "import isolator"], env=env,
+                                capture_output=True, text=True).stderr
+    # Cumulative microseconds of the top-level `isolator` import
+    match = re.search(r"\|\s*(\d+)\s*\|\s*isolator\s*$", importtime, re.M)
+    return {
+        "python_startup_s": round(min(bare), 4),
+        "import_isolator_s": round(min(imported) - min(bare), 4),
+        "importtime_isolator_us": int(match.group(1)) if match else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "-C", str(ROOT), "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fake podman latency per call")
+    parser.add_argument("--repeat", type=int, default=5, help="runs for the startup measurement")
+    parser.add_argument("--output", help="write JSON here as well as to stdout")
+    args = parser.parse_args()
+    results = {"revision": git_revision(), "python": sys.version.split()[0], "latency_ms": args.latency_ms, "sizes": {}}
+    for size in args.sizes:
+        home = Path(tempfile.mkdtemp(prefix=f"isolator-bench-{size}-"))
+        try:
+            env = bench_env(home, args.latency_ms)
+            seed(home, size)
+            if "startup" not in results:
+                results["startup"] = startup(env, args.repeat)
+            target = "app0000"
+            commands = {
+                "list": ["list"],
+                "run": ["run", target],
+                "install": ["install", "benchpkg"],
+                "update-all": ["update-all"],
+                "remove": ["remove", target],
+            }
+            results["sizes"][str(size)] = {name: measure(argv, env) for name, argv in commands.items()}
+            print(f"{size} packages: " + ", ".join(f"{name} {data['wall_s']}s" for name, data in results["sizes"][str(size)].items()), file=sys.stderr)
+        finally:
+            shutil.rmtree(home, ignore_errors=True)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
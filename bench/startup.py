@@ -0,0 +1,115 @@
+"""Startup benchmark: how long `isolator run` takes before the app's run script gets control.
+
+The seeded package's run script writes a nanosecond timestamp the moment it starts, so the
+measured overhead covers interpreter startup, imports, the manifest lookup and the spawn, and
+nothing of the app itself. Measured with stdout on a pipe (plain mode) and on a pty (rich),
+next to `help`, `list` and bare interpreter startup.
+
+    python bench/startup.py --repeat 20 --output startup.json
+"""
+import argparse
+import json
+import os
+import pty
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from run_bench import MAIN, bench_env, git_revision, seed
+
+def spawn(argv, env, tty):
+    """Run isolator.main() with argv and wait; returns the time the process was started"""
+    args = [sys.executable, "-c", MAIN, *argv]
+    if not tty:
+        started = time.time_ns()
+        subprocess.run(args, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return started
+    leader, follower = pty.openpty()
+    started = time.time_ns()
+    proc = subprocess.Popen(args, env=env, stdin=subprocess.DEVNULL, stdout=follower, stderr=follower)
+    os.close(follower)
+    # Drain the pty so rich never blocks on a full buffer
+    while True:
+        try:
+            if not os.read(leader, 65536):
+                break
+        except OSError:
+            break
+    proc.wait()
+    os.close(leader)
+    return started
+
+def summary(samples):
+    return {"min_ms": round(min(samples), 2), "median_ms": round(statistics.median(samples), 2), "max_ms": round(max(samples), 2)}
+
+def run_overhead(env, stamp, tty, repeat):
+    samples = []
+    for _ in range(repeat):
+        stamp.unlink(missing_ok=True)
+        started = spawn(["run", "app0000"], env, tty)
+        samples.append((int(stamp.read_text()) - started) / 1e6)
+    return summary(samples)
+
+def wall(argv, env, tty, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        spawn(argv, env, tty)
+        samples.append((time.perf_counter() - started) * 1000)
+    return summary(samples)
+
+def run_imports(env):
+    """Self time of the heaviest modules imported by `isolator run`, in ms"""
+    code = "import sys; sys.argv = ['isolator', 'run', 'app0000']; import isolator; isolator.main()"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)", line)
+        if match:
+            modules.append((match.group(3), int(match.group(1))))
+    return {
+        "total_ms": round(sum(us for _, us in modules) / 1000, 2),
+        "rich_loaded": any(name.startswith("rich") for name, _ in modules),
+        "heaviest": [{"module": name, "self_ms": round(us / 1000, 2)} for name, us in sorted(modules, key=lambda item: -item[1])[:10]],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="write JSON here as well as to stdout")
+    args = parser.parse_args()
+    home = Path(tempfile.mkdtemp(prefix="isolator-startup-"))
+    try:
+        env = bench_env(home, 0)
+        seed(home, 10)
+        stamp = home / "started.ns"
+        run_script = home / ".isolator-apps/bin/run-app0000.sh"
+        run_script.write_text(f"#!/bin/sh\ndate +%s%N > {stamp}\n")
+        results = {"revision": git_revision(), "python": sys.version.split()[0], "repeat": args.repeat}
+        bare = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "pass"], env=env)
+            bare.append((time.perf_counter() - started) * 1000)
+        results["python_startup"] = summary(bare)
+        for mode, tty in (("plain", False), ("tty", True)):
+            results[mode] = {
+                "run_overhead": run_overhead(env, stamp, tty, args.repeat),
+                "help": wall(["help"], env, tty, args.repeat),
+                "list": wall(["list"], env, tty, args.repeat),
+            }
+        results["run_imports"] = run_imports(env)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
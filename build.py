@@ -0,0 +1,84 @@
+import re
+import threading
+from config import BASE_IMAGE, BUILD_DIR, SIZE_POLICY
+from logger import main_logger
+from base import AUR_TOOLCHAIN_STEPS, SLIM_CLEANUP, load_base_state
+from cache import pacman_cache_args, aur_cache_args, aur_build_prefix, AUR_CACHE_MOUNT
+from runner import run_streaming
+
+BUILD_STEP = re.compile(r"^STEP (\d+)/(\d+): (.*)$")
+
+def containerfile(pkg, aur=False):
+    """Deterministic Containerfile for pkg. Every package shares the same prefix (the synced base,
+    then for AUR the toolchain steps) so podman's layer cache is hit for all but the last step."""
+    # Cleanup runs in the same RUN as the install, otherwise the files would stay in that step's layer
+    cleanup = f" && {SLIM_CLEANUP}" if SIZE_POLICY == "slim" else ""
+    lines = [
+        f"# Generated by isolator for {pkg}",
+        f"FROM {BASE_IMAGE}",
+    ]
+    if aur:
+        lines += [f"RUN {step}" for step in AUR_TOOLCHAIN_STEPS]
+        lines.append(
+            f'RUN su builder -c "yay -S --noconfirm {pkg}"'
+            # Stored under the base's prefix, like install_from_aur does, so the container engine can reuse it
+            f" && for f in /home/builder/.cache/yay/*/*.pkg.tar.zst; do cp \"$f\" {AUR_CACHE_MOUNT}/{aur_build_prefix(load_base_state().get('image_id'))}$(basename \"$f\"); done"
+            " && rm -rf /home/builder/.cache/yay" + cleanup
+        )
+    else:
+        lines.append(f"RUN pacman -S --noconfirm {pkg}{cleanup}")
+    return "\n".join(lines) + "\n"
+
+def write_containerfile(pkg, aur=False):
+    context = BUILD_DIR / pkg
+    context.mkdir(parents=True, exist_ok=True)
+    path = context / "Containerfile"
+    text = containerfile(pkg, aur)
+    # Leave an unchanged file alone so its mtime does not suggest a rebuild
+    if not path.exists() or path.read_text() != text:
+        path.write_text(text)
+    return path
+
+def build_image(pkg, image, aur=False, on_line=None, squash=False):
+    """podman build with layer caching; package caches are bind-mounted and never end up in layers.
+    squash merges the steps above the base into one layer, which still shares the base."""
+    path = write_containerfile(pkg, aur)
+    main_logger.info(f"Building {image} from {path}")
+    args = ["podman", "build", "--layers", "--pull=never", *pacman_cache_args()]
+    if aur:
+        args += aur_cache_args()
+    if squash:
+        args.append("--squash")
+    args += ["-t", str(image), "-f", str(path), str(path.parent)]
+    return run_streaming(args, f"Build {pkg}", on_line=on_line)
+
+class BuildProgress:
+    """Maps podman build's STEP n/m lines onto the install stages of a progress display"""
+
+    def __init__(self, progress, task, stages):
+        self.progress = progress
+        self.task = task
+        self.stages = stages
+        self.lock = threading.Lock()
+        self.cache_hits = 0
+        self.total = None
+
+    def stage_for(self, instruction):
+        if instruction.startswith("FROM"):
+            return self.stages["base"]
+        if any(step in instruction for step in AUR_TOOLCHAIN_STEPS):
+            return self.stages["toolchain"]
+        return self.stages["install"]
+
+    def __call__(self, line, stream):
+        with self.lock:
+            match = BUILD_STEP.match(line)
+            if match:
+                step = int(match.group(1))
+                # One extra unit for the final COMMIT
+                self.total = int(match.group(2)) + 1
+                self.progress.update(self.task, total=self.total, completed=step - 1, description=self.stage_for(match.group(3)))
+            elif line.startswith("--> Using cache"):
+                self.cache_hits += 1
+            elif line.startswith("COMMIT") and self.total:
+                self.progress.update(self.task, completed=self.total - 1, description=self.stages["commit"])
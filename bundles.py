@@ -0,0 +1,269 @@
+import os
+import re
+import subprocess
+import sys
+import time
+import traceback
+from contextlib import ExitStack
+from pathlib import Path
+from config import BASE_IMAGE, PLAIN
+from logger import main_logger, subprocess_logger, log_subprocess_output
+from base import ensure_base_image, sync_database, sync_db_args, load_base_state
+from cache import pacman_cache_args
+from runner import run_streaming, PacmanProgress
+import podman_api as podman
+from stages import Stage, StageProgress, run_stages
+from index import classify, refresh_index
+from warm import stop_warm
+from detached import stop_detached
+from manifest import (
+    get_package, get_bundle, bundles, bundle_key, bundle_image, update_bundle, drop_bundle, drop_package, inspect_image
+)
+from checkpoint import temp_container_args
+from container import write_launchers, slim_container, installed_versions
+from locks import package_lock
+from ui import say, panel, error_panel, progress as progress_display
+
+# A bundle is one image holding several repo packages, each with its own run script and .desktop
+# entry launching its own binary. Members are added and removed with one pacman transaction and one
+# commit on top of the bundle image; update-all and update-daemon upgrade the bundle once for all of them.
+BUNDLE_NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9._+-]*$")
+
+def fail(message, hint):
+    error_panel(message, hint)
+    sys.exit(1)
+
+def run_bundle_flow(name, flow, title):
+    """Run flow with the usual progress display; exits with an error panel when a podman step fails"""
+    try:
+        with progress_display() as progress:
+            main_task = progress.add_task(title, total=sum(stage.weight for stage in flow))
+            for stage in flow:
+                stage.progress = progress
+            run_stages(flow, StageProgress(progress, main_task), flow="bundle", package=bundle_key(name))
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"Bundle {name} error: {str(e)}")
+        log_subprocess_output(subprocess_logger, e, f"Error changing bundle {name}")
+        if os.environ.get("DEBUG"):
+            say("Szczegóły błędu:", "red")
+            say(traceback.format_exc(), "red")
+        fail(f"Błąd podczas zmiany zestawu {name}: {str(e)}", "Obraz zestawu pozostał bez zmian. Sprawdź nazwy pakietów i konfigurację podman.")
+
+def temp_container_stages(name, state, source_image, command, context, extra, after, mounts=()):
+    """Container from source_image once stage after is done, command in it, commit onto the bundle image,
+    container removed. extra(cid) runs after command, before the commit; mounts are extra `podman create`
+    flags. The bundle image only moves at the commit."""
+    image_name = bundle_image(name)
+
+    def create_container(stage):
+        state["cid"] = podman.create(["-it", *temp_container_args(bundle_key(name)), *pacman_cache_args(), *mounts, str(source_image), "/bin/bash"], f"Create container for bundle {name}")
+        state["cleanup"] = stage.scheduler.add_cleanup(lambda: podman.remove_container(state["cid"], f"Cleanup container for bundle {name}"))
+
+    def run_command(stage):
+        tracker = PacmanProgress(stage.progress, stage.task)
+        run_streaming(["podman", "start", "-ai", state["cid"], "-c", command], context, check=True, on_line=tracker)
+        stage.fields.update(tracker.fields())
+        extra(state["cid"])
+
+    def commit_image(stage):
+        slim_container(state["cid"], name)
+        podman.commit(state["cid"], image_name, f"Commit bundle {name}")
+
+    def remove_container(stage):
+        podman.remove_container(state["cid"], f"Remove container for bundle {name}", force=False, check=True)
+        stage.scheduler.discard_cleanup(state["cleanup"])
+
+    return [
+        Stage("container", create_container, [after], 10, f"Tworzenie kontenera dla zestawu {name}", "blue"),
+        Stage("pacman", run_command, ["container"], 40, context, "cyan"),
+        Stage("commit", commit_image, ["pacman"], 20, "Zapisywanie obrazu zestawu", "green"),
+        Stage("cleanup", remove_container, ["commit"], 10, "Usuwanie tymczasowego kontenera", "yellow"),
+    ]
+
+def check_repo_packages(pkgs):
+    """Bundles are built with pacman alone: AUR packages (or unknown names) are refused up front"""
+    refresh_index()
+    found = classify(pkgs)
+    if found is None:
+        return
+    outside = [pkg for pkg in pkgs if found.get(pkg) != "repo"]
+    if outside:
+        main_logger.error(f"Not bundling packages outside the repositories: {', '.join(outside)}")
+        fail(f"Błąd: {', '.join(outside)} nie ma w repozytoriach", "Zestawy przyjmują tylko pakiety z repozytoriów; pakiety z AUR instaluj przez 'isolator install'.")
+
+def retire_standalone(pkg, record):
+    """A package moved into a bundle no longer needs its own image"""
+    stop_detached(pkg)
+    stop_warm(pkg)
+    podman.remove_image(record["image"], f"Remove standalone image of {pkg}", check=False)
+    main_logger.info(f"Moved {pkg} into a bundle, removed its own image")
+
+def add_to_bundle(name, pkgs):
+    """Install pkgs into bundle name, creating it on first use. Packages installed on their own move
+    into the bundle and their separate images are removed."""
+    if not BUNDLE_NAME_PATTERN.match(name):
+        fail(f"Błąd: Nieprawidłowa nazwa zestawu: {name}", "Użyj małych liter, cyfr oraz . _ + -")
+    with ExitStack() as held:
+        # Package locks before the bundle's, the order remove_package takes them in
+        for pkg in sorted(set(pkgs)):
+            held.enter_context(package_lock(pkg))
+        held.enter_context(package_lock(bundle_key(name)))
+        bundle = get_bundle(name, reload=True)
+        members = set(bundle["packages"]) if bundle else set()
+        new = [pkg for pkg in dict.fromkeys(pkgs) if pkg not in members]
+        if not new:
+            say(f"Wszystkie podane pakiety są już w zestawie {name}\n", "bold yellow")
+            return
+        elsewhere = {pkg: get_package(pkg)["bundle"] for pkg in new if (get_package(pkg) or {}).get("bundle")}
+        if elsewhere:
+            fail(f"Błąd: {', '.join(f'{pkg} (zestaw {other})' for pkg, other in elsewhere.items())} należy już do innego zestawu",
+                 "Najpierw usuń pakiet z tamtego zestawu: 'isolator bundle remove <zestaw> <pakiet>'.")
+        check_repo_packages(new)
+        standalone = {pkg: get_package(pkg) for pkg in new if get_package(pkg)}
+        image_name = bundle_image(name)
+        state = {}
+        versions = {}
+        artifacts = {}
+
+        def prepare_base(stage):
+            if bundle:
+                sync_database()
+            else:
+                stage.fields["base_reused"] = not ensure_base_image()
+
+        def write_all_launchers(stage):
+            for pkg in new:
+                artifacts[pkg] = write_launchers(pkg, image_name)
+
+        def register(stage):
+            own = {pkg: {"version": versions.get(pkg)} for pkg in members | set(new)}
+            for pkg in new:
+                own[pkg].update(artifacts=artifacts[pkg], source="repo")
+            update_bundle(name, members=own, image=str(image_name), source="repo", squashed=False,
+                          base_id=bundle["base_id"] if bundle else load_base_state().get("image_id"), **inspect_image(image_name))
+            for pkg, record in standalone.items():
+                retire_standalone(pkg, record)
+
+        # Installed explicitly, so removing another member never takes them along as its dependencies.
+        # An existing bundle's own sync database may be weeks old: it gets the shared one and is upgraded
+        # in the same transaction, as update_image does.
+        command = f"pacman -{'Su' if bundle else 'S'} --noconfirm --asexplicit {' '.join(new)}"
+        flow = [Stage("base", prepare_base, [], 10, "Synchronizacja bazy pakietów" if bundle else "Przygotowanie obrazu bazowego", "purple")]
+        flow += temp_container_stages(name, state, image_name if bundle else BASE_IMAGE, command, f"Instalowanie {', '.join(new)}",
+                                      lambda cid: versions.update(installed_versions(cid, sorted(members | set(new)))), "base",
+                                      mounts=sync_db_args() if bundle else ())
+        flow += [
+            Stage("launchers", write_all_launchers, ["commit"], 10, "Tworzenie skryptów i plików .desktop", "magenta"),
+            Stage("register", register, ["cleanup", "launchers"], 0, "Rejestrowanie zestawu", "white"),
+        ]
+        run_bundle_flow(name, flow, f"Zestaw {name}: dodawanie {', '.join(new)}")
+    panel(
+        f"[bold green]Sukces: Zestaw {name} zawiera teraz: {', '.join(sorted(members | set(new)))}[/bold green]\n"
+        f"[green]Dodano: {', '.join(new)}{f' (przeniesione z osobnych obrazów: {len(standalone)})' if standalone else ''}[/green]"
+    )
+    main_logger.info(f"Added {', '.join(new)} to bundle {name}")
+
+def remove_launchers(pkg):
+    record = get_package(pkg) or {}
+    for path in (record.get("artifacts") or {}).values():
+        Path(path).unlink(missing_ok=True)
+
+def remove_from_bundle(name, pkgs):
+    """Take pkgs out of bundle name with one pacman transaction and commit; the last one out removes the bundle"""
+    with ExitStack() as held:
+        for pkg in sorted(set(pkgs)):
+            held.enter_context(package_lock(pkg))
+        held.enter_context(package_lock(bundle_key(name)))
+        bundle = get_bundle(name, reload=True)
+        if bundle is None:
+            fail(f"Błąd: Zestaw {name} nie istnieje!", "Użyj 'isolator bundle list' aby zobaczyć zestawy.")
+        missing = [pkg for pkg in pkgs if pkg not in bundle["packages"]]
+        if missing:
+            fail(f"Błąd: {', '.join(missing)} nie należy do zestawu {name}", f"Zestaw zawiera: {', '.join(bundle['packages'])}")
+        gone = list(dict.fromkeys(pkgs))
+        remaining = [pkg for pkg in bundle["packages"] if pkg not in gone]
+        state = {}
+        versions = {}
+
+        def stop_running(stage):
+            for pkg in gone if remaining else bundle["packages"]:
+                stop_detached(pkg)
+                stop_warm(pkg)
+
+        def unregister(stage):
+            for pkg in gone:
+                remove_launchers(pkg)
+                drop_package(pkg)
+            if remaining:
+                update_bundle(name, members={pkg: {"version": versions.get(pkg)} for pkg in remaining}, **inspect_image(bundle["image"]))
+            else:
+                drop_bundle(name)
+
+        def remove_image(stage):
+            podman.remove_image(bundle["image"], f"Remove image of bundle {name}")
+
+        flow = [Stage("stop", stop_running, [], 10, "Zatrzymywanie uruchomionych kontenerów", "blue")]
+        if remaining:
+            # Marked as dependencies, the removed packages go together with whatever only they needed,
+            # while anything another member still depends on stays
+            command = (f"pacman -D --asdeps {' '.join(gone)} && orphans=$(pacman -Qdtq); "
+                       f"[ -z \"$orphans\" ] || pacman -Rns --noconfirm $orphans")
+            flow += temp_container_stages(name, state, bundle["image"], command, f"Usuwanie {', '.join(gone)}",
+                                          lambda cid: versions.update(installed_versions(cid, remaining)), "stop")
+            flow.append(Stage("unregister", unregister, ["cleanup"], 0, "Wyrejestrowanie pakietów", "white"))
+        else:
+            flow += [
+                Stage("image", remove_image, ["stop"], 40, "Usuwanie obrazu zestawu", "red"),
+                Stage("unregister", unregister, ["image"], 0, "Wyrejestrowanie zestawu", "white"),
+            ]
+        run_bundle_flow(name, flow, f"Zestaw {name}: usuwanie {', '.join(gone)}")
+    panel(
+        f"[bold green]Sukces: Usunięto {', '.join(gone)} z zestawu {name}![/bold green]"
+        + (f"\n[green]Pozostają w nim: {', '.join(remaining)}[/green]" if remaining else f"\n[green]Zestaw {name} był pusty i został usunięty[/green]")
+    )
+    main_logger.info(f"Removed {', '.join(gone)} from bundle {name}{'' if remaining else ', bundle deleted'}")
+
+def list_bundles():
+    records = bundles()
+    if not records:
+        if PLAIN:
+            print("Brak zestawów")
+        else:
+            panel(
+                "[bold yellow]Brak zestawów[/bold yellow]\n"
+                "[yellow]Utwórz zestaw przez 'isolator bundle add <zestaw> <pakiet>...'.[/yellow]",
+                "yellow",
+                "on #2d2a1a"
+            )
+        main_logger.info("No bundles found")
+        return
+    rows = []
+    for name in sorted(records):
+        record = records[name]
+        size = f"{record['size'] / 1024 / 1024:.0f} MB" if record.get("size") else "?"
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["updated_at"])) if record.get("updated_at") else "?"
+        rows.append((name, ", ".join(record.get("packages", [])), size, updated))
+    if PLAIN:
+        # Tab separated: bundle, comma separated packages, size, last change
+        print("\n".join("\t".join(row) for row in rows))
+        main_logger.info("Listed bundles")
+        return
+    from rich.table import Table
+    from rich.box import ROUNDED
+    table = Table(
+        title="Zestawy",
+        title_style="bold color(201) on #1a2525",
+        show_lines=True,
+        border_style="bright_cyan",
+        header_style="bold white on #2d3b3b",
+        padding=(0, 1),
+        box=ROUNDED
+    )
+    table.add_column("Zestaw", style="cyan", width=20)
+    table.add_column("Pakiety", style="white")
+    table.add_column("Rozmiar", style="yellow", justify="right")
+    table.add_column("Zaktualizowano", style="green")
+    for row in rows:
+        table.add_row(*row)
+    panel(table, "cyan")
+    main_logger.info("Listed bundles")
@@ -0,0 +1,77 @@
+import re
+import time
+from config import PKG_CACHE, AUR_CACHE, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS, ensure_dirs
+from logger import main_logger
+from ui import panel
+
+PACMAN_CACHE_MOUNT = "/var/cache/pacman/pkg"
+AUR_CACHE_MOUNT = "/var/cache/isolator-aur"
+
+def pacman_cache_args():
+    """podman create/run arguments that bind the host package cache over the container one.
+    Bind mounts are never part of `podman commit`, so downloaded packages stay out of app images."""
+    ensure_dirs(PKG_CACHE)
+    return ["-v", f"{PKG_CACHE}:{PACMAN_CACHE_MOUNT}"]
+
+def aur_cache_args():
+    ensure_dirs(AUR_CACHE)
+    return ["-v", f"{AUR_CACHE}:{AUR_CACHE_MOUNT}"]
+
+def aur_build_prefix(base_id):
+    """Cached AUR builds are named <prefix><package file>, tying each to the base it was built on"""
+    return f"{(base_id or 'nobase')[:12]}-"
+
+def cached_aur_artifact(pkg, base_id, version=None):
+    """Newest built package for pkg in the host AUR cache, as a path inside the build container.
+    Only builds made on base_id count, and when version (pkgver-pkgrel, as the AUR lists it) is
+    known only a build of that version does."""
+    # <prefix><name>-<pkgver>-<pkgrel>-<arch>.pkg.tar.zst; name itself may contain dashes
+    pattern = re.compile(rf"^{re.escape(aur_build_prefix(base_id) + pkg)}-([^-]+-[^-]+)-[^-]+\.pkg\.tar\.zst$")
+    matches = [path for path in AUR_CACHE.glob("*.pkg.tar.zst")
+               if (match := pattern.match(path.name)) and (version is None or match.group(1) == version)]
+    if not matches:
+        return None
+    newest = max(matches, key=lambda path: path.stat().st_mtime)
+    return f"{AUR_CACHE_MOUNT}/{newest.name}"
+
+def cache_entries():
+    entries = []
+    for cache_dir in [PKG_CACHE, AUR_CACHE]:
+        for path in cache_dir.glob("*"):
+            if path.is_file():
+                st = path.stat()
+                entries.append((path, st.st_size, st.st_mtime))
+    return entries
+
+def prune_cache(max_size_mb=CACHE_MAX_SIZE_MB, max_age_days=CACHE_MAX_AGE_DAYS):
+    """Drop pacman and AUR cache files older than max_age_days, then the oldest ones until the cache fits in max_size_mb.
+    Returns (files removed, bytes freed, bytes kept)."""
+    now = time.time()
+    max_size = max_size_mb * 1024 * 1024
+    removed, freed = 0, 0
+    kept = []
+    for path, size, mtime in cache_entries():
+        # Leftover partial downloads are never reused by pacman
+        if path.name.endswith(".part") or now - mtime > max_age_days * 86400:
+            path.unlink(missing_ok=True)
+            removed += 1
+            freed += size
+        else:
+            kept.append((path, size, mtime))
+    kept.sort(key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in kept)
+    while kept and total > max_size:
+        path, size, _ = kept.pop(0)
+        path.unlink(missing_ok=True)
+        removed += 1
+        freed += size
+        total -= size
+    main_logger.info(f"Pruned package cache: {removed} files, {freed} bytes freed, {total} bytes kept")
+    return removed, freed, total
+
+def prune_cache_command(max_size_mb=CACHE_MAX_SIZE_MB, max_age_days=CACHE_MAX_AGE_DAYS):
+    removed, freed, kept = prune_cache(max_size_mb, max_age_days)
+    panel(
+        f"[bold green]Usunięto {removed} plików z pamięci podręcznej pakietów ({freed / 1024 / 1024:.1f} MB)[/bold green]\n"
+        f"[green]Pozostało: {kept / 1024 / 1024:.1f} MB (limit {max_size_mb} MB, {max_age_days} dni)[/green]"
+    )
@@ -0,0 +1,82 @@
+import json
+from config import STATE_DIR
+from logger import main_logger
+import podman_api as podman
+from locks import locked_elsewhere
+from utils import atomic_write_json
+
+TEMP_LABEL = "isolator.temp"
+STAGES = ["base", "container", "install", "commit", "cleanup", "launchers"]
+
+def state_file(pkg):
+    return STATE_DIR / f"{pkg}.json"
+
+def load_checkpoint(pkg):
+    try:
+        with open(state_file(pkg)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def mark_done(pkg, state, stage, **fields):
+    """Record stage (and whatever it produced, e.g. the container ID) as completed for pkg"""
+    state.update(fields)
+    if stage not in state.setdefault("completed", []):
+        state["completed"].append(stage)
+    atomic_write_json(state_file(pkg), state)
+    main_logger.info(f"Checkpoint {stage} reached for {pkg}")
+
+def is_done(state, stage):
+    return stage in state.get("completed", [])
+
+def clear_checkpoint(pkg):
+    state_file(pkg).unlink(missing_ok=True)
+
+def pending_installs():
+    return sorted(path.stem for path in STATE_DIR.glob("*.json"))
+
+def temp_container_args(pkg):
+    """Labels that let stale build and update containers be found later"""
+    return ["--label", f"{TEMP_LABEL}=1", "--label", f"isolator.pkg={pkg}"]
+
+def container_exists(cid):
+    return podman.container_exists(cid)
+
+def image_exists(image):
+    return podman.image_exists(image)
+
+def validate_checkpoint(pkg, image_name):
+    """Drop completed stages whose products vanished (container pruned, image removed)"""
+    state = load_checkpoint(pkg)
+    if not state:
+        return state
+    completed = state.get("completed", [])
+    if "commit" in completed and not image_exists(image_name):
+        completed = [stage for stage in completed if stage in ("base", "container", "install")]
+    if "container" in completed and "cleanup" not in completed and not container_exists(state.get("cid", "")):
+        if "commit" in completed:
+            # The image is already saved; the container being gone only means cleanup has nothing left to do
+            completed = completed + ["cleanup"]
+        else:
+            completed = [stage for stage in completed if stage == "base"]
+    if completed != state.get("completed", []):
+        main_logger.info(f"Checkpoint for {pkg} partially invalid, resuming after {completed[-1] if completed else 'nothing'}")
+        state["completed"] = completed
+    return state
+
+def stale_containers():
+    """Labelled temporary containers that no checkpoint refers to and that are not running,
+    leaving out those of packages another isolator process is working on"""
+    referenced = {load_checkpoint(pkg).get("cid") for pkg in pending_installs()}
+    return [info["Id"] for info in podman.list_containers(f"{TEMP_LABEL}=1")
+            if info["State"].strip().lower() != "running" and info["Id"] not in referenced
+            and not locked_elsewhere(f"pkg-{info['Labels'].get('isolator.pkg')}")]
+
+def cleanup_stale_containers():
+    removed = []
+    for cid in stale_containers():
+        podman.remove_container(cid, "Remove stale temporary container")
+        removed.append(cid)
+    if removed:
+        main_logger.info(f"Removed {len(removed)} stale temporary containers")
+    return removed
@@ -1,5 +1,6 @@
+import os
+import sys
 from pathlib import Path
-from rich.console import Console
 
 # Configuration
 ISOLATOR_DIR = Path.home() / ".isolator-apps"
@@ -7,13 +8,76 @@ IMAGES = ISOLATOR_DIR / "images"
 CONTAINERS = ISOLATOR_DIR / "containers"
 BIN = ISOLATOR_DIR / "bin"
 LOGS = ISOLATOR_DIR / "logs"
+RUNTIME = ISOLATOR_DIR / "runtime"
+LOCK_DIR = ISOLATOR_DIR / "locks"
 DESKTOP_DIR = Path.home() / ".local/share/applications"
 MAIN_LOG_FILE = LOGS / "isolator-main.log"
 SUBPROCESS_LOG_FILE = LOGS / "isolator-subprocess.log"
+LAUNCH_TIMINGS_FILE = LOGS / "launch-timings.jsonl"
+SPANS_FILE = LOGS / "spans.jsonl"  # Per-stage timings, aggregated by `isolator stats`
 MAX_LOG_SIZE = 5 * 1024 * 1024  # 5MB
 BACKUP_COUNT = 3  # Keep 3 backup logs
-console = Console()
+LOG_FORMAT = os.environ.get("ISOLATOR_LOG_FORMAT", "text")  # "text" or "json" (one object per line)
+TRANSCRIPTS_DIR = LOGS / "transcripts"  # Full subprocess output, one directory per run
+TRANSCRIPT_RUNS = 20  # Transcript directories kept
+TRANSCRIPT_MAX_AGE = 2 * 24 * 3600  # Seconds after which a run directory is pruned even if its run looks alive
+LOG_INLINE_LIMIT = 4096  # Characters of subprocess output inlined into a log record
+UPSTREAM_IMAGE = "archlinux"
+BASE_IMAGE = "isolator-base"
+AUR_BASE_IMAGE = "isolator-aur-base"
+BASE_STATE_FILE = ISOLATOR_DIR / "base.json"
+MANIFEST_FILE = ISOLATOR_DIR / "manifest.json"
+BUILD_DIR = ISOLATOR_DIR / "build"
+STATE_DIR = ISOLATOR_DIR / "state"
+BUILD_ENGINE = os.environ.get("ISOLATOR_ENGINE", "container")  # "container" (create/commit) or "containerfile" (podman build)
+BASE_MAX_AGE_HOURS = int(os.environ.get("ISOLATOR_BASE_MAX_AGE", "24"))  # Refresh synced base after this many hours
+CACHE_DIR = ISOLATOR_DIR / "cache"
+PKG_CACHE = CACHE_DIR / "pacman"
+AUR_CACHE = CACHE_DIR / "aur"
+SYNC_DB = CACHE_DIR / "sync"
+INDEX_FILE = CACHE_DIR / "index.sqlite"  # Host-side package index built from SYNC_DB (and the AUR list)
+AUR_METADATA_FILE = CACHE_DIR / "aur-packages.json.gz"
+AUR_METADATA_URL = "https://aur.archlinux.org/packages-meta-v1.json.gz"
+SIZE_POLICY = os.environ.get("ISOLATOR_SIZE_POLICY", "slim")  # "slim" (no docs, man pages, foreign locales) or "full"
+KEEP_LOCALES = os.environ.get("ISOLATOR_KEEP_LOCALES", "pl en").split()  # Locale prefixes a slim base still extracts
+SQUASH = os.environ.get("ISOLATOR_SQUASH", "0") == "1"  # Default for `install --squash`
+LAYERS_FILE = CACHE_DIR / "layers.json"  # Layer list and size per image ID, for `isolator du`
+CACHE_MAX_SIZE_MB = 4096  # Default `cache prune` size limit
+CACHE_MAX_AGE_DAYS = 30  # Default `cache prune` age limit
+WARM_IDLE_TIMEOUT_MINUTES = int(os.environ.get("ISOLATOR_WARM_IDLE", "30"))  # Stop warm containers unused this long
+WARM_PAUSE = os.environ.get("ISOLATOR_WARM_PAUSE", "1") != "0"  # Freeze warm containers between launches
+APP_LOGS = LOGS / "apps"  # Output of detached launches, one directory per package
+APP_LOG_MAX_SIZE = 1024 * 1024  # Bytes; conmon truncates a detached app's log file beyond this
+APP_LOG_RUNS = 5  # Log files kept per package, newest first
+UPDATE_INTERVAL_HOURS = int(os.environ.get("ISOLATOR_UPDATE_INTERVAL", "24"))  # Between background update passes
+UPDATE_CPUS = float(os.environ.get("ISOLATOR_UPDATE_CPUS", "1"))  # CPUs a background update may use
+UPDATE_STATE_FILE = ISOLATOR_DIR / "updates.json"  # Outcome of the last background update pass
+SYSTEMD_USER_DIR = Path(os.environ.get("XDG_CONFIG_HOME", Path.home() / ".config")) / "systemd" / "user"
+LOCK_TIMEOUT = int(os.environ.get("ISOLATOR_LOCK_TIMEOUT", "600"))  # Seconds to wait for a package or the base held by another isolator
+STORE_LOCK_TIMEOUT = 30  # Seconds to wait for the manifest; it is only held for a read-modify-write
+# Plain text output without rich: forced with ISOLATOR_PLAIN=1, automatic when stdout is not a terminal
+PLAIN = os.environ.get("ISOLATOR_PLAIN", "0" if sys.stdout.isatty() else "1") == "1"
 
-# Ensure directories exist
-for directory in [IMAGES, CONTAINERS, BIN, LOGS, DESKTOP_DIR]:
-    directory.mkdir(parents=True, exist_ok=True)
+class LazyConsole:
+    """Stands in for rich's Console, which is only imported once something is printed through it"""
+    _console = None
+
+    def __getattr__(self, name):
+        if LazyConsole._console is None:
+            from rich.console import Console
+            LazyConsole._console = Console()
+        return getattr(LazyConsole._console, name)
+
+    # rich's Live enters the console as a context manager, which bypasses __getattr__
+    def __enter__(self):
+        return self.__getattr__("__enter__")()
+
+    def __exit__(self, *exc_info):
+        return self.__getattr__("__exit__")(*exc_info)
+
+console = LazyConsole()
+
+def ensure_dirs(*directories):
+    """Directories are created by the code that writes into them, not at import"""
+    for directory in directories:
+        directory.mkdir(parents=True, exist_ok=True)
@@ -1,121 +1,79 @@
 import os
 import subprocess
+import sys
 from pathlib import Path
-from rich.progress import (
-    Progress, BarColumn, TextColumn, TimeRemainingColumn,
-    TimeElapsedColumn, SpinnerColumn, MofNCompleteColumn
-)
-from rich.panel import Panel
-from rich.box import ROUNDED
-import time
 import traceback
-from config import IMAGES, BIN, DESKTOP_DIR, console
+from contextlib import ExitStack
+from config import IMAGES, BASE_IMAGE, AUR_BASE_IMAGE, BUILD_ENGINE, SIZE_POLICY, SQUASH, ensure_dirs
 from logger import main_logger, subprocess_logger, log_subprocess_output
+from base import ensure_base_image, ensure_aur_base_image, sync_database, sync_db_args, load_base_state, resolve_repo_targets, SLIM_CLEANUP
+from cache import pacman_cache_args, aur_cache_args, cached_aur_artifact, aur_build_prefix, AUR_CACHE_MOUNT
+from runner import run_streaming, PacmanProgress
+import podman_api as podman
+from build import build_image, BuildProgress
+from stages import Stage, StageProgress, run_stages
+from telemetry import span
+from index import classify, aur_version, refresh_index
+from warm import stop_warm
+from detached import stop_detached
+from manifest import (
+    packages, get_package, update_package, drop_package, inspect_image, default_artifacts, reindex,
+    update_units, get_unit, update_bundle, BUNDLE_PREFIX
+)
+from checkpoint import (
+    load_checkpoint, mark_done, is_done, clear_checkpoint, pending_installs,
+    temp_container_args, validate_checkpoint, cleanup_stale_containers
+)
 from utils import choose_yes_no
+from locks import package_lock, LockTimeout
+from ui import say, panel, error_panel, spinner, progress as progress_display, show_results
 
-def create_container_image(pkg):
-    image_name = IMAGES / f"{pkg}.img"
-    run_script = BIN / f"run-{pkg}.sh"
-    try:
-        with Progress(
-            SpinnerColumn(spinner_name="dots"),
-            TextColumn("[progress.description]{task.description}", style="bold cyan"),
-            BarColumn(bar_width=None, style="blue", complete_style="green"),
-            MofNCompleteColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.1f}%", style="white"),
-            TimeElapsedColumn(),
-            TimeRemainingColumn(),
-            console=console
-        ) as progress:
-            main_task = progress.add_task(f"Instalacja {pkg}", total=100)
-            stages = [
-                ("Pobieranie obrazu bazowego", 10, "purple"),
-                ("Tworzenie kontenera bazowego", 10, "blue"),
-                ("Instalowanie pakietu", 40, "cyan"),
-                ("Zapisywanie obrazu", 20, "green"),
-                ("Usuwanie tymczasowego kontenera", 10, "yellow"),
-                ("Tworzenie skryptu i pliku .desktop", 10, "magenta")
-            ]
-            current_advance = 0
-            # Download base image
-            subtask = progress.add_task(stages[0][0], total=None, style=stages[0][2])
-            console.print(f"[bold {stages[0][2]}]>> {stages[0][0]}...[/bold {stages[0][2]}]")
-            main_logger.info(f"Starting base image pull for {pkg}")
-            proc = subprocess.run(["podman", "pull", "archlinux"], capture_output=True, check=True)
-            log_subprocess_output(subprocess_logger, proc, f"Pull archlinux for {pkg}")
-            progress.update(main_task, advance=stages[0][1])
-            current_advance += stages[0][1]
-            progress.remove_task(subtask)
-            time.sleep(0.2)
-            # Create base container
-            subtask = progress.add_task(stages[1][0], total=None, style=stages[1][2])
-            console.print(f"[bold {stages[1][2]}]>> {stages[1][0]} dla {pkg}...[/bold {stages[1][2]}]")
-            main_logger.info(f"Creating base container for {pkg}")
-            output = subprocess.check_output(["podman", "create", "-it", "archlinux", "/bin/bash"], stderr=subprocess.STDOUT)
-            cid = output.decode().strip()
-            subprocess_logger.info(f"Create container for {pkg} stdout: {output.decode()}")
-            progress.update(main_task, advance=stages[1][1])
-            current_advance += stages[1][1]
-            progress.remove_task(subtask)
-            time.sleep(0.2)
-            # Install package
-            subtask = progress.add_task(stages[2][0], total=None, style=stages[2][2])
-            console.print(f"[bold {stages[2][2]}]>> {stages[2][0]} {pkg}...[/bold {stages[2][2]}]")
-            main_logger.info(f"Installing package {pkg}")
-            proc = subprocess.run(["podman", "start", "-ai", cid, "-c", "pacman -Syu --noconfirm"], capture_output=True, check=True)
-            log_subprocess_output(subprocess_logger, proc, f"Update system for {pkg}")
-            proc = subprocess.run(["podman", "start", "-ai", cid, "-c", f"pacman -S --noconfirm {pkg}"], capture_output=True, check=False)
-            log_subprocess_output(subprocess_logger, proc, f"Install pacman for {pkg}")
-            if proc.returncode != 0:
-                error_output = proc.stderr.decode()
-                if "target not found" in error_output.lower():
-                    if choose_yes_no():
-                        main_logger.info(f"Installing AUR dependencies for {pkg}")
-                        proc = subprocess.run(["podman", "start", "-ai", cid, "-c", "pacman -S --needed --noconfirm git base-devel sudo"], capture_output=True, check=True)
-                        log_subprocess_output(subprocess_logger, proc, f"Install AUR deps for {pkg}")
-                        main_logger.info(f"Creating builder user for AUR installation of {pkg}")
-                        proc = subprocess.run(["podman", "start", "-ai", cid, "-c", "useradd -m builder && echo 'builder ALL=(ALL) NOPASSWD:ALL' >> /etc/sudoers"], capture_output=True, check=True)
-                        log_subprocess_output(subprocess_logger, proc, f"Create builder user for {pkg}")
-                        main_logger.info(f"Installing yay-bin for {pkg}")
-                        proc = subprocess.run(["podman", "start", "-ai", cid, "-c", 'su builder -c "git clone https://aur.archlinux.org/yay-bin.git ~/yay-bin && cd ~/yay-bin && makepkg -si --noconfirm"'], capture_output=True, check=True)
-                        log_subprocess_output(subprocess_logger, proc, f"Install yay for {pkg}")
-                        main_logger.info(f"Installing {pkg} with yay")
-                        proc = subprocess.run(["podman", "start", "-ai", cid, "-c", f'su builder -c "yay -S --noconfirm {pkg}"'], capture_output=True, check=True)
-                        log_subprocess_output(subprocess_logger, proc, f"Install with yay for {pkg}")
-                    else:
-                        raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
-                else:
-                    raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
-            progress.update(main_task, advance=stages[2][1])
-            current_advance += stages[2][1]
-            progress.remove_task(subtask)
-            time.sleep(0.2)
-            # Commit image
-            subtask = progress.add_task(stages[3][0], total=None, style=stages[3][2])
-            console.print(f"[bold {stages[3][2]}]>> {stages[3][0]}...[/bold {stages[3][2]}]")
-            main_logger.info(f"Committing image for {pkg}")
-            proc = subprocess.run(["podman", "commit", cid, str(image_name)], capture_output=True, check=True)
-            log_subprocess_output(subprocess_logger, proc, f"Commit image for {pkg}")
-            progress.update(main_task, advance=stages[3][1])
-            current_advance += stages[3][1]
-            progress.remove_task(subtask)
-            time.sleep(0.2)
-            # Remove temporary container
-            subtask = progress.add_task(stages[4][0], total=None, style=stages[4][2])
-            console.print(f"[bold {stages[4][2]}]>> {stages[4][0]}...[/bold {stages[4][2]}]")
-            main_logger.info(f"Removing temporary container for {pkg}")
-            proc = subprocess.run(["podman", "rm", cid], capture_output=True, check=True)
-            log_subprocess_output(subprocess_logger, proc, f"Remove container for {pkg}")
-            progress.update(main_task, advance=stages[4][1])
-            current_advance += stages[4][1]
-            progress.remove_task(subtask)
-            time.sleep(0.2)
-            # Create run script and .desktop file
-            subtask = progress.add_task(stages[5][0], total=None, style=stages[5][2])
-            console.print(f"[bold {stages[5][2]}]>> {stages[5][0]}...[/bold {stages[5][2]}]")
-            main_logger.info(f"Creating run script and .desktop file for {pkg}")
-            with open(run_script, "w") as f:
-                f.write(f"""#!/bin/bash
+def installed_versions(cid, pkgs):
+    """{pkg: version} for those of pkgs installed in cid, from one pacman -Q"""
+    proc = run_streaming(["podman", "start", "-ai", cid, "-c", f"pacman -Q {' '.join(pkgs)}"], f"Query versions of {', '.join(pkgs)}")
+    # pacman -Q still lists the installed ones when some are missing
+    found = dict(line.split()[:2] for line in proc.stdout.decode().splitlines() if len(line.split()) >= 2)
+    return {pkg: found[pkg] for pkg in pkgs if pkg in found}
+
+def installed_version(cid, pkg):
+    return installed_versions(cid, [pkg]).get(pkg)
+
+def install_from_aur(pkg, cid, progress, subtask, check=False, fields=None):
+    """Install pkg in a container created from the AUR toolchain image, preferring a cached build.
+    Whether the cached build was used and pacman's download counts go into fields."""
+    fields = fields if fields is not None else {}
+    # A build made on an older base, or of an older AUR version, is not reused
+    base_id = load_base_state().get("image_id")
+    prefix = aur_build_prefix(base_id)
+    artifact = cached_aur_artifact(pkg, base_id, aur_version(pkg))
+    if artifact:
+        main_logger.info(f"Installing cached AUR build {artifact} for {pkg}")
+        tracker = PacmanProgress(progress, subtask)
+        proc = run_streaming(["podman", "start", "-ai", cid, "-c", f"pacman -U --noconfirm {artifact}"], f"Install cached AUR build for {pkg}", check=False, on_line=tracker)
+        if proc.returncode == 0:
+            fields.update(tracker.fields(), aur_cache_hit=True)
+            return proc
+    main_logger.info(f"Installing {pkg} with yay")
+    fields["aur_cache_hit"] = False
+    tracker = PacmanProgress(progress, subtask)
+    proc = run_streaming(["podman", "start", "-ai", cid, "-c", f'su builder -c "yay -S --noconfirm {pkg}"'], f"Install with yay for {pkg}", check=check, on_line=tracker)
+    fields.update(tracker.fields())
+    if proc.returncode == 0:
+        run_streaming(["podman", "start", "-ai", cid, "-c", f"for f in /home/builder/.cache/yay/*/*.pkg.tar.zst; do cp \"$f\" {AUR_CACHE_MOUNT}/{prefix}$(basename \"$f\"); done && rm -rf /home/builder/.cache/yay"], f"Store AUR build for {pkg}")
+    return proc
+
+def slim_container(cid, name):
+    """Under the slim size policy, drop the caches and temp files an install left in cid before it is committed"""
+    if SIZE_POLICY == "slim":
+        run_streaming(["podman", "start", "-ai", cid, "-c", SLIM_CLEANUP], f"Slim down {name}", check=True)
+
+def write_launchers(pkg, image_name):
+    """Write the run script and .desktop entry for pkg; returns their paths for the manifest"""
+    artifacts = default_artifacts(pkg)
+    run_script = Path(artifacts["run_script"])
+    ensure_dirs(run_script.parent, Path(artifacts["desktop_file"]).parent)
+    with open(run_script, "w") as f:
+        f.write(f"""#!/bin/bash
 xhost +SI:localuser:$USER
 podman run --rm -it \\
     -e DISPLAY=$DISPLAY \\
@@ -124,279 +82,584 @@ podman run --rm -it \\
     --device /dev/dri \\
     {image_name} {pkg}
 """)
-            run_script.chmod(0o755)
-            with open(DESKTOP_DIR / f"{pkg}.desktop", "w") as f:
-                f.write(f"""[Desktop Entry]
+    run_script.chmod(0o755)
+    with open(artifacts["desktop_file"], "w") as f:
+        f.write(f"""[Desktop Entry]
 Name={pkg}
 Exec={run_script}
 Icon={pkg}
 Type=Application
 Terminal=false
 """)
-            progress.update(main_task, advance=stages[5][1])
-            current_advance += stages[5][1]
-            progress.remove_task(subtask)
-            if current_advance < 100:
-                progress.update(main_task, advance=100 - current_advance)
-        console.print(Panel(
-            f"[bold green]Sukces: Pakiet {pkg} został zainstalowany i skonfigurowany![/bold green]",
-            border_style="green",
-            padding=(1, 2),
-            style="on #1a2525",
-            box=ROUNDED
-        ))
-        console.print("\n")
+    return artifacts
+
+def image_version(image, pkg):
+    proc = run_streaming(["podman", "run", "--rm", str(image), "pacman", "-Q", pkg], f"Query version of {pkg}")
+    fields = proc.stdout.decode().split()
+    return fields[1] if proc.returncode == 0 and len(fields) >= 2 else None
+
+def create_with_containerfile(pkg, squash=SQUASH, batch=False):
+    """Install pkg through a generated Containerfile and `podman build`, reusing cached layers.
+    In a batch the outcome is returned as ("installed", source) or ("failed", error) for the
+    summary instead of ending in a panel."""
+    image_name = IMAGES / f"{pkg}.img"
+    try:
+        with progress_display(percentage=False) as progress:
+            main_task = progress.add_task(f"Instalacja {pkg}", total=None)
+            say(">> Przygotowanie obrazu bazowego...", "bold purple")
+            main_logger.info(f"Ensuring {BASE_IMAGE} is fresh for {pkg}")
+            with span(pkg, "base", "install") as fields:
+                fields["base_reused"] = not ensure_base_image()
+            base_id = load_base_state().get("image_id")
+            stages = {
+                "base": "Przygotowanie obrazu bazowego",
+                "toolchain": "Przygotowanie narzędzi AUR",
+                "install": f"Instalowanie pakietu {pkg}",
+                "commit": "Zapisywanie obrazu",
+            }
+            say(f">> Budowanie obrazu {pkg} (Containerfile)...", "bold cyan")
+            source = "repo"
+            with span(pkg, "build", "install") as fields:
+                tracker = BuildProgress(progress, main_task, stages)
+                proc = build_image(pkg, image_name, on_line=tracker, squash=squash)
+                if proc.returncode != 0:
+                    if "target not found" not in proc.stderr.decode().lower() + proc.stdout.decode().lower():
+                        raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
+                    if not choose_yes_no():
+                        raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
+                    source = "aur"
+                    tracker = BuildProgress(progress, main_task, stages)
+                    proc = build_image(pkg, image_name, aur=True, on_line=tracker, squash=squash)
+                    if proc.returncode != 0:
+                        raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
+                # Every step except the FROM can come from the layer cache
+                fields.update(source=source, layer_cache_hits=tracker.cache_hits, layer_steps=(tracker.total or 2) - 2)
+            main_logger.info(f"Built {pkg} with {tracker.cache_hits} cached build steps")
+            progress.update(main_task, description="Tworzenie skryptu i pliku .desktop")
+            say(">> Tworzenie skryptu i pliku .desktop...", "bold magenta")
+            artifacts = write_launchers(pkg, image_name)
+            update_package(pkg, image=str(image_name), version=image_version(image_name, pkg), source=source,
+                           engine="containerfile", artifacts=artifacts, base_id=base_id, squashed=squash, **inspect_image(image_name))
+            progress.update(main_task, total=1, completed=1, description=f"Instalacja {pkg}")
+        if batch:
+            main_logger.info(f"Successfully installed and configured {pkg}")
+            return "installed", source
+        panel(f"[bold green]Sukces: Pakiet {pkg} został zainstalowany i skonfigurowany![/bold green]")
         main_logger.info(f"Successfully installed and configured {pkg}")
     except subprocess.CalledProcessError as e:
         main_logger.error(f"CalledProcessError during {pkg} installation: {str(e)}")
         log_subprocess_output(subprocess_logger, e, f"Error installing {pkg}")
+        if batch:
+            return "failed", e
         error_msg = f"[bold red]Błąd podczas instalacji {pkg}: {str(e)}[/bold red]\n"
         error_msg += "[red]Sprawdź, czy pakiet istnieje i czy podman jest prawidłowo skonfigurowany.[/red]"
-        console.print(Panel(error_msg, border_style="red", padding=(1, 2), style="on #2d1a1a", box=ROUNDED))
+        panel(error_msg, "red", "on #2d1a1a", gap=False)
         if os.environ.get("DEBUG"):
-            console.print("[red]Szczegóły błędu:[/red]")
-            console.print(traceback.format_exc())
+            say("Szczegóły błędu:", "red")
+            say(traceback.format_exc(), "red")
         sys.exit(1)
 
-def run_container(pkg):
-    run_script = BIN / f"run-{pkg}.sh"
-    if not run_script.exists():
-        console.print(Panel(
-            f"[bold red]Błąd: Pakiet {pkg} nie jest zainstalowany![/bold red]\n"
-            f"[red]Użyj 'isolator install {pkg}' aby zainstalować pakiet.[/red]",
-            border_style="red",
-            padding=(1, 2),
-            style="on #2d1a1a",
-            box=ROUNDED
-        ))
-        main_logger.error(f"Attempted to run non-existent package {pkg}")
+def install_flow(pkg, state, image_name, source=None, base_ready=False, squash=SQUASH):
+    """Stages that install pkg into its own image, skipping those its checkpoint records as done.
+    Stage names carry the package so several flows can share one scheduler.
+    With source known up front ("repo" / "aur", as in a batch) nothing is asked: a missing target
+    is an error. Otherwise a package missing from the repos falls back to the AUR after asking.
+    base_ready means the caller already ensured the shared base image.
+    squash commits a single-layer image that no longer shares the base; a resumed install keeps
+    the choice recorded in its checkpoint."""
+    if base_ready and not is_done(state, "base"):
+        mark_done(pkg, state, "base", base_id=load_base_state().get("image_id"))
+
+    def prepare_base(stage):
+        main_logger.info(f"Ensuring {BASE_IMAGE} is fresh for {pkg}")
+        stage.fields["base_reused"] = not ensure_base_image()
+        mark_done(pkg, state, "base", base_id=load_base_state().get("image_id"))
+
+    def create_base_container(stage):
+        if (source or state.get("source")) == "aur":
+            main_logger.info(f"Creating AUR container for {pkg}")
+            cid = podman.create(["-it", *temp_container_args(pkg), *pacman_cache_args(), *aur_cache_args(), AUR_BASE_IMAGE, "/bin/bash"], f"Create AUR container for {pkg}")
+            mark_done(pkg, state, "container", cid=cid, source="aur", squash=squash)
+            return
+        main_logger.info(f"Creating base container for {pkg}")
+        cid = podman.create(["-it", *temp_container_args(pkg), *pacman_cache_args(), BASE_IMAGE, "/bin/bash"], f"Create container for {pkg}")
+        mark_done(pkg, state, "container", cid=cid, source="repo", squash=squash)
+
+    def install_package(stage):
+        main_logger.info(f"Installing package {pkg}")
+        cid = state["cid"]
+        if state.get("source") == "aur":
+            proc = install_from_aur(pkg, cid, stage.progress, stage.task, fields=stage.fields)
+        else:
+            tracker = PacmanProgress(stage.progress, stage.task)
+            proc = run_streaming(["podman", "start", "-ai", cid, "-c", f"pacman -S --noconfirm {pkg}"], f"Install pacman for {pkg}", check=False, on_line=tracker)
+            stage.fields.update(tracker.fields())
+        if proc.returncode != 0:
+            if source is not None or "target not found" not in proc.stderr.decode().lower():
+                raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
+            if not choose_yes_no():
+                # Not a transient failure, nothing worth resuming
+                podman.remove_container(cid, f"Remove container for {pkg}")
+                clear_checkpoint(pkg)
+                raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
+            # The repo-only container is of no use for AUR; start over from the toolchain layer
+            podman.remove_container(cid, f"Remove container for {pkg}")
+            main_logger.info(f"Preparing {AUR_BASE_IMAGE} for {pkg}")
+            ensure_aur_base_image()
+            cid = podman.create(["-it", *temp_container_args(pkg), *pacman_cache_args(), *aur_cache_args(), AUR_BASE_IMAGE, "/bin/bash"], f"Create AUR container for {pkg}")
+            mark_done(pkg, state, "container", cid=cid, source="aur", squash=state.get("squash", squash))
+            install_from_aur(pkg, cid, stage.progress, stage.task, check=True, fields=stage.fields)
+        mark_done(pkg, state, "install", version=installed_version(cid, pkg))
+
+    def commit_image(stage):
+        main_logger.info(f"Committing image for {pkg}")
+        slim_container(state["cid"], pkg)
+        podman.commit(state["cid"], image_name, f"Commit image for {pkg}", squash=state.get("squash", squash))
+        mark_done(pkg, state, "commit")
+
+    def remove_temp_container(stage):
+        main_logger.info(f"Removing temporary container for {pkg}")
+        podman.remove_container(state["cid"], f"Remove container for {pkg}", check=True)
+        mark_done(pkg, state, "cleanup")
+
+    def create_launchers(stage):
+        main_logger.info(f"Creating run script and .desktop file for {pkg}")
+        artifacts = write_launchers(pkg, image_name)
+        # Launchers for an image that never got committed would point at nothing
+        stage.cleanup = stage.scheduler.add_cleanup(lambda: [Path(path).unlink(missing_ok=True) for path in artifacts.values()])
+        return artifacts
+
+    def register_package(stage):
+        update_package(pkg, image=str(image_name), version=state.get("version"), source=state.get("source", "repo"),
+                       artifacts=launchers.result, base_id=state.get("base_id"), squashed=state.get("squash", squash), **inspect_image(image_name))
+        clear_checkpoint(pkg)
+        # Installed for good: a failure elsewhere in the same scheduler must not take the launchers
+        stage.scheduler.discard_cleanup(launchers.cleanup)
+
+    # The launchers only need the image name, so they are written while the image is committed
+    launchers = Stage(f"launchers:{pkg}", create_launchers, [f"install:{pkg}"], 10, "Tworzenie skryptu i pliku .desktop", "magenta", package=pkg)
+    return [
+        Stage(f"base:{pkg}", prepare_base, [], 10, "Przygotowanie obrazu bazowego", "purple", skip=is_done(state, "base"), package=pkg),
+        Stage(f"container:{pkg}", create_base_container, [f"base:{pkg}"], 10, f"Tworzenie kontenera bazowego dla {pkg}", "blue", skip=is_done(state, "container"), package=pkg),
+        Stage(f"install:{pkg}", install_package, [f"container:{pkg}"], 40, f"Instalowanie pakietu {pkg}", "cyan", skip=is_done(state, "install"), package=pkg),
+        Stage(f"commit:{pkg}", commit_image, [f"install:{pkg}"], 20, "Zapisywanie obrazu", "green", skip=is_done(state, "commit"), package=pkg),
+        Stage(f"cleanup:{pkg}", remove_temp_container, [f"commit:{pkg}"], 10, "Usuwanie tymczasowego kontenera", "yellow", skip=is_done(state, "cleanup"), package=pkg),
+        launchers,
+        Stage(f"register:{pkg}", register_package, [f"cleanup:{pkg}", f"launchers:{pkg}"], 0, "Rejestrowanie pakietu", "white", package=pkg),
+    ]
+
+def resolve_source(pkg):
+    """repo / aur for pkg from the host-side index before anything is created, asking before the AUR.
+    None without an index, or when the index does not know pkg (its AUR list is only as fresh as the
+    last 'index update --aur'): the install then finds out from pacman, as it always did.
+    Exits when the AUR is declined."""
+    with span(pkg, "resolve", "install") as fields:
+        refresh_index()
+        found = classify([pkg])
+        fields["indexed"] = found is not None
+    if found is None or found[pkg] is None:
+        return None
+    if found[pkg] == "repo":
+        return "repo"
+    if not choose_yes_no():
+        main_logger.info(f"AUR install of {pkg} declined")
         sys.exit(1)
-    console.print(f"[bold cyan]Uruchamianie {pkg}...[/bold cyan]")
-    main_logger.info(f"Starting container for {pkg}")
-    try:
-        with Progress(
-            SpinnerColumn(spinner_name="runner"),
-            TextColumn("[progress.description]{task.description}", style="cyan"),
-            console=console
-        ) as progress:
-            task = progress.add_task("Uruchamianie...", total=None)
-            proc = subprocess.run([str(run_script)], capture_output=True, check=True)
-            log_subprocess_output(subprocess_logger, proc, f"Run container {pkg}")
-            progress.remove_task(task)
-        console.print(f"[bold green]{pkg} uruchomiony pomyślnie[/bold green]\n")
-        main_logger.info(f"Successfully ran {pkg}")
-    except subprocess.CalledProcessError as e:
-        main_logger.error(f"Run error for {pkg}: {str(e)}")
-        log_subprocess_output(subprocess_logger, e, f"Error running {pkg}")
-        console.print(Panel(
-            f"[bold red]Błąd podczas uruchamiania {pkg}: {str(e)}[/bold red]\n"
-            f"[red]Sprawdź konfigurację podman i uprawnienia.[/red]",
-            border_style="red",
-            padding=(1, 2),
-            style="on #2d1a1a",
-            box=ROUNDED
-        ))
-        if os.environ.get("DEBUG"):
-            console.print("[red]Szczegóły błędu:[/red]")
-            console.print(traceback.format_exc())
+    return "aur"
+
+def create_container_image(pkg, engine=BUILD_ENGINE, squash=SQUASH):
+    with package_lock(pkg):
+        bundle = (get_package(pkg, reload=True) or {}).get("bundle")
+        if bundle:
+            say(f"{pkg} jest w zestawie {bundle}; aktualizuje go 'isolator update-all', a 'isolator bundle remove {bundle} {pkg}' go z niego usuwa\n", "bold yellow")
+            main_logger.info(f"Not installing {pkg} on its own: it is in bundle {bundle}")
+            return
+        if engine == "containerfile":
+            return create_with_containerfile(pkg, squash)
+        image_name = IMAGES / f"{pkg}.img"
+        cleanup_stale_containers()
+        state = validate_checkpoint(pkg, image_name)
+        source = state.get("source") if is_done(state, "container") else resolve_source(pkg)
+        if state.get("completed"):
+            say(f"Wznawianie instalacji {pkg} po etapie: {state['completed'][-1]}", "bold yellow")
+            main_logger.info(f"Resuming install of {pkg} after {state['completed'][-1]}")
+        flow = install_flow(pkg, state, image_name, source=source, squash=squash)
+        try:
+            with progress_display() as progress:
+                main_task = progress.add_task(f"Instalacja {pkg}", total=100)
+                for stage in flow:
+                    stage.progress = progress
+                run_stages(flow, StageProgress(progress, main_task), flow="install", package=pkg)
+            panel(f"[bold green]Sukces: Pakiet {pkg} został zainstalowany i skonfigurowany![/bold green]")
+            main_logger.info(f"Successfully installed and configured {pkg}")
+        except subprocess.CalledProcessError as e:
+            main_logger.error(f"CalledProcessError during {pkg} installation: {str(e)}")
+            log_subprocess_output(subprocess_logger, e, f"Error installing {pkg}")
+            error_msg = f"[bold red]Błąd podczas instalacji {pkg}: {str(e)}[/bold red]\n"
+            error_msg += "[red]Sprawdź, czy pakiet istnieje i czy podman jest prawidłowo skonfigurowany.[/red]"
+            if load_checkpoint(pkg):
+                error_msg += f"\n[yellow]Postęp został zapisany: 'isolator install {pkg}' wznowi instalację.[/yellow]"
+            panel(error_msg, "red", "on #2d1a1a", gap=False)
+            if os.environ.get("DEBUG"):
+                say("Szczegóły błędu:", "red")
+                say(traceback.format_exc(), "red")
+            sys.exit(1)
+
+def resume_installs():
+    pending = pending_installs()
+    if not pending:
+        say("Brak przerwanych instalacji do wznowienia\n")
+        return
+    for pkg in pending:
+        create_container_image(pkg)
+
+def show_install_summary(results, resumable=True):
+    """Per-package results of a batch ({pkg: (status, detail)}); exits 1 when any failed.
+    resumable points at --resume, for the engine that keeps checkpoints."""
+    rows = []
+    for name in sorted(results):
+        status, detail = results[name]
+        if status == "installed":
+            rows.append((name, f"[green]zainstalowany ({detail})[/green]"))
+        elif status == "skipped":
+            rows.append((name, f"[yellow]pominięty: {detail}[/yellow]"))
+        else:
+            rows.append((name, f"[red]błąd: {detail}[/red]"))
+    show_results("Podsumowanie Instalacji", rows)
+    failed = sorted(name for name, (status, _) in results.items() if status == "failed")
+    if failed:
+        main_logger.error(f"Install failed for: {', '.join(failed)}")
+        panel(
+            f"[bold red]Nie udało się zainstalować {len(failed)} z {len(results)} pakietów[/bold red]"
+            + ("\n[yellow]Postęp został zapisany: 'isolator install --resume' wznowi przerwane instalacje.[/yellow]" if resumable else ""),
+            "red",
+            "on #2d1a1a",
+            gap=False
+        )
         sys.exit(1)
+    main_logger.info(f"Batch install finished: {len(results)} packages")
+
+def install_batch(wanted, jobs=None, engine=BUILD_ENGINE, squash=SQUASH):
+    """Install several packages: base refresh, database sync and repo/AUR resolution happen once
+    for the whole batch, then the per-package stages run concurrently, at most `jobs` at a time.
+    wanted maps each package to its source ("repo" / "aur") or None to look it up."""
+    with ExitStack() as held:
+        # Packages another isolator is installing, updating or removing are left to it
+        busy = []
+        for name in sorted(wanted):
+            try:
+                held.enter_context(package_lock(name, timeout=0))
+            except LockTimeout:
+                busy.append(name)
+        installed = packages(reload=True)
+        results = {name: ("skipped", "zajęty przez inny proces isolator") for name in busy}
+        results.update({name: ("skipped", "już zainstalowany") for name in wanted if name in installed and name not in busy})
+        sources = {name: source for name, source in wanted.items() if name not in installed and name not in busy}
+        if not sources:
+            if busy:
+                say(f"Pominięto pakiety zajęte przez inny proces isolator: {', '.join(busy)}\n", "bold yellow")
+            else:
+                say("Wszystkie pakiety są już zainstalowane\n")
+            return
+        if engine == "containerfile":
+            # podman build shares the base and toolchain layers between builds on its own
+            for pkg in sources:
+                results[pkg] = create_with_containerfile(pkg, squash, batch=True)
+            show_install_summary(results, resumable=False)
+            return
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(sources)))
+        main_logger.info(f"Installing {len(sources)} packages with {jobs} workers")
+        cleanup_stale_containers()
+        try:
+            with spinner("Przygotowanie obrazu bazowego i bazy pakietów...", "bold purple"):
+                with span(None, "base", "install") as fields:
+                    fields["base_reused"] = not ensure_base_image()
+                with span(None, "sync", "install"):
+                    sync_database()
+                refresh_index()
+                unknown = [name for name, source in sources.items() if source is None]
+                with span(None, "resolve", "install") as fields:
+                    found = classify(unknown) if unknown else {}
+                    fields.update(targets=len(unknown), indexed=found is not None)
+                    if found is None:
+                        repo, missing = resolve_repo_targets(unknown)
+                    else:
+                        # The repos were just synced; a name the (possibly older) AUR list lacks is still offered
+                        repo = [name for name in unknown if found[name] == "repo"]
+                        missing = [name for name in unknown if found[name] != "repo"]
+                    fields["missing"] = len(missing)
+            sources.update({name: "repo" for name in repo})
+            if missing:
+                main_logger.info(f"Not in the repositories: {', '.join(missing)}")
+                aur = choose_yes_no(f"Pakiety nie znalezione w standardowych repozytoriach: {', '.join(missing)}. Czy sprawdzić AUR?")
+                for name in missing:
+                    if aur:
+                        sources[name] = "aur"
+                    else:
+                        results[name] = ("skipped", "brak w repozytoriach")
+                        del sources[name]
+            if "aur" in sources.values():
+                with spinner(f"Przygotowanie obrazu {AUR_BASE_IMAGE}...", "bold purple"):
+                    ensure_aur_base_image()
+        except subprocess.CalledProcessError as e:
+            main_logger.error(f"Batch install preparation failed: {str(e)}")
+            log_subprocess_output(subprocess_logger, e, "Batch install preparation")
+            error_panel(f"Błąd podczas przygotowania instalacji: {str(e)}", "Sprawdź połączenie sieciowe i konfigurację podman.")
+            sys.exit(1)
+        flow = []
+        for pkg, source in sources.items():
+            stages = install_flow(pkg, validate_checkpoint(pkg, IMAGES / f"{pkg}.img"), IMAGES / f"{pkg}.img", source=source, base_ready=True, squash=squash)
+            for stage in stages:
+                stage.label = f"{pkg}: {stage.label}"
+            flow += stages
+        if flow:
+            with progress_display() as progress:
+                main_task = progress.add_task(f"Instalacja {len(sources)} pakietów", total=100 * len(sources))
+                for stage in flow:
+                    stage.progress = progress
+                scheduler = run_stages(flow, StageProgress(progress, main_task), limit=jobs, fail_fast=False, flow="install")
+            for pkg in sources:
+                if scheduler.stages[f"register:{pkg}"].state == "finished":
+                    results[pkg] = ("installed", sources[pkg])
+                    continue
+                error = next((stage.error for stage in scheduler.stages.values() if stage.package == pkg and stage.error), None)
+                if isinstance(error, subprocess.CalledProcessError):
+                    log_subprocess_output(subprocess_logger, error, f"Error installing {pkg}")
+                results[pkg] = ("failed", error)
+        show_install_summary(results)
 
 def remove_package(pkg):
-    image_name = IMAGES / f"{pkg}.img"
-    run_script = BIN / f"run-{pkg}.sh"
-    desktop_file = DESKTOP_DIR / f"{pkg}.desktop"
-
-    if not image_name.exists() and not run_script.exists() and not desktop_file.exists():
-        console.print(Panel(
-            f"[bold red]Błąd: Pakiet {pkg} nie jest zainstalowany![/bold red]\n"
-            f"[red]Użyj 'isolator list' aby zobaczyć zainstalowane pakiety.[/red]",
-            border_style="red",
-            padding=(1, 2),
-            style="on #2d1a1a",
-            box=ROUNDED
-        ))
-        main_logger.error(f"Attempted to remove non-existent package {pkg}")
-        sys.exit(1)
+    with package_lock(pkg):
+        record = get_package(pkg)
+        if record is None:
+            error_panel(f"Błąd: Pakiet {pkg} nie jest zainstalowany!", "Użyj 'isolator list' aby zobaczyć zainstalowane pakiety.")
+            main_logger.error(f"Attempted to remove non-existent package {pkg}")
+            sys.exit(1)
+        if record.get("bundle"):
+            # Its image is shared: the package is taken out of the bundle instead
+            from bundles import remove_from_bundle
+            return remove_from_bundle(record["bundle"], [pkg])
+
+        artifacts = record.get("artifacts", {})
+        run_script = Path(artifacts["run_script"]) if "run_script" in artifacts else None
+        desktop_file = Path(artifacts["desktop_file"]) if "desktop_file" in artifacts else None
+
+        def stop_warm_container(stage):
+            stop_detached(pkg)
+            stop_warm(pkg)
+
+        def remove_image(stage):
+            main_logger.info(f"Removing container image for {pkg}")
+            podman.remove_image(record["image"], f"Remove image for {pkg}")
+
+        def remove_run_script(stage):
+            main_logger.info(f"Removing run script for {pkg}")
+            run_script.unlink()
+
+        def remove_desktop_file(stage):
+            main_logger.info(f"Removing .desktop file for {pkg}")
+            desktop_file.unlink()
+
+        def unregister_package(stage):
+            drop_package(pkg)
+
+        # The launchers go only once the image is gone: a failed rmi (image still in use) leaves the
+        # package registered and runnable. The two launcher files then go concurrently.
+        flow = [
+            Stage("warm", stop_warm_container, [], 0, "Zatrzymywanie uruchomionych kontenerów", "blue"),
+            Stage("image", remove_image, ["warm"], 40, "Usuwanie obrazu kontenera", "red", skip=not record.get("image")),
+            Stage("run_script", remove_run_script, ["image"], 30, "Usuwanie skryptu uruchamiającego", "yellow", skip=not (run_script and run_script.exists())),
+            Stage("desktop_file", remove_desktop_file, ["image"], 30, "Usuwanie pliku .desktop", "magenta", skip=not (desktop_file and desktop_file.exists())),
+            Stage("unregister", unregister_package, ["image", "run_script", "desktop_file"], 0, "Wyrejestrowanie pakietu", "white"),
+        ]
+        try:
+            with progress_display() as progress:
+                main_task = progress.add_task(f"Usuwanie {pkg}", total=100)
+                run_stages(flow, StageProgress(progress, main_task), flow="remove", package=pkg)
+
+            panel(f"[bold green]Sukces: Pakiet {pkg} został usunięty![/bold green]")
+            main_logger.info(f"Successfully removed package {pkg}")
+
+        except (subprocess.CalledProcessError, OSError) as e:
+            main_logger.error(f"Error removing package {pkg}: {str(e)}")
+            if isinstance(e, subprocess.CalledProcessError):
+                log_subprocess_output(subprocess_logger, e, f"Error removing image for {pkg}")
+            error_panel(f"Błąd podczas usuwania {pkg}: {str(e)}", "Sprawdź uprawnienia lub czy wszystkie pliki zostały poprawnie usunięte.")
+            if os.environ.get("DEBUG"):
+                say("Szczegóły błędu:", "red")
+                say(traceback.format_exc(), "red")
+            sys.exit(1)
 
+def pending_upgrades(name, image):
+    """Packages with a newer version in the shared sync database; empty when the image is up to date"""
+    proc = run_streaming(["podman", "run", "--rm", *sync_db_args(), image, "pacman", "-Qu"], f"Check upgrades for {name}")
+    # pacman -Qu exits with 1 and prints nothing when there is nothing to upgrade
+    if proc.returncode not in (0, 1) or (proc.returncode == 1 and proc.stderr.strip()):
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, proc.stdout, proc.stderr)
+    return [line for line in proc.stdout.decode().split("\n") if line.strip()] if proc.returncode == 0 else []
+
+def update_image(name, record, base_id, progress, task, scheduler=None, limits=()):
+    """Update a single image; returns ("up to date" | "updated" | "failed", size delta in bytes or the error).
+    name and record are a package's, or a bundle's key and record: all its packages then get one upgrade and one commit.
+    limits are extra `podman create` flags for the update container, such as --cpus."""
+    image = record["image"]
+    targets = record.get("packages") or [name]
+    cid = None
+    cleanup = None
     try:
-        with Progress(
-            SpinnerColumn(spinner_name="dots"),
-            TextColumn("[progress.description]{task.description}", style="bold cyan"),
-            BarColumn(bar_width=None, style="blue", complete_style="green"),
-            MofNCompleteColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.1f}%", style="white"),
-            TimeElapsedColumn(),
-            TimeRemainingColumn(),
-            console=console
-        ) as progress:
-            main_task = progress.add_task(f"Usuwanie {pkg}", total=100)
-            stages = [
-                ("Usuwanie obrazu kontenera", 40, "red"),
-                ("Usuwanie skryptu uruchamiającego", 30, "yellow"),
-                ("Usuwanie pliku .desktop", 30, "magenta")
-            ]
-            current_advance = 0
-
-            if image_name.exists():
-                subtask = progress.add_task(stages[0][0], total=None, style=stages[0][2])
-                console.print(f"[bold {stages[0][2]}]>> {stages[0][0]}...[/bold {stages[0][2]}]")
-                main_logger.info(f"Removing container image for {pkg}")
-                proc = subprocess.run(["podman", "rmi", str(image_name)], capture_output=True, check=True)
-                log_subprocess_output(subprocess_logger, proc, f"Remove image for {pkg}")
-                progress.update(main_task, advance=stages[0][1])
-                current_advance += stages[0][1]
-                progress.remove_task(subtask)
-                time.sleep(0.2)
-
-            if run_script.exists():
-                subtask = progress.add_task(stages[1][0], total=None, style=stages[1][2])
-                console.print(f"[bold {stages[1][2]}]>> {stages[1][0]}...[/bold {stages[1][2]}]")
-                main_logger.info(f"Removing run script for {pkg}")
-                run_script.unlink()
-                progress.update(main_task, advance=stages[1][1])
-                current_advance += stages[1][1]
-                progress.remove_task(subtask)
-                time.sleep(0.2)
-
-            if desktop_file.exists():
-                subtask = progress.add_task(stages[2][0], total=None, style=stages[2][2])
-                console.print(f"[bold {stages[2][2]}]>> {stages[2][0]}...[/bold {stages[2][2]}]")
-                main_logger.info(f"Removing .desktop file for {pkg}")
-                desktop_file.unlink()
-                progress.update(main_task, advance=stages[2][1])
-                current_advance += stages[2][1]
-                progress.remove_task(subtask)
-                time.sleep(0.2)
-
-            if current_advance < 100:
-                progress.update(main_task, advance=100 - current_advance)
-
-        console.print(Panel(
-            f"[bold green]Sukces: Pakiet {pkg} został usunięty![/bold green]",
-            border_style="green",
-            padding=(1, 2),
-            style="on #1a2525",
-            box=ROUNDED
-        ))
-        console.print("\n")
-        main_logger.info(f"Successfully removed package {pkg}")
-
-    except (subprocess.CalledProcessError, OSError) as e:
-        main_logger.error(f"Error removing package {pkg}: {str(e)}")
-        if isinstance(e, subprocess.CalledProcessError):
-            log_subprocess_output(subprocess_logger, e, f"Error removing image for {pkg}")
-        console.print(Panel(
-            f"[bold red]Błąd podczas usuwania {pkg}: {str(e)}[/bold red]\n"
-            f"[red]Sprawdź uprawnienia lub czy wszystkie pliki zostały poprawnie usunięte.[/red]",
-            border_style="red",
-            padding=(1, 2),
-            style="on #2d1a1a",
-            box=ROUNDED
-        ))
-        if os.environ.get("DEBUG"):
-            console.print("[red]Szczegóły błędu:[/red]")
-            console.print(traceback.format_exc())
-        sys.exit(1)
+        main_logger.info(f"Starting update for {name}")
+        progress.update(task, description=f"{name}: sprawdzanie aktualizacji")
+        with span(name, "check", "update") as fields:
+            pending = pending_upgrades(name, image)
+            fields["pending"] = len(pending)
+        if not pending:
+            progress.update(task, completed=5, description=f"[green]{name}: aktualny[/green]")
+            main_logger.info(f"{name} is up to date, skipping")
+            return "up to date", 0
+        main_logger.info(f"{name} has {len(pending)} pending upgrades")
+        # Repo images built on an older base are rebuilt on the current one rather than
+        # stacking an upgrade layer on top, so each app stays base + a single layer. The base can
+        # lag the freshly synced database, so it is upgraded in the same transaction (no partial upgrade).
+        rebase = record.get("source") == "repo" and base_id and record.get("base_id") != base_id
+        progress.update(task, advance=1, description=f"{name}: tworzenie kontenera")
+        with span(name, "container", "update"):
+            cid = podman.create(["-it", *limits, *temp_container_args(name), *pacman_cache_args(), *sync_db_args(), BASE_IMAGE if rebase else image, "/bin/bash"], f"Create container for update {name}")
+        if scheduler:
+            # On cancellation the container is removed right away, which also stops pacman inside it
+            cleanup = scheduler.add_cleanup(lambda: podman.remove_container(cid, f"Cleanup update container for {name}"))
+        with span(name, "upgrade", "update") as fields:
+            tracker = PacmanProgress(None, None)
+            fields["rebase"] = bool(rebase)
+            if rebase:
+                progress.update(task, advance=1, description=f"{name}: instalacja na nowej bazie")
+                run_streaming(["podman", "start", "-ai", cid, "-c", f"pacman -Su --noconfirm {' '.join(targets)}"], f"Rebase {name}", check=True, on_line=tracker)
+            else:
+                progress.update(task, advance=1, description=f"{name}: pacman -Su")
+                run_streaming(["podman", "start", "-ai", cid, "-c", "pacman -Su --noconfirm"], f"Update system for {name}", check=True, on_line=tracker)
+            fields.update(tracker.fields())
+        progress.update(task, advance=1, description=f"{name}: zapisywanie obrazu")
+        versions = installed_versions(cid, targets)
+        with span(name, "commit", "update"):
+            slim_container(cid, name)
+            # podman build's --squash kept the base shared; a squashed commit here would flatten it in
+            podman.commit(cid, image, f"Commit update for {name}", squash=record.get("squashed", False) and record.get("engine") != "containerfile")
+        progress.update(task, advance=1, description=f"{name}: usuwanie kontenera")
+        with span(name, "cleanup", "update"):
+            podman.remove_container(cid, f"Remove update container for {name}", force=False, check=True)
+        cid = None
+        if rebase and record.get("image_id"):
+            # The retagged image no longer backs anything; rmi fails harmlessly while a warm container still uses it
+            podman.remove_image(record["image_id"], f"Remove pre-update image of {name}", check=False)
+        info = inspect_image(image)
+        delta = (info["size"] or 0) - (record.get("size") or 0)
+        fields = dict(info)
+        if rebase:
+            fields["base_id"] = base_id
+        if "packages" in record:
+            update_bundle(name[len(BUNDLE_PREFIX):], members={pkg: {"version": versions.get(pkg)} for pkg in targets}, **fields)
+        else:
+            update_package(name, version=versions.get(name), **fields)
+        progress.update(task, advance=1, description=f"[green]{name}: zaktualizowany[/green]")
+        main_logger.info(f"Updated {name} ({delta} bytes delta{', rebased' if rebase else ''})")
+        return "updated", delta
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"Update error for {name}: {str(e)}")
+        log_subprocess_output(subprocess_logger, e, f"Update error for {name}")
+        progress.update(task, description=f"[red]{name}: błąd[/red]")
+        return "failed", e
+    finally:
+        if cleanup:
+            scheduler.discard_cleanup(cleanup)
+        if cid:
+            podman.remove_container(cid, f"Cleanup update container for {name}")
 
-def update_all():
-    images = list(IMAGES.glob("*.img"))
-    if not images:
-        console.print(Panel(
-            "[bold yellow]Brak zainstalowanych pakietów do aktualizacji[/bold yellow]",
-            border_style="yellow",
-            padding=(1, 2),
-            style="on #2d2a1a",
-            box=ROUNDED
-        ))
-        console.print("\n")
+def update_all(jobs=None):
+    # A bundle is updated once for all of its packages
+    records = dict(update_units())
+    if not records:
+        panel("[bold yellow]Brak zainstalowanych pakietów do aktualizacji[/bold yellow]", "yellow", "on #2d2a1a")
         main_logger.info("No packages found for update")
         return
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(records)))
+    main_logger.info(f"Updating {len(records)} images with {jobs} workers")
+    results = {}
+
+    def sync_base(stage):
+        ensure_base_image()
+        sync_database()
+        refresh_index()
+
+    def update_one(stage):
+        try:
+            with package_lock(stage.package, timeout=0):
+                # The records were read when update-all started; another isolator may have changed them since
+                record = get_unit(stage.package, reload=True)
+                if record is None:
+                    status, detail = "skipped", "usunięty przez inny proces isolator"
+                else:
+                    status, detail = update_image(stage.package, record, load_base_state().get("image_id"), stage.progress, stage.task, stage.scheduler)
+        except LockTimeout:
+            status, detail = "skipped", "zajęty przez inny proces isolator"
+        if status == "skipped":
+            stage.progress.update(stage.task, description=f"[yellow]{stage.package}: pominięty[/yellow]")
+        stage.fields["result"] = status
+        if status == "failed":
+            # update_image reports failures instead of raising, so the span is marked here
+            stage.fields.update(status="failed", exit_code=getattr(detail, "returncode", None))
+        return status, detail
+
+    with progress_display(percentage=False) as progress:
+        main_task = progress.add_task("Aktualizacja wszystkich kontenerów", total=len(records))
+        flow = [Stage("sync", sync_base, [], 0, "Synchronizacja bazy pakietów", "purple")]
+        for name in records:
+            stage = Stage(f"update:{name}", update_one, ["sync"], 1, name, task=progress.add_task(f"{name}: oczekuje", total=5), package=name)
+            stage.progress = progress
+            flow.append(stage)
+
+        def on_event(kind, stage):
+            if kind == "started" and stage.name == "sync":
+                stage.task = progress.add_task(stage.label, total=None, style=stage.color)
+            elif kind in ("finished", "failed") and stage.name == "sync":
+                progress.remove_task(stage.task)
+            elif stage.name.startswith("update:") and kind in ("finished", "failed", "blocked", "cancelled"):
+                if kind == "finished":
+                    results[stage.package] = stage.result
+                else:
+                    results[stage.package] = ("failed", stage.error or "przerwano: synchronizacja bazy pakietów nie powiodła się")
+                    progress.update(stage.task, description=f"[red]{stage.package}: błąd[/red]")
+                progress.update(main_task, advance=1)
+
+        # Each image's row is created up front; the pool of jobs is the scheduler's concurrency limit
+        scheduler = run_stages(flow, on_event, limit=jobs, fail_fast=False, flow="update")
+    sync_error = scheduler.stages["sync"].error
+    if sync_error is not None:
+        main_logger.error(f"Update error: {str(sync_error)}")
+        if isinstance(sync_error, subprocess.CalledProcessError):
+            log_subprocess_output(subprocess_logger, sync_error, "Update error")
+    rows = []
+    for name in sorted(results):
+        status, detail = results[name]
+        if status == "up to date":
+            rows.append((name, "[green]aktualny[/green]"))
+        elif status == "updated":
+            rows.append((name, f"[green]zaktualizowany ({detail / 1024 / 1024:+.1f} MB)[/green]"))
+        elif status == "skipped":
+            rows.append((name, f"[yellow]pominięty: {detail}[/yellow]"))
+        else:
+            rows.append((name, f"[red]błąd: {detail}[/red]"))
+    show_results("Podsumowanie Aktualizacji", rows)
+    failed = [name for name, (status, _) in results.items() if status == "failed"]
+    if failed:
+        main_logger.error(f"Update failed for: {', '.join(sorted(failed))}")
+        error_panel(f"Nie udało się zaktualizować {len(failed)} z {len(results)} kontenerów", "Sprawdź połączenie sieciowe i konfigurację podman.")
+        sys.exit(1)
+    main_logger.info("All containers updated successfully")
+
+def reindex_packages():
     try:
-        with Progress(
-            SpinnerColumn(spinner_name="dots"),
-            TextColumn("[progress.description]{task.description}", style="bold cyan"),
-            BarColumn(bar_width=None, style="blue", complete_style="green"),
-            MofNCompleteColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.1f}%", style="white"),
-            TimeElapsedColumn(),
-            TimeRemainingColumn(),
-            console=console
-        ) as progress:
-            main_task = progress.add_task("Aktualizacja wszystkich kontenerów", total=len(images) * 100)
-            for image in images:
-                name = image.stem
-                subtask = progress.add_task(f"Aktualizacja {name}", total=None)
-                console.print(f"[bold cyan]>> Aktualizowanie {name}...[/bold cyan]")
-                main_logger.info(f"Starting update for {name}")
-                output = subprocess.check_output(["podman", "create", "-it", str(image), "/bin/bash"], stderr=subprocess.STDOUT)
-                cid = output.decode().strip()
-                subprocess_logger.info(f"Create container for update {name}: {output.decode()}")
-                proc = subprocess.run(["podman", "start", "-ai", cid, "-c", "pacman -Syu --noconfirm"], capture_output=True, check=True)
-                log_subprocess_output(subprocess_logger, proc, f"Update system for {name}")
-                proc = subprocess.run(["podman", "commit", cid, str(image)], capture_output=True, check=True)
-                log_subprocess_output(subprocess_logger, proc, f"Commit update for {name}")
-                proc = subprocess.run(["podman", "rm", cid], capture_output=True, check=True)
-                log_subprocess_output(subprocess_logger, proc, f"Remove update container for {name}")
-                progress.update(main_task, advance=100)
-                progress.remove_task(subtask)
-                time.sleep(0.2)
-        console.print(Panel(
-            "[bold green]Wszystkie kontenery zostały zaktualizowane![/bold green]",
-            border_style="green",
-            padding=(1, 2),
-            style="on #1a2525",
-            box=ROUNDED
-        ))
-        console.print("\n")
-        main_logger.info("All containers updated successfully")
+        with spinner("Przebudowywanie indeksu pakietów..."):
+            found = reindex()
     except subprocess.CalledProcessError as e:
-        main_logger.error(f"Update error: {str(e)}")
-        log_subprocess_output(subprocess_logger, e, "Update error")
-        console.print(Panel(
-            f"[bold red]Błąd podczas aktualizacji: {str(e)}[/bold red]\n"
-            f"[red]Sprawdź połączenie sieciowe i konfigurację podman.[/red]",
-            border_style="red",
-            padding=(1, 2),
-            style="on #2d1a1a",
-            box=ROUNDED
-        ))
-        if os.environ.get("DEBUG"):
-            console.print("[red]Szczegóły błędu:[/red]")
-            console.print(traceback.format_exc())
+        main_logger.error(f"Reindex error: {str(e)}")
+        error_panel(f"Błąd podczas przebudowy indeksu: {str(e)}", "Sprawdź konfigurację podman.")
         sys.exit(1)
-
-def list_packages():
-    images = list(IMAGES.glob("*.img"))
-    if not images:
-        console.print(Panel(
-            "[bold yellow]Brak zainstalowanych pakietów[/bold yellow]",
-            border_style="yellow",
-            padding=(1, 2),
-            style="on #2d2a1a",
-            box=ROUNDED
-        ))
-        console.print("\n")
-        main_logger.info("No installed packages found")
-        return
-    table = Table(
-        title="Zainstalowane Pakiety",
-        title_style="bold color(201) on #1a2525",
-        show_lines=True,
-        border_style="bright_cyan",
-        header_style="bold white on #2d3b3b",
-        padding=(0, 1),
-        box=ROUNDED
-    )
-    table.add_column("Pakiet", style="cyan", width=25)
-    table.add_column("Ścieżka Obrazu", style="green")
-    for image in images:
-        table.add_row(image.stem, str(image))
-    console.print(Panel(
-        table,
-        border_style="cyan",
-        padding=(1, 2),
-        style="on #1a2525",
-        box=ROUNDED
-    ))
-    console.print("\n")
-    main_logger.info("Listed installed packages")
+    panel(f"[bold green]Indeks przebudowany: {len(found)} pakietów[/bold green]")
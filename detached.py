@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import deque
+from config import RUNTIME, APP_LOGS, APP_LOG_MAX_SIZE, APP_LOG_RUNS, PLAIN, console, ensure_dirs
+from logger import main_logger
+from runner import run_streaming
+from utils import atomic_write_json
+from ui import error_panel
+import podman_api as podman
+
+# A detached launch returns once the container is up. Its output goes through conmon into
+# APP_LOGS/<pkg>/ (k8s-file format, truncated at APP_LOG_MAX_SIZE) instead of through isolator,
+# and RUNTIME/<cid>.run records the container for `isolator ps`, `logs` and `stop`.
+APP_LABEL = "isolator.app"
+K8S_LINE = re.compile(r"^\S+ (stdout|stderr) ([FP]) ?(.*)$")
+FOLLOW_INTERVAL = 0.5
+
+def entry_path(cid):
+    return RUNTIME / f"{cid[:12]}.run"
+
+def pid_alive(pid):
+    """Whether pid is a live process; an exited one its parent has not reaped yet counts as gone"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rpartition(")")[2].split()[0] != "Z"
+    except (OSError, IndexError):
+        return True
+
+def running(pkg=None):
+    """Registry entries of detached apps still running, oldest first. Entries whose process is gone are
+    dropped on the way, so no podman call is needed to tell which ones are left."""
+    entries = []
+    for path in RUNTIME.glob("*.run"):
+        try:
+            entry = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if not entry.get("pid") or not pid_alive(entry["pid"]):
+            path.unlink(missing_ok=True)
+            continue
+        if pkg is None or entry["package"] == pkg:
+            entries.append(entry)
+    return sorted(entries, key=lambda entry: entry["started"])
+
+def new_log(pkg, started):
+    """Log file for a new launch of pkg; the oldest ones beyond APP_LOG_RUNS go, unless still written to"""
+    directory = APP_LOGS / pkg
+    ensure_dirs(directory)
+    in_use = {entry["log"] for entry in running(pkg)}
+    logs = sorted(directory.glob("*.log"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for old in logs[APP_LOG_RUNS - 1:]:
+        if str(old) not in in_use:
+            old.unlink(missing_ok=True)
+    return directory / f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}-{os.getpid()}.log"
+
+def start_detached(pkg, image):
+    """Start pkg in the background; returns its registry entry"""
+    started = time.time()
+    log = new_log(pkg, started)
+    subprocess.run(["xhost", f"+SI:localuser:{os.environ.get('USER', '')}"], capture_output=True)
+    proc = run_streaming([
+        "podman", "run", "-d", "--rm",
+        "--label", f"{APP_LABEL}={pkg}",
+        "--log-driver", "k8s-file",
+        "--log-opt", f"path={log}",
+        "--log-opt", f"max-size={APP_LOG_MAX_SIZE}",
+        "-e", f"DISPLAY={os.environ.get('DISPLAY', '')}",
+        "-v", "/tmp/.X11-unix:/tmp/.X11-unix:rw",
+        "-v", f"{os.path.expanduser('~')}:/home/user:rw",
+        "--device", "/dev/dri",
+        str(image), pkg
+    ], f"Start detached {pkg}", check=True)
+    cid = proc.stdout.decode().split()[-1]
+    # 0 when the app already exited; running() then drops the entry
+    inspect = subprocess.run(["podman", "container", "inspect", "--format", "{{.State.Pid}}", cid], capture_output=True)
+    pid = int(inspect.stdout.decode().strip() or 0) if inspect.returncode == 0 else 0
+    entry = {"package": pkg, "cid": cid, "pid": pid, "started": started, "log": str(log), "image": str(image)}
+    ensure_dirs(RUNTIME)
+    atomic_write_json(entry_path(cid), entry)
+    main_logger.info(f"Started {pkg} detached: container {cid[:12]}, PID {pid}, log {log}")
+    return entry
+
+def stop_detached(pkg):
+    """Stop every detached instance of pkg; returns how many there were"""
+    entries = running(pkg)
+    for entry in entries:
+        run_streaming(["podman", "rm", "-f", "-t", "2", entry["cid"]], f"Stop detached {pkg}")
+        entry_path(entry["cid"]).unlink(missing_ok=True)
+    if entries:
+        main_logger.info(f"Stopped {len(entries)} detached instances of {pkg}")
+    return len(entries)
+
+def sample(entries):
+    """CPU and memory of entries in one stats call. A container exiting between the registry check and
+    the sample fails the whole batch, so the ones podman still lists as running get a second try."""
+    cids = [entry["cid"] for entry in entries]
+    try:
+        return podman.stats(cids)
+    except subprocess.CalledProcessError:
+        alive = {info["Id"] for info in podman.list_containers(APP_LABEL) if info["State"] == "running"}
+        return podman.stats([cid for cid in cids if cid in alive])
+
+def uptime(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m {seconds % 60:02d}s"
+
+def ps_command():
+    entries = running()
+    if not entries:
+        if PLAIN:
+            print("Brak aplikacji uruchomionych w tle")
+        else:
+            from rich.panel import Panel
+            from rich.box import ROUNDED
+            console.print(Panel(
+                "[bold yellow]Brak aplikacji uruchomionych w tle[/bold yellow]\n"
+                "[yellow]Uruchom aplikację przez 'isolator run --detach <pakiet>'.[/yellow]",
+                border_style="yellow",
+                padding=(1, 2),
+                style="on #2d2a1a",
+                box=ROUNDED
+            ))
+            console.print("\n")
+        main_logger.info("No detached apps running")
+        return
+    try:
+        usage = sample(entries)
+    except subprocess.CalledProcessError as e:
+        main_logger.warning(f"Stats query failed: {str(e)}")
+        usage = {}
+    now = time.time()
+    rows = []
+    for entry in entries:
+        stats = usage.get(entry["cid"])
+        rows.append((entry["package"], entry["cid"][:12], str(entry["pid"]), uptime(now - entry["started"]),
+                     f"{stats['cpu']:.1f}%" if stats else "?", f"{stats['mem'] / 1024 / 1024:.1f} MB" if stats else "?"))
+    if PLAIN:
+        # Tab separated: package, container, PID, uptime, CPU, memory
+        print("\n".join("\t".join(row) for row in rows))
+        main_logger.info("Listed detached apps")
+        return
+    from rich.panel import Panel
+    from rich.table import Table
+    from rich.box import ROUNDED
+    table = Table(
+        title="Aplikacje w Tle",
+        title_style="bold color(201) on #1a2525",
+        show_lines=True,
+        border_style="bright_cyan",
+        header_style="bold white on #2d3b3b",
+        padding=(0, 1),
+        box=ROUNDED
+    )
+    table.add_column("Pakiet", style="cyan", width=25)
+    table.add_column("Kontener", style="white")
+    table.add_column("PID", style="white", justify="right")
+    table.add_column("Czas działania", style="green", justify="right")
+    table.add_column("CPU", style="magenta", justify="right")
+    table.add_column("Pamięć", style="yellow", justify="right")
+    for row in rows:
+        table.add_row(*row)
+    console.print(Panel(
+        table,
+        border_style="cyan",
+        padding=(1, 2),
+        style="on #1a2525",
+        box=ROUNDED
+    ))
+    console.print("\n")
+    main_logger.info("Listed detached apps")
+
+def messages(f, partial):
+    """Lines of app output from the k8s-file records readable from f. A record conmon is still writing
+    is left for the next call; partial carries a line split over several records between calls."""
+    while True:
+        position = f.tell()
+        raw = f.readline()
+        if not raw:
+            return
+        if not raw.endswith(b"\n"):
+            f.seek(position)
+            return
+        match = K8S_LINE.match(raw.decode("utf-8", errors="replace").rstrip("\n"))
+        if not match:
+            continue
+        partial.append(match.group(3))
+        if match.group(2) == "F":
+            yield "".join(partial)
+            partial.clear()
+
+def latest_log(pkg):
+    """The log of pkg's newest running instance, else of its last launch"""
+    entries = running(pkg)
+    if entries:
+        return entries[-1]["log"], entries[-1]["pid"]
+    logs = sorted((APP_LOGS / pkg).glob("*.log"), key=lambda path: path.stat().st_mtime)
+    return (str(logs[-1]), None) if logs else (None, None)
+
+def logs_command(pkg, follow=False, lines=50):
+    path, pid = latest_log(pkg)
+    if path is None or not os.path.exists(path):
+        error_panel(f"Błąd: Brak logów dla {pkg}", f"Logi zapisują się przy uruchomieniu w tle: 'isolator run --detach {pkg}'.")
+        main_logger.error(f"No app logs for {pkg}")
+        sys.exit(1)
+    partial = []
+    try:
+        with open(path, "rb") as f:
+            for line in deque(messages(f, partial), maxlen=lines):
+                print(line)
+            while follow and pid and pid_alive(pid):
+                time.sleep(FOLLOW_INTERVAL)
+                # conmon truncates the file once it reaches APP_LOG_MAX_SIZE
+                if os.path.getsize(path) < f.tell():
+                    f.seek(0)
+                for line in messages(f, partial):
+                    print(line, flush=True)
+            if follow:
+                # What the app wrote just before it exited
+                for line in messages(f, partial):
+                    print(line)
+    except KeyboardInterrupt:
+        pass
+    main_logger.info(f"Displayed logs of {pkg} from {path}")
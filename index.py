@@ -0,0 +1,291 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import time
+import urllib.request
+from config import SYNC_DB, INDEX_FILE, AUR_METADATA_FILE, AUR_METADATA_URL, PLAIN, ensure_dirs
+from logger import main_logger
+from ui import say, panel, error_panel, spinner
+
+# Host-side index of the shared sync databases (and optionally the AUR package list) in SQLite,
+# so install can tell repo / AUR / nonexistent and search can answer without any container.
+# Everything it needs is on disk, so it keeps working offline from the last snapshot.
+
+SCHEMA = """
+CREATE TABLE packages (name TEXT PRIMARY KEY, version TEXT, repo TEXT, description TEXT);
+CREATE TABLE provides (name TEXT, package TEXT);
+CREATE INDEX provides_name ON provides (name);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def parse_desc(text):
+    """%FIELD% blocks of a sync database desc file as {FIELD: [values]}"""
+    fields = {}
+    for block in text.strip().split("\n\n"):
+        lines = block.strip().split("\n")
+        if lines and lines[0].startswith("%") and lines[0].endswith("%"):
+            fields[lines[0].strip("%")] = lines[1:]
+    return fields
+
+def read_sync_db(path):
+    """(name, version, description, provides + groups) for every package in a pacman sync database"""
+    data = path.read_bytes()
+    try:
+        archive = tarfile.open(fileobj=io.BytesIO(data), mode="r:*")
+    except tarfile.ReadError:
+        # zstd compressed databases are beyond tarfile
+        data = subprocess.run(["zstd", "-dc"], input=data, capture_output=True, check=True).stdout
+        archive = tarfile.open(fileobj=io.BytesIO(data), mode="r:")
+    with archive:
+        for member in archive:
+            if not member.name.endswith("/desc"):
+                continue
+            fields = parse_desc(archive.extractfile(member).read().decode("utf-8", errors="ignore"))
+            name = fields.get("NAME", [None])[0]
+            if not name:
+                continue
+            # libfoo.so=1-64, java-runtime=17: only the name before any version constraint
+            provides = [entry.split("=")[0].split("<")[0].split(">")[0] for entry in fields.get("PROVIDES", [])]
+            yield name, fields.get("VERSION", [""])[0], fields.get("DESC", [""])[0], provides + fields.get("GROUPS", [])
+
+def sync_db_files():
+    return sorted(SYNC_DB.glob("*.db")) if SYNC_DB.exists() else []
+
+def signature():
+    """Changes whenever pacman rewrites a database or the AUR list is fetched again"""
+    files = sync_db_files() + ([AUR_METADATA_FILE] if AUR_METADATA_FILE.exists() else [])
+    return json.dumps([[path.name, path.stat().st_size, int(path.stat().st_mtime)] for path in files])
+
+def connect():
+    """Read-only connection to the index, or None when it has not been built yet"""
+    if not INDEX_FILE.exists():
+        return None
+    return sqlite3.connect(f"file:{INDEX_FILE}?mode=ro", uri=True)
+
+def meta(db, key, default=None):
+    row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def build_index():
+    """Rebuild the index from the sync databases and the stored AUR list; returns packages indexed"""
+    ensure_dirs(INDEX_FILE.parent)
+    tmp = INDEX_FILE.with_name(f".{INDEX_FILE.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    db = sqlite3.connect(tmp)
+    try:
+        db.executescript(SCHEMA)
+        for path in sync_db_files():
+            repo = path.stem
+            for name, version, description, provides in read_sync_db(path):
+                db.execute("INSERT OR IGNORE INTO packages VALUES (?, ?, ?, ?)", (name, version, repo, description))
+                db.executemany("INSERT INTO provides VALUES (?, ?)", [(provided, name) for provided in provides])
+        aur = 0
+        if AUR_METADATA_FILE.exists():
+            with gzip.open(AUR_METADATA_FILE) as f:
+                for entry in json.load(f):
+                    # A name in both is the repo package; INSERT OR IGNORE keeps it
+                    db.execute("INSERT OR IGNORE INTO packages VALUES (?, ?, 'aur', ?)", (entry["Name"], entry.get("Version"), entry.get("Description") or ""))
+                    aur += 1
+        db.executemany("INSERT INTO meta VALUES (?, ?)", [("signature", signature()), ("built_at", str(time.time())), ("aur", str(aur))])
+        db.commit()
+        count = db.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+    finally:
+        db.close()
+    os.replace(tmp, INDEX_FILE)
+    main_logger.info(f"Built package index with {count} packages ({aur} from the AUR)")
+    return count
+
+def refresh_index():
+    """Rebuild the index if the sync databases changed since it was built; True when rebuilt"""
+    if not sync_db_files():
+        return False
+    db = connect()
+    if db is not None:
+        try:
+            current = meta(db, "signature") == signature()
+        except sqlite3.Error:
+            current = False
+        finally:
+            db.close()
+        if current:
+            return False
+    build_index()
+    return True
+
+def fetch_aur_metadata():
+    """Download the AUR package list (names, versions, descriptions) next to the index"""
+    ensure_dirs(AUR_METADATA_FILE.parent)
+    tmp = AUR_METADATA_FILE.with_name(f".{AUR_METADATA_FILE.name}.tmp")
+    main_logger.info(f"Downloading AUR metadata from {AUR_METADATA_URL}")
+    with urllib.request.urlopen(AUR_METADATA_URL, timeout=60) as response, open(tmp, "wb") as f:
+        shutil.copyfileobj(response, f)
+    os.replace(tmp, AUR_METADATA_FILE)
+
+def store_aur_rows(path):
+    """Save the AUR list carried by the index snapshot at path as this host's AUR list, unless the
+    local one is newer, so rebuilding over the snapshot keeps the AUR packages; returns rows saved"""
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as db:
+        built_at = float(meta(db, "built_at", "0")) or time.time()
+        rows = db.execute("SELECT name, version, description FROM packages WHERE repo = 'aur'").fetchall()
+    if not rows or (AUR_METADATA_FILE.exists() and AUR_METADATA_FILE.stat().st_mtime >= built_at):
+        return 0
+    ensure_dirs(AUR_METADATA_FILE.parent)
+    tmp = AUR_METADATA_FILE.with_name(f".{AUR_METADATA_FILE.name}.tmp")
+    with gzip.open(tmp, "wt") as f:
+        json.dump([{"Name": name, "Version": version, "Description": description} for name, version, description in rows], f)
+    os.replace(tmp, AUR_METADATA_FILE)
+    # Dated like the snapshot, so a later import of an older one does not replace it
+    os.utime(AUR_METADATA_FILE, (built_at, built_at))
+    main_logger.info(f"Stored {len(rows)} AUR packages from the imported index")
+    return len(rows)
+
+def classify(pkgs):
+    """{pkg: "repo" | "aur" | None} by name, then provides and groups; None for the whole result
+    when there is no index. A None entry means the index does not know pkg, not that it does not exist."""
+    db = connect()
+    if db is None:
+        return None
+    try:
+        result = {}
+        for pkg in pkgs:
+            row = db.execute("SELECT repo FROM packages WHERE name = ?", (pkg,)).fetchone()
+            if row:
+                result[pkg] = "aur" if row[0] == "aur" else "repo"
+            elif db.execute("SELECT 1 FROM provides WHERE name = ? LIMIT 1", (pkg,)).fetchone():
+                result[pkg] = "repo"
+            else:
+                result[pkg] = None
+        return result
+    except sqlite3.Error as e:
+        main_logger.error(f"Package index unreadable: {str(e)}")
+        return None
+    finally:
+        db.close()
+
+def aur_version(pkg):
+    """pkg's current AUR version from the stored AUR list, or None when the index does not know it"""
+    db = connect()
+    if db is None:
+        return None
+    try:
+        row = db.execute("SELECT version FROM packages WHERE name = ? AND repo = 'aur'", (pkg,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+    finally:
+        db.close()
+
+def search(term, limit=50):
+    """(name, version, repo, description) matching term in name or description, name matches first"""
+    db = connect()
+    if db is None:
+        return None
+    pattern = f"%{term}%"
+    try:
+        return db.execute(
+            "SELECT name, version, repo, description FROM packages WHERE name LIKE ? OR description LIKE ? "
+            "ORDER BY name NOT LIKE ?, repo = 'aur', length(name), name LIMIT ?",
+            (pattern, pattern, pattern, limit),
+        ).fetchall()
+    finally:
+        db.close()
+
+def index_missing_panel():
+    panel(
+        "[bold yellow]Indeks pakietów nie został jeszcze zbudowany[/bold yellow]\n"
+        "[yellow]Użyj 'isolator index update' (z --aur, aby dołączyć listę pakietów AUR).[/yellow]",
+        "yellow",
+        "on #2d2a1a"
+    )
+
+def search_command(term):
+    from manifest import packages
+    rows = search(term)
+    if rows is None:
+        index_missing_panel()
+        return
+    if not rows:
+        say(f"Brak pakietów pasujących do '{term}'\n", "bold yellow")
+        return
+    installed = packages()
+    if PLAIN:
+        # Tab separated: package, version, repository, installed, description
+        print("\n".join("\t".join([name, version or "?", repo, "tak" if name in installed else "nie", description or ""]) for name, version, repo, description in rows))
+        main_logger.info(f"Searched the package index for {term}: {len(rows)} results")
+        return
+    from rich.table import Table
+    from rich.box import ROUNDED
+    table = Table(
+        title=f"Wyniki wyszukiwania: {term}",
+        title_style="bold color(201) on #1a2525",
+        show_lines=True,
+        border_style="bright_cyan",
+        header_style="bold white on #2d3b3b",
+        padding=(0, 1),
+        box=ROUNDED
+    )
+    table.add_column("Pakiet", style="cyan", width=25)
+    table.add_column("Wersja", style="white")
+    table.add_column("Źródło", style="magenta")
+    table.add_column("Opis", style="green")
+    for name, version, repo, description in rows:
+        table.add_row(f"{name} [green](zainstalowany)[/green]" if name in installed else name, version or "?", repo, description or "")
+    panel(table, "cyan")
+    main_logger.info(f"Searched the package index for {term}: {len(rows)} results")
+
+def index_command(action, path=None, aur=False):
+    """index update [--aur] | status | export <file> | import <file>"""
+    try:
+        if action == "update":
+            from base import ensure_base_image, sync_database
+            with spinner("Aktualizacja indeksu pakietów..."):
+                ensure_base_image()
+                sync_database()
+                if aur:
+                    fetch_aur_metadata()
+                count = build_index()
+            say(f"Indeks pakietów zaktualizowany: {count} pakietów\n")
+        elif action == "export":
+            if not INDEX_FILE.exists():
+                index_missing_panel()
+                return
+            shutil.copyfile(INDEX_FILE, path)
+            say(f"Zapisano migawkę indeksu w {path}\n")
+        elif action == "import":
+            # Refuse anything that is not an index before it replaces the current one
+            with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as db:
+                db.execute("SELECT COUNT(*) FROM packages").fetchone()
+            ensure_dirs(INDEX_FILE.parent)
+            tmp = INDEX_FILE.with_name(f".{INDEX_FILE.name}.import")
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, INDEX_FILE)
+            # The snapshot's signature is the exporter's: the next refresh rebuilds from the local sync databases
+            store_aur_rows(INDEX_FILE)
+            say(f"Wczytano migawkę indeksu z {path}\n")
+        else:
+            db = connect()
+            if db is None:
+                index_missing_panel()
+                return
+            with db:
+                count = db.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+                built_at = float(meta(db, "built_at", "0"))
+                aur_count = int(meta(db, "aur", "0"))
+            db.close()
+            panel(
+                f"[bold cyan]Pakiety w indeksie: {count}[/bold cyan]\n"
+                f"[white]W tym z AUR: {aur_count if aur_count else 'brak (isolator index update --aur)'}[/white]\n"
+                f"[white]Zbudowany: {time.strftime('%Y-%m-%d %H:%M', time.localtime(built_at))}[/white]",
+                "cyan"
+            )
+        main_logger.info(f"Index {action} done")
+    except (subprocess.CalledProcessError, OSError, sqlite3.Error) as e:
+        main_logger.error(f"Index {action} error: {str(e)}")
+        error_panel(f"Błąd indeksu pakietów: {str(e)}", "Sprawdź połączenie sieciowe, konfigurację podman lub plik migawki.")
+        sys.exit(1)
@@ -1,8 +1,13 @@
+import os
 import sys
-from config import console
-from ui import print_header, show_help
-from container import create_container_image, run_container, remove_package, update_all, list_packages
+import traceback
+from config import CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS, BUILD_ENGINE, SQUASH
+from ui import print_header, show_help, say, error_panel, usage_error
 from logger import main_logger
+from locks import LockTimeout
+
+# Command modules are imported in their branch: `run` and `list` must not pay for
+# the install machinery (rich.progress, the stage scheduler, the podman API client)
 
 def main():
     print_header()
@@ -14,72 +19,226 @@ def main():
     command = sys.argv[1]
     try:
         if command == "install":
-            if len(sys.argv) != 3:
-                console.print(Panel(
-                    "[bold red]Błąd: Użycie: isolator install <pakiet>[/bold red]\n"
-                    "[red]Przykład: isolator install pakiet[/red]",
-                    border_style="red",
-                    padding=(1, 2),
-                    style="on #2d1a1a",
-                    box=ROUNDED
-                ))
+            args = sys.argv[2:]
+            engine = BUILD_ENGINE
+            jobs = None
+            squash = SQUASH
+            wanted = {}
+            valid = True
+            while args and args[0].startswith("-") and args[0] != "--resume":
+                flag = args.pop(0)
+                if flag == "--squash":
+                    squash = True
+                    continue
+                value = args.pop(0) if args else None
+                if flag == "--engine" and value in ["container", "containerfile"]:
+                    engine = value
+                elif flag in ["--jobs", "-j"] and value and value.isdigit() and int(value) >= 1:
+                    jobs = int(value)
+                elif flag == "--from" and value and os.path.isfile(value):
+                    from manifest import read_package_list
+                    wanted.update(read_package_list(value))
+                else:
+                    valid = False
+                    break
+            if valid and args == ["--resume"] and not wanted:
+                from container import resume_installs
+                resume_installs()
+                return
+            if not valid or "--resume" in args or not (args or wanted):
+                usage_error("isolator install [--engine container|containerfile] [--jobs N] [--squash] [--from PLIK] <pakiet>... | --resume", "isolator install --jobs 4 firefox gimp vlc")
                 main_logger.error("Invalid install command usage")
                 return
-            create_container_image(sys.argv[2])
+            if len(args) == 1 and not wanted:
+                from container import create_container_image
+                create_container_image(args[0], engine=engine, squash=squash)
+                return
+            wanted.update({name: None for name in args if name not in wanted})
+            from container import install_batch
+            install_batch(wanted, jobs, engine=engine, squash=squash)
         elif command == "run":
-            if len(sys.argv) != 3:
-                console.print(Panel(
-                    "[bold red]Błąd: Użycie: isolator run <pakiet>[/bold red]\n"
-                    "[red]Przykład: isolator run pakiet[/red]",
-                    border_style="red",
-                    padding=(1, 2),
-                    style="on #2d1a1a",
-                    box=ROUNDED
-                ))
+            detach = any(arg in ["--detach", "-d"] for arg in sys.argv[2:]) or os.environ.get("ISOLATOR_DETACH") == "1"
+            warm = "--warm" in sys.argv[2:] or (os.environ.get("ISOLATOR_WARM") == "1" and not detach)
+            args = [arg for arg in sys.argv[2:] if arg not in ["--warm", "--detach", "-d"]]
+            if len(args) != 1 or (warm and detach):
+                usage_error("isolator run [--warm | --detach] <pakiet>", "isolator run --detach pakiet")
                 main_logger.error("Invalid run command usage")
                 return
-            run_container(sys.argv[2])
+            from apps import run_container
+            run_container(args[0], warm=warm, detach=detach)
+        elif command == "ps":
+            if len(sys.argv) != 2:
+                usage_error("isolator ps", "isolator ps")
+                main_logger.error("Invalid ps command usage")
+                return
+            from detached import ps_command
+            ps_command()
+        elif command == "logs":
+            args = sys.argv[2:]
+            follow = False
+            lines = 50
+            valid = True
+            while args and args[0].startswith("-"):
+                flag = args.pop(0)
+                if flag in ["-f", "--follow"]:
+                    follow = True
+                elif flag in ["-n", "--lines"] and args and args[0].isdigit():
+                    lines = int(args.pop(0))
+                else:
+                    valid = False
+                    break
+            if not valid or len(args) != 1:
+                usage_error("isolator logs [-f] [-n N] <pakiet>", "isolator logs -f pakiet")
+                main_logger.error("Invalid logs command usage")
+                return
+            from detached import logs_command
+            logs_command(args[0], follow=follow, lines=lines)
+        elif command == "stop":
+            if len(sys.argv) != 3:
+                usage_error("isolator stop <pakiet|--idle>", "isolator stop pakiet")
+                main_logger.error("Invalid stop command usage")
+                return
+            from apps import stop_package
+            stop_package(sys.argv[2])
         elif command == "remove":
             if len(sys.argv) != 3:
-                console.print(Panel(
-                    "[bold red]Błąd: Użycie: isolator remove <pakiet>[/bold red]\n"
-                    "[red]Przykład: isolator remove pakiet[/red]",
-                    border_style="red",
-                    padding=(1, 2),
-                    style="on #2d1a1a",
-                    box=ROUNDED
-                ))
+                usage_error("isolator remove <pakiet>", "isolator remove pakiet")
                 main_logger.error("Invalid remove command usage")
                 return
+            from container import remove_package
             remove_package(sys.argv[2])
         elif command == "update-all":
-            update_all()
+            jobs = None
+            if len(sys.argv) > 2:
+                if len(sys.argv) != 4 or sys.argv[2] not in ["--jobs", "-j"] or not sys.argv[3].isdigit() or int(sys.argv[3]) < 1:
+                    usage_error("isolator update-all [--jobs N]", "isolator update-all --jobs 4")
+                    main_logger.error("Invalid update-all command usage")
+                    return
+                jobs = int(sys.argv[3])
+            from container import update_all
+            update_all(jobs)
+        elif command == "bundle":
+            args = sys.argv[2:]
+            if not (args == ["list"] or (len(args) >= 3 and args[0] in ["add", "remove"])):
+                usage_error("isolator bundle <add|remove> <zestaw> <pakiet>... | bundle list", "isolator bundle add qt-apps kate okular")
+                main_logger.error("Invalid bundle command usage")
+                return
+            if args[0] == "list":
+                from bundles import list_bundles
+                list_bundles()
+            elif args[0] == "add":
+                from bundles import add_to_bundle
+                add_to_bundle(args[1], args[2:])
+            else:
+                from bundles import remove_from_bundle
+                remove_from_bundle(args[1], args[2:])
+        elif command == "update-daemon":
+            if sys.argv[2:] not in ([], ["--once"], ["install"], ["uninstall"], ["status"]):
+                usage_error("isolator update-daemon [--once | install | uninstall | status]", "isolator update-daemon install")
+                main_logger.error("Invalid update-daemon command usage")
+                return
+            from updater import update_daemon_command
+            update_daemon_command(sys.argv[2] if len(sys.argv) > 2 else None)
         elif command == "list":
+            from apps import list_packages
             list_packages()
+        elif command == "reindex":
+            from container import reindex_packages
+            reindex_packages()
+        elif command == "search":
+            if len(sys.argv) != 3:
+                usage_error("isolator search <fraza>", "isolator search firefox")
+                main_logger.error("Invalid search command usage")
+                return
+            from index import search_command
+            search_command(sys.argv[2])
+        elif command == "index":
+            args = sys.argv[2:]
+            if not (args in (["update"], ["update", "--aur"], ["status"]) or (len(args) == 2 and args[0] in ["export", "import"])):
+                usage_error("isolator index <update [--aur]|status|export <plik>|import <plik>>", "isolator index update --aur")
+                main_logger.error("Invalid index command usage")
+                return
+            from index import index_command
+            index_command(args[0], path=args[1] if args[0] in ["export", "import"] else None, aur="--aur" in args)
+        elif command == "stats":
+            from telemetry import show_stats
+            show_stats()
+        elif command == "export":
+            args = sys.argv[2:]
+            target = "isolator-export.tar.zst"
+            flags = set()
+            valid = True
+            while args and args[0].startswith("-"):
+                flag = args.pop(0)
+                if flag in ["--thin", "--base"]:
+                    flags.add(flag)
+                elif flag in ["-o", "--output"] and args:
+                    target = args.pop(0)
+                else:
+                    valid = False
+                    break
+            if not valid or not (args or "--base" in flags):
+                usage_error("isolator export [--thin] [--base] [-o PLIK.tar.zst|KATALOG/] <pakiet>...", "isolator export -o aplikacje.tar.zst firefox gimp")
+                main_logger.error("Invalid export command usage")
+                return
+            from archive import export_command
+            export_command(args, target, thin="--thin" in flags, with_base="--base" in flags)
+        elif command == "import":
+            if len(sys.argv) < 3:
+                usage_error("isolator import <plik.tar.zst|katalog> [pakiet...]", "isolator import aplikacje.tar.zst")
+                main_logger.error("Invalid import command usage")
+                return
+            from archive import import_command
+            import_command(sys.argv[2], sys.argv[3:] or None)
+        elif command == "du":
+            from storage import du_command
+            du_command()
+        elif command == "gc":
+            if sys.argv[2:] not in ([], ["--dry-run"]):
+                usage_error("isolator gc [--dry-run]", "isolator gc --dry-run")
+                main_logger.error("Invalid gc command usage")
+                return
+            from storage import gc_command
+            gc_command(dry_run="--dry-run" in sys.argv)
+        elif command == "cache":
+            args = sys.argv[3:]
+            limits = {"--max-size": CACHE_MAX_SIZE_MB, "--max-age": CACHE_MAX_AGE_DAYS}
+            valid = len(sys.argv) >= 3 and sys.argv[2] == "prune" and len(args) % 2 == 0
+            for flag, value in zip(args[::2], args[1::2]):
+                if flag not in limits or not value.isdigit():
+                    valid = False
+                    break
+                limits[flag] = int(value)
+            if not valid:
+                usage_error("isolator cache prune [--max-size MB] [--max-age DNI]", "isolator cache prune --max-size 2048 --max-age 14")
+                main_logger.error("Invalid cache command usage")
+                return
+            from cache import prune_cache_command
+            prune_cache_command(limits["--max-size"], limits["--max-age"])
+        elif command == "base":
+            if len(sys.argv) != 3 or sys.argv[2] not in ["refresh", "status"]:
+                usage_error("isolator base <refresh|status>", "isolator base refresh")
+                main_logger.error("Invalid base command usage")
+                return
+            from base import refresh_base, show_base_status
+            if sys.argv[2] == "refresh":
+                refresh_base()
+            else:
+                show_base_status()
         else:
-            console.print(Panel(
-                "[bold red]Nieznana komenda[/bold red]\n"
-                "[red]Użyj 'isolator help' lub 'isolator ?' po listę komend.[/red]",
-                border_style="red",
-                padding=(1, 2),
-                style="on #2d1a1a",
-                box=ROUNDED
-            ))
+            error_panel("Nieznana komenda", "Użyj 'isolator help' lub 'isolator ?' po listę komend.")
             main_logger.error(f"Unknown command: {command}")
-            console.print("\n")
+            say("\n", "white")
+    except LockTimeout as e:
+        main_logger.error(f"Lock timeout: {str(e)}")
+        error_panel(f"Błąd: {str(e)}", "Poczekaj, aż tamten proces się zakończy, lub zwiększ ISOLATOR_LOCK_TIMEOUT.")
+        sys.exit(1)
     except Exception as e:
         main_logger.error(f"Unexpected error: {str(e)}")
-        console.print(Panel(
-            f"[bold red]Nieoczekiwany błąd: {str(e)}[/bold red]\n"
-            f"[red]Spróbuj ponownie lub sprawdź konfigurację systemu.[/red]",
-            border_style="red",
-            padding=(1, 2),
-            style="on #2d1a1a",
-            box=ROUNDED
-        ))
+        error_panel(f"Nieoczekiwany błąd: {str(e)}", "Spróbuj ponownie lub sprawdź konfigurację systemu.")
         if os.environ.get("DEBUG"):
-            console.print("[red]Szczegóły błędu:[/red]")
-            console.print(traceback.format_exc())
+            say("Szczegóły błędu:", "red")
+            say(traceback.format_exc(), "red")
         sys.exit(1)
     main_logger.info("Ending isolator script")
 
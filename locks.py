@@ -0,0 +1,154 @@
+import fcntl
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from config import LOCK_DIR, LOCK_TIMEOUT, STORE_LOCK_TIMEOUT, ensure_dirs
+from logger import main_logger
+
+# Locks between isolator processes: flock on LOCK_DIR/<name>.lock, which the kernel drops when
+# the holder dies. Each file also names its holder, for messages and for stale-lock detection.
+POLL_INTERVAL = 0.1
+# A dead holder's file untouched for this long is stale; a new holder rewrites it right after flock
+STALE_AFTER = 1.0
+
+class LockTimeout(Exception):
+    """Another process held a lock for longer than the caller was willing to wait"""
+
+    def __init__(self, name, holder):
+        self.name = name
+        self.holder = holder
+        who = f" (PID {holder['pid']}: {holder.get('command', '?')}, od {time.strftime('%H:%M:%S', time.localtime(holder.get('since', 0)))})" if holder.get("pid") else ""
+        super().__init__(f"{name} jest używany przez inny proces isolator{who}")
+
+class _Held:
+    def __init__(self):
+        self.rlock = threading.RLock()
+        self.fd = None
+        self.depth = 0
+
+_held = {}
+_held_guard = threading.Lock()
+
+def lock_path(name):
+    return LOCK_DIR / f"{name}.lock"
+
+def read_holder(path):
+    try:
+        return json.loads(path.read_text() or "{}")
+    except (OSError, ValueError):
+        return {}
+
+def holder_alive(holder):
+    """False only when the holder is known to be a dead process on this host"""
+    if not holder.get("pid") or holder.get("host") != socket.gethostname():
+        return True
+    try:
+        os.kill(holder["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def is_stale(path, holder):
+    try:
+        untouched = time.time() - path.stat().st_mtime > STALE_AFTER
+    except FileNotFoundError:
+        return False
+    return untouched and not holder_alive(holder)
+
+def _acquire_file(name, deadline):
+    path = lock_path(name)
+    ensure_dirs(LOCK_DIR)
+    waiting = False
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            holder = read_holder(path)
+            if is_stale(path, holder):
+                # The isolator that took it is gone, yet something it forked still has the file
+                # open. Later lockers move to a fresh file; the orphan keeps the unlinked one.
+                main_logger.warning(f"Breaking stale lock {name} of dead PID {holder.get('pid')}")
+                path.unlink(missing_ok=True)
+                continue
+            if time.monotonic() >= deadline:
+                raise LockTimeout(name, holder)
+            if not waiting:
+                main_logger.info(f"Waiting for lock {name} held by PID {holder.get('pid', '?')}")
+                waiting = True
+            time.sleep(POLL_INTERVAL)
+            continue
+        # A stale-lock break may have replaced the file between our open and flock
+        try:
+            current = os.stat(path).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            current = False
+        if not current:
+            os.close(fd)
+            continue
+        holder = {"pid": os.getpid(), "host": socket.gethostname(), "command": " ".join(["isolator", *sys.argv[1:]]), "since": time.time()}
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps(holder).encode())
+        return fd
+
+@contextmanager
+def lock(name, timeout=LOCK_TIMEOUT):
+    """Hold the named lock against other processes, waiting up to timeout seconds.
+    Re-entrant within a process; threads of one process take turns on it."""
+    with _held_guard:
+        held = _held.setdefault(name, _Held())
+    deadline = time.monotonic() + timeout
+    if not held.rlock.acquire(timeout=max(timeout, 0)):
+        raise LockTimeout(name, {})
+    try:
+        if held.depth == 0:
+            held.fd = _acquire_file(name, deadline)
+        held.depth += 1
+        try:
+            yield
+        finally:
+            held.depth -= 1
+            if held.depth == 0:
+                os.ftruncate(held.fd, 0)
+                fcntl.flock(held.fd, fcntl.LOCK_UN)
+                os.close(held.fd)
+                held.fd = None
+    finally:
+        held.rlock.release()
+
+def package_lock(pkg, timeout=LOCK_TIMEOUT):
+    """Held while a package's image, checkpoint, launchers or temp containers are being changed"""
+    return lock(f"pkg-{pkg}", timeout)
+
+def base_lock(timeout=LOCK_TIMEOUT):
+    """Held while the shared base images are checked and rebuilt"""
+    return lock("base", timeout)
+
+def store_lock(timeout=STORE_LOCK_TIMEOUT):
+    """Held for a read-modify-write of the manifest"""
+    return lock("store", timeout)
+
+def locked_elsewhere(name):
+    """Whether another process holds the named lock right now"""
+    held = _held.get(name)
+    if held is not None and held.depth:
+        return False
+    try:
+        fd = os.open(lock_path(name), os.O_RDWR | os.O_CLOEXEC)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    except BlockingIOError:
+        return not is_stale(lock_path(name), read_holder(lock_path(name)))
+    finally:
+        os.close(fd)
@@ -1,27 +1,195 @@
+import atexit
+import fcntl
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-from config import MAIN_LOG_FILE, SUBPROCESS_LOG_FILE, MAX_LOG_SIZE, BACKUP_COUNT
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from config import (
+    MAIN_LOG_FILE, SUBPROCESS_LOG_FILE, MAX_LOG_SIZE, BACKUP_COUNT,
+    LOG_FORMAT, TRANSCRIPTS_DIR, TRANSCRIPT_RUNS, TRANSCRIPT_MAX_AGE, LOG_INLINE_LIMIT, ensure_dirs
+)
+
+RUN_ID = uuid.uuid4().hex[:12]  # Correlates log lines, transcripts and spans of one isolator invocation
+
+class RunFilter(logging.Filter):
+    def filter(self, record):
+        record.run = RUN_ID
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "run": getattr(record, "run", RUN_ID),
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+def _gzip_rotator(source, dest):
+    import gzip
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler for a log several isolator processes append to. Rollover happens under
+    an flock on <log>.lock and only if nobody rotated first; a process whose file was rotated
+    underneath it reopens the new one instead of writing into the renamed file."""
+
+    def rotated_elsewhere(self):
+        try:
+            return os.fstat(self.stream.fileno()).st_ino != os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            return True
+
+    def reopen(self):
+        self.stream.close()
+        self.stream = self._open()
+
+    def shouldRollover(self, record):
+        if self.stream is not None and self.rotated_elsewhere():
+            self.reopen()
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        with open(self.baseFilename + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.stream is not None and (self.rotated_elsewhere() or os.path.getsize(self.baseFilename) < self.maxBytes):
+                self.reopen()
+            else:
+                super().doRollover()
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler that opens the log file and starts its listener thread on the first record,
+    so importing the logger creates no directories, files or threads"""
+
+    def __init__(self, log_file):
+        super().__init__(queue.SimpleQueue())
+        self.log_file = log_file
+        self.listener = None
+        self.start_lock = threading.Lock()
+
+    def emit(self, record):
+        if self.listener is None:
+            with self.start_lock:
+                if self.listener is None:
+                    self.listener = QueueListener(self.queue, file_handler(self.log_file))
+                    self.listener.start()
+                    # Drains whatever is still queued before the interpreter exits
+                    atexit.register(self.listener.stop)
+        super().emit(record)
+
+def file_handler(log_file):
+    ensure_dirs(log_file.parent)
+    handler = SharedRotatingFileHandler(log_file, maxBytes=MAX_LOG_SIZE, backupCount=BACKUP_COUNT)
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s - %(name)s - %(run)s - %(levelname)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+    handler.setFormatter(formatter)
+    return handler
 
 def setup_logger(name, log_file, level=logging.INFO):
+    """Logger whose records are handed to a queue and written by a background listener thread,
+    so callers never wait on the disk. Rotated files are gzipped."""
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    handler = RotatingFileHandler(log_file, maxBytes=MAX_LOG_SIZE, backupCount=BACKUP_COUNT)
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    # isolator.subprocess would otherwise also land in the main log through propagation
+    logger.propagate = False
+    queue_handler = LazyQueueHandler(log_file)
+    queue_handler.addFilter(RunFilter())
+    logger.addHandler(queue_handler)
     return logger
 
+def _decode(output):
+    if not output:
+        return ''
+    return output if isinstance(output, str) else output.decode('utf-8', errors='ignore')
+
 def log_subprocess_output(logger, process, context):
-    """Log subprocess output with context"""
-    stdout = process.stdout.decode('utf-8', errors='ignore') if process.stdout else ''
-    stderr = process.stderr.decode('utf-8', errors='ignore') if process.stderr else ''
-    if stdout:
-        logger.info(f"{context} stdout: {stdout}")
-    if stderr:
-        logger.error(f"{context} stderr: {stderr}")
+    """Log subprocess output with context (for streamed commands this is the bounded tail).
+    Output over LOG_INLINE_LIMIT is cut to its end, pointing at the full transcript when there is one."""
+    transcript = getattr(process, "transcript", None)
+    for stream, log in (("stdout", logger.info), ("stderr", logger.error)):
+        text = _decode(getattr(process, stream))
+        if not text:
+            continue
+        if len(text) > LOG_INLINE_LIMIT:
+            where = f"full output in {transcript}" if transcript else "truncated"
+            text = f"[{where}] ...{text[-LOG_INLINE_LIMIT:]}"
+        log(f"{context} {stream}: {text}")
+
+_transcript_dir = None
+_transcript_fd = None
+_transcript_lock = threading.Lock()
+_transcript_count = 0
+
+def transcript_path(context):
+    """A new transcript file in this run's directory, which is created on first use (and again
+    if it went missing); only the newest TRANSCRIPT_RUNS run directories are kept"""
+    global _transcript_dir, _transcript_count
+    with _transcript_lock:
+        if _transcript_dir is None:
+            _transcript_dir = _new_transcript_dir()
+        elif not _transcript_dir.is_dir():
+            _open_transcript_dir(_transcript_dir)
+        _transcript_count += 1
+        slug = "".join(c if c.isalnum() else "-" for c in context.lower()).strip("-")[:60]
+        return _transcript_dir / f"{_transcript_count:03d}-{slug}.log"
+
+def _open_transcript_dir(path):
+    """Create path and hold a shared flock on it for the rest of the run, marking it as in use"""
+    global _transcript_fd
+    path.mkdir(parents=True, exist_ok=True)
+    if _transcript_fd is not None:
+        os.close(_transcript_fd)
+    _transcript_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+    fcntl.flock(_transcript_fd, fcntl.LOCK_SH)
+
+def _in_use(path):
+    """Whether a running isolator still writes into the run directory path; after
+    TRANSCRIPT_MAX_AGE even a held one counts as abandoned"""
+    try:
+        if time.time() - path.stat().st_mtime > TRANSCRIPT_MAX_AGE:
+            return False
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+def _new_transcript_dir():
+    TRANSCRIPTS_DIR.mkdir(parents=True, exist_ok=True)
+    runs = sorted(TRANSCRIPTS_DIR.iterdir(), key=lambda path: path.name)
+    for old in runs[:max(0, len(runs) - TRANSCRIPT_RUNS + 1)]:
+        if not _in_use(old):
+            shutil.rmtree(old, ignore_errors=True)
+    path = TRANSCRIPTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{RUN_ID}"
+    _open_transcript_dir(path)
+    return path
 
 main_logger = setup_logger("isolator", MAIN_LOG_FILE)
 subprocess_logger = setup_logger("isolator.subprocess", SUBPROCESS_LOG_FILE)
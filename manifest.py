@@ -0,0 +1,173 @@
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from config import IMAGES, BIN, DESKTOP_DIR, MANIFEST_FILE
+from logger import main_logger
+from utils import atomic_write_json
+from locks import store_lock
+
+MANIFEST_VERSION = 1
+# podman reports our image tags as e.g. localhost/home/user/.isolator-apps/images/<pkg>.img:latest
+IMAGE_NAME = re.compile(r"/images/([^/:]+)\.img(?::[^/]*)?$")
+# and bundle images, shared by several packages, as .../images/bundles/<bundle>.img:latest
+BUNDLE_NAME = re.compile(r"/images/bundles/([^/:]+)\.img(?::[^/]*)?$")
+# Key of a bundle where it is handled like a package: update-all rows, locks, temp container labels
+BUNDLE_PREFIX = "@"
+
+_lock = threading.Lock()
+_cache = None
+
+def load_manifest(reload=False):
+    """The manifest, read once per process; reload re-reads what other processes may have written"""
+    global _cache
+    if _cache is None or reload:
+        try:
+            with open(MANIFEST_FILE) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {"version": MANIFEST_VERSION, "packages": {}}
+    return _cache
+
+def save_manifest(manifest):
+    global _cache
+    atomic_write_json(MANIFEST_FILE, manifest)
+    _cache = manifest
+
+def packages(reload=False):
+    return load_manifest(reload)["packages"]
+
+def get_package(pkg, reload=False):
+    return load_manifest(reload)["packages"].get(pkg)
+
+def bundles(reload=False):
+    return load_manifest(reload).setdefault("bundles", {})
+
+def get_bundle(name, reload=False):
+    return bundles(reload).get(name)
+
+def bundle_key(name):
+    return f"{BUNDLE_PREFIX}{name}"
+
+def update_units(reload=False):
+    """What an update walks: each standalone package by name and each bundle once, under bundle_key"""
+    units = {name: record for name, record in packages(reload).items() if not record.get("bundle")}
+    units.update({bundle_key(name): record for name, record in bundles().items()})
+    return units
+
+def get_unit(key, reload=False):
+    if key.startswith(BUNDLE_PREFIX):
+        return get_bundle(key[len(BUNDLE_PREFIX):], reload)
+    return get_package(key, reload)
+
+def update_package(pkg, **fields):
+    """Merge fields into pkg's record and persist the manifest"""
+    with _lock, store_lock():
+        manifest = load_manifest(reload=True)
+        record = manifest["packages"].setdefault(pkg, {"created_at": time.time()})
+        record.update(fields)
+        record["updated_at"] = time.time()
+        save_manifest(manifest)
+        return record
+
+def drop_package(pkg):
+    with _lock, store_lock():
+        manifest = load_manifest(reload=True)
+        if manifest["packages"].pop(pkg, None) is not None:
+            save_manifest(manifest)
+
+def update_bundle(name, members=None, **fields):
+    """Merge fields into the bundle's record and into each of its members' records (all share the image);
+    members maps packages to fields of their own, and records them as the bundle's current members"""
+    with _lock, store_lock():
+        manifest = load_manifest(reload=True)
+        now = time.time()
+        record = manifest.setdefault("bundles", {}).setdefault(name, {"created_at": now})
+        record.update(fields, updated_at=now)
+        if members is not None:
+            record["packages"] = sorted(members)
+            for pkg, own in members.items():
+                member = manifest["packages"].setdefault(pkg, {"created_at": now})
+                member.update(own, bundle=name)
+        for pkg in record.get("packages", []):
+            member = manifest["packages"].get(pkg)
+            if member is not None:
+                member.update(fields, updated_at=now)
+        save_manifest(manifest)
+        return record
+
+def drop_bundle(name):
+    with _lock, store_lock():
+        manifest = load_manifest(reload=True)
+        if manifest.setdefault("bundles", {}).pop(name, None) is not None:
+            save_manifest(manifest)
+
+def read_package_list(path):
+    """Packages to provision from a file, as {name: source or None}. Accepts a manifest.json
+    copied from another machine (keeping each package's source) or plain text with one package
+    per line, optionally followed by "repo" or "aur"; # starts a comment."""
+    text = Path(path).read_text()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        records = data.get("packages", {})
+        return {name: record.get("source") if isinstance(record, dict) else None for name, record in records.items()}
+    wanted = {}
+    for line in text.splitlines():
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        wanted[fields[0]] = fields[1] if len(fields) > 1 and fields[1] in ("repo", "aur") else None
+    return wanted
+
+def inspect_image(image):
+    """Image ID, digest and size of a committed image, in manifest field names"""
+    import podman_api as podman  # Not needed by run/list, which only read the manifest
+    info = podman.inspect_image(image)
+    return {"image_id": info.get("Id"), "digest": info.get("Digest"), "size": info.get("Size")}
+
+def bundle_image(name):
+    return IMAGES / "bundles" / f"{name}.img"
+
+def default_artifacts(pkg):
+    return {"run_script": str(BIN / f"run-{pkg}.sh"), "desktop_file": str(DESKTOP_DIR / f"{pkg}.desktop")}
+
+def reindex():
+    """Rebuild the manifest from `podman images`, keeping what podman cannot tell us (version, source)"""
+    import podman_api as podman
+    with _lock, store_lock():
+        manifest = load_manifest(reload=True)
+        old = manifest["packages"]
+        found = {}
+        kept = {}
+        for info in podman.list_images():
+            for name in info.get("Names") or []:
+                match = BUNDLE_NAME.search(name)
+                if match and match.group(1) in manifest.get("bundles", {}):
+                    # podman knows nothing of a bundle's members; their records are kept as they were
+                    bundle = kept[match.group(1)] = dict(manifest["bundles"][match.group(1)], image_id=info.get("Id"), digest=info.get("Digest"), size=info.get("Size"))
+                    for pkg in bundle.get("packages", []):
+                        if pkg in old:
+                            found[pkg] = dict(old[pkg], image_id=info.get("Id"), digest=info.get("Digest"), size=info.get("Size"))
+                    continue
+                match = IMAGE_NAME.search(name)
+                if not match:
+                    continue
+                pkg = match.group(1)
+                record = dict(old.get(pkg, {}))
+                record.setdefault("created_at", info.get("Created", time.time()))
+                record.setdefault("updated_at", record["created_at"])
+                record.update({
+                    "image": str(IMAGES / f"{pkg}.img"),
+                    "image_id": info.get("Id"),
+                    "digest": info.get("Digest"),
+                    "size": info.get("Size"),
+                    "artifacts": {key: path for key, path in default_artifacts(pkg).items() if Path(path).exists()},
+                })
+                found[pkg] = record
+        save_manifest({"version": MANIFEST_VERSION, "packages": found, "bundles": kept})
+    main_logger.info(f"Reindexed manifest: {len(found)} packages")
+    return found
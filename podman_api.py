@@ -0,0 +1,314 @@
+import http.client
+import json
+import os
+import re
+import socket
+import subprocess
+import threading
+import time
+from urllib.parse import quote, urlencode
+from logger import main_logger, subprocess_logger
+from runner import run_streaming
+
+API_PREFIX = "/v4.0.0/libpod"
+# Set on every image isolator commits; images built from one (apps on the base, podman build steps)
+# inherit it, so gc can tell isolator's dangling images from the user's other ones
+IMAGE_LABEL = "isolator.image"
+HUMAN_SIZE = re.compile(r"^([\d.]+)\s*([kKMGT]?i?B)$")
+HUMAN_UNITS = {"B": 1, "kB": 1000, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+               "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4}
+
+def socket_path():
+    """Podman service socket: ISOLATOR_PODMAN_SOCKET, CONTAINER_HOST=unix://... or the rootless default"""
+    if os.environ.get("ISOLATOR_PODMAN_SOCKET"):
+        return os.environ["ISOLATOR_PODMAN_SOCKET"]
+    host = os.environ.get("CONTAINER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")
+    return os.path.join(runtime_dir, "podman", "podman.sock")
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+class PodmanClient:
+    """Minimal libpod REST client over a Unix socket. Each thread keeps one keep-alive connection."""
+
+    def __init__(self, path=None, timeout=None):
+        self.path = path or socket_path()
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = UnixHTTPConnection(self.path, timeout=self.timeout)
+        return conn
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    def request(self, method, path, params=None, body=None, stream=False):
+        """Send a request, reconnecting once if the kept-alive connection was closed by the service.
+        Returns the response; unless stream is set the body has been read into response.data."""
+        url = API_PREFIX + path + (f"?{urlencode(params)}" if params else "")
+        headers = {}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        started = time.monotonic()
+        for attempt in range(2):
+            conn = self.connection()
+            try:
+                conn.request(method, url, body=body, headers=headers)
+                response = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if attempt:
+                    raise
+        if not stream:
+            response.data = response.read()
+            subprocess_logger.info(f"API {method} {url} -> {response.status} in {time.monotonic() - started:.3f}s")
+            if response.status >= 400:
+                raise subprocess.CalledProcessError(response.status, ["podman-api", method, url], response.data, response.data)
+        return response
+
+    def json(self, method, path, params=None, body=None):
+        data = self.request(method, path, params, body).data
+        return json.loads(data) if data else None
+
+    def ping(self):
+        return self.request("GET", "/_ping").status == 200
+
+    def stream(self, method, path, params=None, context="", on_line=None):
+        """Read a streamed JSON-lines response (pull, build) record by record"""
+        response = self.request(method, path, params, stream=True)
+        last = {}
+        for raw in iter(response.readline, b""):
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                continue
+            last = record
+            text = (record.get("stream") or record.get("status") or "").rstrip("\n")
+            if text:
+                subprocess_logger.info(f"{context} stdout: {text}")
+                if on_line:
+                    on_line(text, "stdout")
+            if record.get("error"):
+                subprocess_logger.error(f"{context} stderr: {record['error']}")
+                raise subprocess.CalledProcessError(1, ["podman-api", method, path], b"", record["error"].encode())
+        if response.status >= 400:
+            raise subprocess.CalledProcessError(response.status, ["podman-api", method, path], b"", json.dumps(last).encode())
+        return last
+
+_client = None
+_client_lock = threading.Lock()
+
+def client():
+    """The shared API client, or None when the service socket is not usable (CLI fallback)"""
+    global _client
+    if os.environ.get("ISOLATOR_PODMAN_API", "1") == "0":
+        return None
+    with _client_lock:
+        if _client is None:
+            candidate = PodmanClient()
+            try:
+                candidate.ping()
+                _client = candidate
+                main_logger.info(f"Using podman API at {candidate.path}")
+            except (OSError, http.client.HTTPException):
+                _client = False
+                main_logger.info("Podman API socket unavailable, falling back to the CLI")
+        return _client or None
+
+def parse_create_args(args):
+    """Translate the `podman create` arguments used across isolator into a libpod spec"""
+    spec = {"mounts": [], "labels": {}}
+    args = list(args)
+    while args and args[0].startswith("-"):
+        flag = args.pop(0)
+        if flag == "-it":
+            spec["terminal"] = True
+            spec["stdin"] = True
+        elif flag in ("-v", "--volume"):
+            source, destination, *options = args.pop(0).split(":")
+            spec["mounts"].append({"type": "bind", "source": source, "destination": destination, "options": options or ["rw"]})
+        elif flag == "--label":
+            key, _, value = args.pop(0).partition("=")
+            spec["labels"][key] = value
+        elif flag == "--name":
+            spec["name"] = args.pop(0)
+        elif flag == "--cpus":
+            period = 100000
+            spec["resource_limits"] = {"cpu": {"quota": int(float(args.pop(0)) * period), "period": period}}
+        else:
+            raise ValueError(f"Unsupported create flag for the podman API: {flag}")
+    spec["image"] = args[0]
+    spec["command"] = args[1:]
+    return spec
+
+# Operations below go through the API when available and fall back to the CLI otherwise.
+
+def pull(image, context, on_line=None):
+    api = client()
+    if api:
+        return api.stream("POST", "/images/pull", {"reference": image}, context, on_line)
+    return run_streaming(["podman", "pull", image], context, check=True, on_line=on_line)
+
+def create(args, context):
+    """Create a container from `podman create` style args; returns its ID"""
+    api = client()
+    if api:
+        return api.json("POST", "/containers/create", body=parse_create_args(args))["Id"]
+    output = subprocess.check_output(["podman", "create", *args], stderr=subprocess.STDOUT)
+    subprocess_logger.info(f"{context} stdout: {output.decode()}")
+    return output.decode().strip()
+
+def commit(cid, image, context, squash=False):
+    """Commit cid as image, labelled as isolator's; squash flattens it, base layers included, into a single layer"""
+    api = client()
+    if api:
+        repo, _, tag = str(image).partition(":")
+        params = {"container": cid, "repo": repo, "tag": tag or "latest", "changes": f"LABEL {IMAGE_LABEL}=1"}
+        if squash:
+            params["squash"] = "true"
+        return api.json("POST", "/commit", params)
+    return run_streaming(["podman", "commit", "--change", f"LABEL {IMAGE_LABEL}=1", *(["--squash"] if squash else []), cid, str(image)], context, check=True)
+
+def remove_container(cid, context, force=True, check=False):
+    api = client()
+    if api:
+        try:
+            return api.request("DELETE", f"/containers/{quote(cid, safe='')}", {"force": str(force).lower()})
+        except subprocess.CalledProcessError:
+            if check:
+                raise
+            return None
+    return run_streaming(["podman", "rm", *(["-f"] if force else []), cid], context, check=check)
+
+def remove_image(image, context, check=True):
+    api = client()
+    if api:
+        try:
+            return api.request("DELETE", f"/images/{quote(str(image), safe='')}")
+        except subprocess.CalledProcessError:
+            if check:
+                raise
+            return None
+    return run_streaming(["podman", "rmi", str(image)], context, check=check)
+
+def disk_usage():
+    """Bytes of image layers plus container writable layers, as `podman system df` counts them"""
+    api = client()
+    if api:
+        report = api.json("GET", "/system/df") or {}
+        return (report.get("LayersSize") or 0) + sum(info.get("RWSize") or 0 for info in report.get("Containers") or [])
+    report = json.loads(subprocess.check_output(["podman", "system", "df", "--format", "json"]) or b"[]")
+    return sum(entry.get("RawSize") or 0 for entry in report if entry.get("Type") in ("Images", "Containers"))
+
+def tag(image, name, context):
+    """Add name to image (a tag or ID)"""
+    api = client()
+    if api:
+        repo, _, version = str(name).partition(":")
+        return api.request("POST", f"/images/{quote(str(image), safe='')}/tag", {"repo": repo, "tag": version or "latest"})
+    return run_streaming(["podman", "tag", str(image), str(name)], context, check=True)
+
+def image_exists(image):
+    api = client()
+    if api:
+        try:
+            return api.request("GET", f"/images/{quote(str(image), safe='')}/exists").status == 204
+        except subprocess.CalledProcessError:
+            return False
+    return subprocess.run(["podman", "image", "exists", str(image)], capture_output=True).returncode == 0
+
+def container_exists(cid):
+    api = client()
+    if api:
+        try:
+            return api.request("GET", f"/containers/{quote(cid, safe='')}/exists").status == 204
+        except subprocess.CalledProcessError:
+            return False
+    return subprocess.run(["podman", "container", "exists", cid], capture_output=True).returncode == 0
+
+def inspect_image(image):
+    api = client()
+    if api:
+        return api.json("GET", f"/images/{quote(str(image), safe='')}/json")
+    return json.loads(subprocess.check_output(["podman", "image", "inspect", "--format", "json", str(image)]))[0]
+
+def inspect_images(images):
+    """inspect_image for many images: one CLI call for all of them, or one keep-alive request each over the API"""
+    images = [str(image) for image in images]
+    if not images:
+        return []
+    api = client()
+    if api:
+        return [api.json("GET", f"/images/{quote(image, safe='')}/json") for image in images]
+    return json.loads(subprocess.check_output(["podman", "image", "inspect", "--format", "json", *images]))
+
+def list_images(dangling=False, intermediate=False):
+    """Tagged images; dangling lists only the untagged ones, intermediate adds build steps' images"""
+    api = client()
+    if api:
+        params = {"all": "true"} if intermediate else {}
+        if dangling:
+            params["filters"] = json.dumps({"dangling": ["true"]})
+        return api.json("GET", "/images/json", params or None) or []
+    filters = (["-a"] if intermediate else []) + (["--filter", "dangling=true"] if dangling else [])
+    return json.loads(subprocess.check_output(["podman", "images", *filters, "--format", "json"]) or b"[]")
+
+def running_images():
+    """IDs and names of the images behind running or paused containers (a paused warm container
+    still holds its image). Without all, podman lists running ones only."""
+    api = client()
+    if api:
+        found = api.json("GET", "/containers/json", {"all": "true"}) or []
+    else:
+        found = json.loads(subprocess.check_output(["podman", "ps", "-a", "--format", "json"]) or b"[]")
+    return {ref for info in found if str(info.get("State", "")).strip().lower() in ("running", "paused")
+            for ref in (info.get("ImageID"), info.get("Image")) if ref}
+
+def list_containers(label):
+    """All containers (running or not) carrying label, as dicts with Id, State and Labels"""
+    api = client()
+    if api:
+        found = api.json("GET", "/containers/json", {"all": "true", "filters": json.dumps({"label": [label]})}) or []
+    else:
+        found = json.loads(subprocess.check_output(["podman", "ps", "-a", "--filter", f"label={label}", "--format", "json"]) or b"[]")
+    return [{"Id": info["Id"], "State": info.get("State", ""), "Labels": info.get("Labels") or {}} for info in found]
+
+def parse_size(text):
+    """Bytes from the CLI's human readable sizes ("1.79MB"); 0 when unreadable"""
+    match = HUMAN_SIZE.match(text.strip())
+    return int(float(match.group(1)) * HUMAN_UNITS.get(match.group(2), 1)) if match else 0
+
+def stats(cids):
+    """One stats sample for all of cids: {cid: {"cpu": percent, "mem": bytes}}.
+    Fails as a whole when any of them is no longer running."""
+    if not cids:
+        return {}
+    api = client()
+    if api:
+        params = [("containers", cid) for cid in cids] + [("stream", "false")]
+        found = [(info["ContainerID"], info.get("CPU") or 0.0, info.get("MemUsage") or 0) for info in (api.json("GET", "/containers/stats", params) or {}).get("Stats") or []]
+    else:
+        output = subprocess.check_output(["podman", "stats", "--no-stream", "--format", "json", *cids], stderr=subprocess.PIPE)
+        found = [(info["id"], float(info.get("cpu_percent", "0").rstrip("%") or 0), parse_size(info.get("mem_usage", "").split("/")[0]))
+                 for info in json.loads(output or b"[]")]
+    # The CLI reports short IDs, the API full ones
+    return {cid: {"cpu": cpu, "mem": mem} for cid in cids for found_id, cpu, mem in found if cid.startswith(found_id) or found_id.startswith(cid)}
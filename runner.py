@@ -0,0 +1,107 @@
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from logger import subprocess_logger, transcript_path
+
+TAIL_LINES = 200  # Lines of each stream kept in memory for error reporting
+
+PACMAN_TOTAL = re.compile(r"^Packages \((\d+)\)")
+PACMAN_DOWNLOAD = re.compile(r"^\s*\S+ downloading\.\.\.$")
+PACMAN_INSTALL = re.compile(r"^\((\s*\d+)/(\d+)\) (?:installing|upgrading|reinstalling|downgrading) ")
+PACMAN_DOWNLOAD_SIZE = re.compile(r"^Total Download Size:\s+([\d.]+) (B|KiB|MiB|GiB)$")
+SIZE_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+def _pump(pipe, stream, tail, transcript, lock, on_line):
+    for raw in iter(pipe.readline, b""):
+        tail.append(raw)
+        if transcript is not None:
+            with lock:
+                transcript.write(raw if stream == "stdout" else b"[stderr] " + raw)
+        if on_line:
+            on_line(raw.decode("utf-8", errors="ignore").rstrip("\n"), stream)
+    pipe.close()
+
+def run_streaming(args, context, check=False, on_line=None, tail_lines=TAIL_LINES, transcript=True):
+    """Run args, writing stdout/stderr as they arrive to a per-run transcript file
+    (see logger.transcript_path); the subprocess log gets one line per command pointing at it.
+    Only the last tail_lines of each stream are kept, so the returned CompletedProcess
+    (or the raised CalledProcessError) carries a bounded tail rather than the full output,
+    plus the transcript path as .transcript. With transcript=False (an app whose output has
+    no end) only the tail is kept and .transcript is None."""
+    path = transcript_path(context) if transcript else None
+    started = time.monotonic()
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout_tail, stderr_tail = deque(maxlen=tail_lines), deque(maxlen=tail_lines)
+    lock = threading.Lock()
+    with open(path, "wb") if path else nullcontext() as output:
+        if output is not None:
+            output.write(f"$ {' '.join(str(arg) for arg in args)}\n".encode())
+        readers = [
+            threading.Thread(target=_pump, args=(proc.stdout, "stdout", stdout_tail, output, lock, on_line), daemon=True),
+            threading.Thread(target=_pump, args=(proc.stderr, "stderr", stderr_tail, output, lock, on_line), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        returncode = proc.wait()
+        for reader in readers:
+            reader.join()
+    log = subprocess_logger.info if returncode == 0 else subprocess_logger.error
+    log(f"{context}: exit {returncode} after {time.monotonic() - started:.2f}s" + (f", transcript {path}" if path else ""))
+    stdout, stderr = b"".join(stdout_tail), b"".join(stderr_tail)
+    if check and returncode != 0:
+        error = subprocess.CalledProcessError(returncode, args, stdout, stderr)
+        error.transcript = path
+        raise error
+    result = subprocess.CompletedProcess(args, returncode, stdout, stderr)
+    result.transcript = path
+    return result
+
+class PacmanProgress:
+    """Turns pacman's transaction output into progress on a task of a progress display (see ui.progress).
+    Each package counts twice: once when downloaded and once when installed.
+    Download counts and sizes are kept for the stage's span (see fields()); with task None
+    only those are collected."""
+
+    def __init__(self, progress, task):
+        self.progress = progress
+        self.task = task
+        self.lock = threading.Lock()
+        self.packages = 0
+        self.downloaded = 0
+        self.installed = 0
+        self.fetched = 0
+        self.download_bytes = 0
+
+    def fields(self):
+        """Span fields: packages in the transaction, how many were not in the cache, bytes downloaded"""
+        with self.lock:
+            return {"packages": self.packages, "downloaded": self.fetched, "bytes_downloaded": self.download_bytes}
+
+    def __call__(self, line, stream):
+        with self.lock:
+            match = PACMAN_TOTAL.match(line)
+            if match:
+                self.packages = int(match.group(1))
+                if self.task is not None:
+                    self.progress.update(self.task, total=self.packages * 2, completed=0)
+                return
+            match = PACMAN_DOWNLOAD_SIZE.match(line)
+            if match:
+                self.download_bytes = int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+                return
+            if PACMAN_DOWNLOAD.match(line):
+                self.fetched += 1
+                self.downloaded = min(self.downloaded + 1, self.packages or self.downloaded + 1)
+            else:
+                match = PACMAN_INSTALL.match(line)
+                if not match:
+                    return
+                self.installed = int(match.group(1))
+                self.packages = self.packages or int(match.group(2))
+                # Installation starts only after every download has finished (or came from cache)
+                self.downloaded = self.packages
+            if self.packages and self.task is not None:
+                self.progress.update(self.task, completed=self.downloaded + self.installed)
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+from logger import main_logger
+from telemetry import span
+from ui import say
+
+class Stage:
+    """One node of a flow. func(stage) runs in a worker thread once every stage in deps has
+    finished or been skipped; its return value ends up in stage.result.
+    Each run is recorded as a span; func may add to stage.fields (bytes, cache hits, ...)."""
+
+    def __init__(self, name, func, deps=(), weight=0, label=None, color="cyan", skip=False, task=None, package=None):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.weight = weight
+        self.label = label or name
+        self.color = color
+        self.skip = skip
+        self.task = task  # rich task for the stage, set by the reporter or up front
+        self.package = package
+        self.fields = {}
+        self.state = "pending"
+        self.result = None
+        self.error = None
+
+class Scheduler:
+    """Runs a dependency graph of stages on asyncio, independent stages concurrently.
+
+    on_event(kind, stage) is called from the event loop thread with kind one of
+    started / finished / skipped / failed / blocked / cancelled.
+    With fail_fast the first failure cancels the rest; otherwise only its dependents are blocked.
+    Cleanups registered with add_cleanup run, newest first, when the flow fails or is cancelled,
+    once the worker threads of cancelled stages have returned."""
+
+    def __init__(self, stages, on_event=None, limit=None, fail_fast=True, flow=None):
+        self.flow = flow
+        self.stages = {stage.name: stage for stage in stages}
+        self.on_event = on_event or (lambda kind, stage: None)
+        self.limit = limit
+        self.fail_fast = fail_fast
+        self.cleanups = []
+        self.cleaned_up = False
+        self.cleanup_lock = threading.Lock()
+        self.workers = set()
+
+    def add_cleanup(self, func):
+        """Register func to undo a stage's work; after the cleanups have run it runs right away"""
+        with self.cleanup_lock:
+            if not self.cleaned_up:
+                self.cleanups.append(func)
+                return func
+        self.run_cleanup(func)
+        return func
+
+    def discard_cleanup(self, func):
+        with self.cleanup_lock:
+            if func in self.cleanups:
+                self.cleanups.remove(func)
+
+    def run_cleanup(self, func):
+        try:
+            func()
+        except Exception as e:
+            main_logger.error(f"Cleanup {getattr(func, '__name__', func)} failed: {str(e)}")
+
+    def run_cleanups(self):
+        with self.cleanup_lock:
+            cleanups, self.cleanups = self.cleanups[::-1], []
+            self.cleaned_up = True
+        for func in cleanups:
+            self.run_cleanup(func)
+
+    async def drain(self):
+        """Wait for the threads of cancelled stages: cancelling the task does not stop its thread"""
+        if self.workers:
+            await asyncio.wait(set(self.workers))
+
+    def emit(self, kind, stage):
+        stage.state = kind
+        self.on_event(kind, stage)
+
+    async def run_stage(self, stage, semaphore):
+        async with semaphore:
+            self.emit("started", stage)
+            main_logger.info(f"Stage {stage.name} started")
+            # Per-package stages (update:<pkg>) are aggregated under their common name
+            with span(stage.package, stage.name.partition(":")[0], self.flow, stage.fields):
+                # Shielded, so a cancelled stage's thread can still be waited for (see drain)
+                work = asyncio.ensure_future(asyncio.to_thread(stage.func, stage))
+                self.workers.add(work)
+                work.add_done_callback(self.workers.discard)
+                return await asyncio.shield(work)
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.limit or len(self.stages) or 1)
+        pending = dict(self.stages)
+        running = {}
+        failure = None
+        try:
+            while pending or running:
+                for stage in list(pending.values()):
+                    deps = [self.stages[dep] for dep in stage.deps]
+                    if any(dep.state in ("failed", "blocked", "cancelled") for dep in deps):
+                        del pending[stage.name]
+                        self.emit("blocked", stage)
+                    elif all(dep.state in ("finished", "skipped") for dep in deps):
+                        del pending[stage.name]
+                        if stage.skip:
+                            self.emit("skipped", stage)
+                        else:
+                            running[asyncio.create_task(self.run_stage(stage, semaphore))] = stage
+                if not running:
+                    # Everything left waits on a stage that is itself pending: nothing can progress
+                    for stage in pending.values():
+                        self.emit("blocked", stage)
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    if task.exception() is None:
+                        stage.result = task.result()
+                        main_logger.info(f"Stage {stage.name} finished")
+                        self.emit("finished", stage)
+                        continue
+                    stage.error = task.exception()
+                    main_logger.error(f"Stage {stage.name} failed: {str(stage.error)}")
+                    self.emit("failed", stage)
+                    if self.fail_fast and failure is None:
+                        failure = stage.error
+                if failure is not None:
+                    for task, stage in running.items():
+                        task.cancel()
+                        self.emit("cancelled", stage)
+                    running = {}
+                    for stage in pending.values():
+                        self.emit("blocked", stage)
+                    pending = {}
+                    await self.drain()
+        except asyncio.CancelledError:
+            for task, stage in running.items():
+                task.cancel()
+                self.emit("cancelled", stage)
+            await self.drain()
+            self.run_cleanups()
+            raise
+        if failure is not None or any(stage.state == "failed" for stage in self.stages.values()):
+            self.run_cleanups()
+        if failure is not None:
+            raise failure
+        return self
+
+def run_stages(stages, on_event=None, limit=None, fail_fast=True, flow=None, package=None):
+    """Run stages to completion on a fresh event loop; returns the scheduler for inspecting results.
+    Stage funcs may call stage.scheduler.add_cleanup to undo their work if the flow fails.
+    flow and package label the recorded spans; package applies to stages without their own."""
+    scheduler = Scheduler(stages, on_event, limit, fail_fast, flow)
+    for stage in stages:
+        stage.scheduler = scheduler
+        stage.package = stage.package or package
+    return asyncio.run(scheduler.run())
+
+class StageProgress:
+    """Drives a progress display (see ui.progress) from stage events: a row per running stage, weights on the main bar"""
+
+    def __init__(self, progress, main_task):
+        self.progress = progress
+        self.main_task = main_task
+
+    def __call__(self, kind, stage):
+        if kind == "started":
+            stage.task = self.progress.add_task(stage.label, total=None, style=stage.color)
+            say(f">> {stage.label}...", f"bold {stage.color}")
+        elif kind in ("finished", "skipped"):
+            self.progress.update(self.main_task, advance=stage.weight)
+        if kind in ("finished", "failed", "cancelled") and stage.task is not None:
+            self.progress.remove_task(stage.task)
+            stage.task = None
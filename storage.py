@@ -0,0 +1,232 @@
+import subprocess
+import sys
+import json
+from config import BASE_IMAGE, AUR_BASE_IMAGE, LAYERS_FILE, PLAIN, console
+from logger import main_logger, subprocess_logger, log_subprocess_output
+from utils import atomic_write_json
+import podman_api as podman
+from checkpoint import stale_containers, pending_installs
+from manifest import packages, bundles, bundle_key, IMAGE_NAME, BUNDLE_NAME
+from locks import locked_elsewhere, base_lock
+from base import load_base_state, save_base_state
+from ui import panel, error_panel, spinner
+
+def image_layers():
+    """{image ID: {"layers": [...], "size": bytes, "names": [...]}} for every image, build steps included.
+    One listing, then a single batched inspect of the IDs not in LAYERS_FILE: an ID's layers never change."""
+    try:
+        with open(LAYERS_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    listed = podman.list_images(intermediate=True)
+    missing = [info["Id"] for info in listed if info["Id"] not in cache]
+    for info in podman.inspect_images(missing):
+        cache[info["Id"]] = {"layers": (info.get("RootFS") or {}).get("Layers") or [], "size": info.get("Size") or 0}
+    current = {info["Id"]: cache[info["Id"]] for info in listed if info["Id"] in cache}
+    if missing or len(current) != len(cache):
+        atomic_write_json(LAYERS_FILE, current)
+    main_logger.info(f"Layer metadata for {len(listed)} images, {len(missing)} inspected")
+    return {info["Id"]: dict(current[info["Id"]], names=info.get("Names") or []) for info in listed if info["Id"] in current}
+
+def layer_sizes(images):
+    """Bytes per layer. podman reports only whole-image sizes, so images are walked shortest first and
+    each one's size, less what its lower layers already account for, goes to its top unsized layer."""
+    sizes = {}
+    for info in sorted(images.values(), key=lambda info: len(info["layers"])):
+        unsized = [layer for layer in info["layers"] if layer not in sizes]
+        if unsized:
+            known = sum(sizes[layer] for layer in info["layers"] if layer in sizes)
+            sizes.update(dict.fromkeys(unsized, 0))
+            sizes[unsized[-1]] = max(0, info["size"] - known)
+    return sizes
+
+def short_name(name):
+    """localhost/isolator-base:latest -> isolator-base"""
+    return name.rsplit("/", 1)[-1].partition(":")[0]
+
+def usage_breakdown():
+    """Per installed app: (total, shared with the base images, shared with other apps, unique) in bytes,
+    plus the store-wide (total, base, apps, other) where other is what only unused images hold"""
+    images = image_layers()
+    sizes = layer_sizes(images)
+    base = set()
+    apps = {}
+    installed = set(packages())
+    bundled = bundles()
+    for info in images.values():
+        if any(short_name(name) in (BASE_IMAGE, AUR_BASE_IMAGE) for name in info["names"]):
+            base.update(info["layers"])
+        for match in map(IMAGE_NAME.search, info["names"]):
+            if match and match.group(1) in installed:
+                apps[match.group(1)] = set(info["layers"])
+        # A bundle is one row, named after its members
+        for match in map(BUNDLE_NAME.search, info["names"]):
+            if match and match.group(1) in bundled:
+                apps[f"{match.group(1)} ({', '.join(bundled[match.group(1)].get('packages', []))})"] = set(info["layers"])
+    rows = {}
+    for pkg, layers in apps.items():
+        others = set().union(*(other for name, other in apps.items() if name != pkg))
+        total = sum(sizes[layer] for layer in layers)
+        in_base = sum(sizes[layer] for layer in layers & base)
+        shared = sum(sizes[layer] for layer in (layers & others) - base)
+        rows[pkg] = (total, in_base, shared, total - in_base - shared)
+    app_layers = set().union(*apps.values()) - base
+    store = sum(sizes.values())
+    base_size = sum(sizes[layer] for layer in base)
+    app_size = sum(sizes[layer] for layer in app_layers)
+    return rows, (store, base_size, app_size, store - base_size - app_size)
+
+def mb(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+def du_command():
+    try:
+        rows, (store, base_size, app_size, other) = usage_breakdown()
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"du error: {str(e)}")
+        error_panel(f"Błąd podczas odczytu obrazów: {str(e)}", "Sprawdź konfigurację podman.")
+        sys.exit(1)
+    # Biggest win from a removal first
+    order = sorted(rows, key=lambda pkg: rows[pkg][3], reverse=True)
+    if PLAIN:
+        # Tab separated: package, total, base, shared, unique
+        print("\n".join("\t".join([pkg, *map(mb, rows[pkg])]) for pkg in order))
+        main_logger.info("Displayed disk usage")
+        return
+    from rich.table import Table
+    from rich.box import ROUNDED
+    table = Table(
+        title="Zajętość Dysku",
+        title_style="bold color(201) on #1a2525",
+        show_lines=True,
+        border_style="bright_cyan",
+        header_style="bold white on #2d3b3b",
+        padding=(0, 1),
+        box=ROUNDED
+    )
+    table.add_column("Pakiet", style="cyan", width=25)
+    table.add_column("Razem", style="white", justify="right")
+    table.add_column("Wspólne z bazą", style="blue", justify="right")
+    table.add_column("Wspólne z innymi", style="magenta", justify="right")
+    table.add_column("Unikalne (zwolni usunięcie)", style="yellow", justify="right")
+    for pkg in order:
+        table.add_row(pkg, *map(mb, rows[pkg]))
+    panel(table, "cyan", gap=False)
+    panel(
+        f"[bold cyan]Magazyn podman: {mb(store)}[/bold cyan]\n"
+        f"[white]Obrazy bazowe: {mb(base_size)}, aplikacje: {mb(app_size)}[/white]\n"
+        f"[{'yellow' if other else 'green'}]Nieużywane obrazy i warstwy: {mb(other)}"
+        f"{' (te należące do isolatora odzyska isolator gc)' if other else ''}[/{'yellow' if other else 'green'}]",
+        "cyan"
+    )
+    main_logger.info("Displayed disk usage")
+
+def orphaned_images():
+    """Images tagged as isolator app or bundle images whose package or bundle is neither installed nor being installed"""
+    keep = set(packages()) | set(pending_installs()) | {bundle_key(name) for name in bundles()}
+    orphans = []
+    for info in podman.list_images():
+        names = {match.group(1) for match in map(IMAGE_NAME.search, info.get("Names") or []) if match}
+        names |= {bundle_key(match.group(1)) for match in map(BUNDLE_NAME.search, info.get("Names") or []) if match}
+        # An install in another process may not have registered its freshly committed image yet
+        if names and not names & keep and not any(locked_elsewhere(f"pkg-{name}") for name in names):
+            orphans.append(info)
+    return orphans
+
+def dangling_images():
+    """Dangling images that are isolator's: labelled ones (pre-update app images, old bases, old
+    build steps) and upstream images a newer base pull left behind. The user's other untagged
+    images are left alone."""
+    superseded = set(load_base_state().get("superseded_upstream", []))
+    return [info for info in podman.list_images(dangling=True)
+            if podman.IMAGE_LABEL in (info.get("Labels") or {}) or info["Id"] in superseded]
+
+def forget_superseded():
+    """Drop the superseded upstream images gc has removed from base.json"""
+    with base_lock():
+        state = load_base_state()
+        kept = [image for image in state.get("superseded_upstream", []) if podman.image_exists(image)]
+        if kept != state.get("superseded_upstream", []):
+            state["superseded_upstream"] = kept
+            save_base_state(state)
+
+def find_garbage():
+    """(stale temporary container IDs, orphaned app images, dangling isolator images) as podman lists them"""
+    return stale_containers(), orphaned_images(), dangling_images()
+
+def collect_garbage():
+    """Remove what find_garbage reports, containers first so the images they held become removable.
+    Returns the bytes reclaimed according to `podman system df`."""
+    containers, orphans = stale_containers(), orphaned_images()
+    before = podman.disk_usage()
+    for cid in containers:
+        podman.remove_container(cid, "Remove stale temporary container")
+    for info in orphans:
+        # Still in use by a warm container: rmi fails and the image is left for the next gc
+        podman.remove_image(info["Id"], f"Remove orphaned image {info['Id'][:12]}", check=False)
+    # Removing an image can leave its untagged parent dangling, so the listing is repeated
+    # until it has nothing new; each image gets one attempt
+    tried = set()
+    while True:
+        dangling = [info for info in dangling_images() if info["Id"] not in tried]
+        if not dangling:
+            break
+        for info in dangling:
+            tried.add(info["Id"])
+            podman.remove_image(info["Id"], f"Remove dangling image {info['Id'][:12]}", check=False)
+    forget_superseded()
+    reclaimed = max(0, before - podman.disk_usage())
+    main_logger.info(f"gc: {len(containers)} containers, {len(orphans)} orphaned and {len(tried)} dangling images, {reclaimed} bytes reclaimed")
+    return reclaimed
+
+def gc_command(dry_run=False):
+    try:
+        containers, orphans, dangling = find_garbage()
+        if not (containers or orphans or dangling):
+            panel("[bold green]Nie ma nic do usunięcia[/bold green]")
+            return
+        rows = [("kontener tymczasowy", cid[:12], "?") for cid in containers]
+        for kind, images in [("osierocony obraz", orphans), ("wiszący obraz", dangling)]:
+            for info in images:
+                rows.append((kind, ", ".join(info.get("Names") or []) or info["Id"][:12], f"{(info.get('Size') or 0) / 1024 / 1024:.1f} MB"))
+        if PLAIN:
+            # Tab separated: kind, object, size
+            print("\n".join("\t".join(row) for row in rows))
+        else:
+            from rich.table import Table
+            from rich.box import ROUNDED
+            table = Table(
+                title="Do usunięcia" if dry_run else "Usuwane obiekty",
+                title_style="bold color(201) on #1a2525",
+                show_lines=True,
+                border_style="bright_cyan",
+                header_style="bold white on #2d3b3b",
+                padding=(0, 1),
+                box=ROUNDED
+            )
+            table.add_column("Rodzaj", style="cyan", width=25)
+            table.add_column("Obiekt", style="white")
+            table.add_column("Rozmiar", style="green", justify="right")
+            for row in rows:
+                table.add_row(*row)
+            console.print(table)
+        if dry_run:
+            # Image sizes include layers they share with each other, so this is an upper bound
+            estimate = sum(info.get("Size") or 0 for info in orphans + dangling)
+            panel(
+                f"[bold yellow]Tryb próbny: nic nie zostało usunięte[/bold yellow]\n"
+                f"[yellow]Do odzyskania: do {estimate / 1024 / 1024:.1f} MB. Uruchom 'isolator gc' bez --dry-run.[/yellow]\n"
+                f"[yellow]Obrazy podman spoza isolatora nie są usuwane.[/yellow]",
+                "yellow",
+                "on #2d2a1a"
+            )
+            return
+        with spinner("Usuwanie nieużywanych kontenerów i obrazów..."):
+            reclaimed = collect_garbage()
+        panel(f"[bold green]Odzyskano {reclaimed / 1024 / 1024:.1f} MB[/bold green]")
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"gc error: {str(e)}")
+        log_subprocess_output(subprocess_logger, e, "gc error")
+        error_panel(f"Błąd podczas czyszczenia: {str(e)}", "Sprawdź konfigurację podman.")
+        sys.exit(1)
@@ -0,0 +1,181 @@
+import json
+import math
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from config import LOGS, SPANS_FILE, LAUNCH_TIMINGS_FILE, MAX_LOG_SIZE, STORE_LOCK_TIMEOUT, PLAIN, ensure_dirs
+from logger import main_logger, RUN_ID
+from locks import lock
+from ui import panel
+
+_lock = threading.Lock()
+
+def record_span(package, stage, start, duration, status, exit_code, flow=None, **fields):
+    """Append one span to the JSONL spans file; the file is rotated once at MAX_LOG_SIZE"""
+    span = {"run": RUN_ID, "flow": flow, "package": package, "stage": stage, "start": round(start, 3),
+            "duration": round(duration, 4), "status": status, "exit_code": exit_code, **fields}
+    try:
+        with _lock:
+            ensure_dirs(LOGS)
+            if SPANS_FILE.exists() and SPANS_FILE.stat().st_size > MAX_LOG_SIZE:
+                # Checked again under the lock: another isolator may have rotated it a moment ago
+                with lock("spans", STORE_LOCK_TIMEOUT):
+                    if SPANS_FILE.exists() and SPANS_FILE.stat().st_size > MAX_LOG_SIZE:
+                        os.replace(SPANS_FILE, SPANS_FILE.with_name(SPANS_FILE.name + ".1"))
+            with open(SPANS_FILE, "a") as f:
+                f.write(json.dumps(span) + "\n")
+    except OSError as e:
+        main_logger.error(f"Could not record span {stage} for {package}: {str(e)}")
+
+@contextmanager
+def span(package, stage, flow=None, fields=None):
+    """Time the block as a span. fields is a dict the block may fill in (bytes, cache hits, ...)
+    and is recorded with the span; exit_code comes from a CalledProcessError when one escapes,
+    or from fields["exit_code"] / fields["status"] for blocks that report failure without raising."""
+    fields = fields if fields is not None else {}
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield fields
+    except subprocess.CalledProcessError as e:
+        record_span(package, stage, start, time.perf_counter() - started, "failed", e.returncode, flow, **fields)
+        raise
+    except Exception:
+        record_span(package, stage, start, time.perf_counter() - started, "failed", None, flow, **fields)
+        raise
+    except BaseException:
+        record_span(package, stage, start, time.perf_counter() - started, "cancelled", None, flow, **fields)
+        raise
+    status, exit_code = fields.pop("status", "ok"), fields.pop("exit_code", 0)
+    record_span(package, stage, start, time.perf_counter() - started, status, exit_code, flow, **fields)
+
+def read_jsonl(path):
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # A line torn by a crash mid-write
+    except OSError:
+        pass
+    return records
+
+def load_spans():
+    return read_jsonl(SPANS_FILE.with_name(SPANS_FILE.name + ".1")) + read_jsonl(SPANS_FILE)
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def stage_stats(spans):
+    """{(flow, stage): (count, p50, p95, max, failures)} over every recorded span; the same stage
+    name in different flows (an install's commit and an update's) is timed separately"""
+    durations, failures = {}, {}
+    for record in spans:
+        key = (record.get("flow") or "-", record["stage"])
+        durations.setdefault(key, []).append(record["duration"])
+        if record.get("status") != "ok":
+            failures[key] = failures.get(key, 0) + 1
+    return {
+        key: (len(values), percentile(values, 0.5), percentile(values, 0.95), max(values), failures.get(key, 0))
+        for key, values in durations.items()
+    }
+
+def slowest_packages(spans, limit=10):
+    """Packages by their slowest install, summing the stages of each install run"""
+    runs = {}
+    for record in spans:
+        if record.get("flow") == "install" and record.get("package"):
+            key = (record["package"], record["run"])
+            runs[key] = runs.get(key, 0) + record["duration"]
+    worst = {}
+    for (package, _), total in runs.items():
+        worst[package] = max(worst.get(package, 0), total)
+    return sorted(worst.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+def update_history(spans, days=14):
+    """Per day: (images updated, p50 and total seconds) for the last `days` days with updates"""
+    by_day = {}
+    for record in spans:
+        if record.get("flow") == "update" and record["stage"] == "update":
+            day = time.strftime("%Y-%m-%d", time.localtime(record["start"]))
+            by_day.setdefault(day, []).append(record["duration"])
+    return [(day, len(values), percentile(values, 0.5), sum(values)) for day, values in sorted(by_day.items())[-days:]]
+
+def cache_hit_rates(spans):
+    """{cache: (hits, lookups)} for the caches that record hits in their spans, plus warm starts"""
+    rates = {}
+
+    def add(cache, hits, lookups):
+        old_hits, old_lookups = rates.get(cache, (0, 0))
+        rates[cache] = (old_hits + hits, old_lookups + lookups)
+
+    for record in spans:
+        if record.get("packages"):
+            add("pacman", record["packages"] - record.get("downloaded", 0), record["packages"])
+        if "aur_cache_hit" in record:
+            add("aur", int(record["aur_cache_hit"]), 1)
+        if record.get("layer_steps"):
+            add("layers", record.get("layer_cache_hits", 0), record["layer_steps"])
+        if "base_reused" in record:
+            add("base", int(record["base_reused"]), 1)
+    for launch in read_jsonl(LAUNCH_TIMINGS_FILE):
+        add("warm", int(launch.get("mode") == "warm"), 1)
+    return rates
+
+def stats_table(title, columns, rows):
+    """One section of the stats; columns are (header, rich column options)"""
+    from rich.table import Table
+    from rich.box import ROUNDED
+    table = Table(
+        title=title,
+        title_style="bold color(201) on #1a2525",
+        show_lines=True,
+        border_style="bright_cyan",
+        header_style="bold white on #2d3b3b",
+        padding=(0, 1),
+        box=ROUNDED
+    )
+    for header, options in columns:
+        table.add_column(header, **options)
+    for row in rows:
+        table.add_row(*row)
+    return table
+
+def show_stats():
+    spans = load_spans()
+    if not spans:
+        panel("[bold yellow]Brak zapisanych pomiarów. Statystyki pojawią się po pierwszej instalacji lub aktualizacji.[/bold yellow]", "yellow", "on #2d2a1a")
+        main_logger.info("No spans recorded yet")
+        return
+    right = {"style": "white", "justify": "right"}
+    rows = [(flow, stage, str(count), f"{p50:.2f} s", f"{p95:.2f} s", f"{worst:.2f} s", str(failures))
+            for (flow, stage), (count, p50, p95, worst, failures) in sorted(stage_stats(spans).items(), key=lambda item: item[1][2], reverse=True)]
+    sections = [("Czas etapów", [("Operacja", {"style": "magenta"}), ("Etap", {"style": "cyan"}), ("Liczba", right), ("p50", right),
+                                 ("p95", right), ("Maks.", right), ("Błędy", {"style": "red", "justify": "right"})], rows)]
+    slowest = slowest_packages(spans)
+    if slowest:
+        sections.append(("Najwolniejsze instalacje", [("Pakiet", {"style": "cyan", "width": 25}), ("Czas", {"style": "yellow", "justify": "right"})],
+                         [(package, f"{total:.1f} s") for package, total in slowest]))
+    history = update_history(spans)
+    if history:
+        sections.append(("Aktualizacje", [("Dzień", {"style": "cyan"}), ("Obrazy", right), ("p50", right), ("Łącznie", {"style": "yellow", "justify": "right"})],
+                         [(day, str(count), f"{p50:.1f} s", f"{total:.1f} s") for day, count, p50, total in history]))
+    rates = cache_hit_rates(spans)
+    if rates:
+        names = {"pacman": "Pakiety pacman", "aur": "Kompilacje AUR", "layers": "Warstwy Containerfile",
+                 "base": "Obraz bazowy", "warm": "Ciepłe starty"}
+        sections.append(("Trafienia w pamięć podręczną", [("Pamięć", {"style": "cyan"}), ("Trafienia", {"style": "green", "justify": "right"})],
+                         [(names.get(cache, cache), f"{hits}/{lookups} ({100 * hits / lookups:.0f}%)" if lookups else "-") for cache, (hits, lookups) in rates.items()]))
+    if PLAIN:
+        # A block per section: its title, then one tab separated line per row
+        print("\n\n".join("\n".join([title, *("\t".join(row) for row in rows)]) for title, _, rows in sections))
+    else:
+        for section in sections:
+            panel(stats_table(*section), "cyan", gap=section is sections[-1])
+    main_logger.info(f"Displayed stats for {len(spans)} spans")
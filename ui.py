@@ -1,11 +1,185 @@
-from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
-from rich.text import Text
-from rich.box import ROUNDED
-from config import console
+import itertools
+import re
+import sys
+from contextlib import nullcontext
+from config import PLAIN, console
+
+# rich is imported inside the functions below and never in plain mode (see config.PLAIN)
+
+COMMANDS = [
+    ("install <pakiet>", "Instaluje pakiet w nowym kontenerze", "isolator install {pakiet}"),
+    ("install [--jobs N] <pakiet>...", "Instaluje kilka pakietów równolegle, z jedną synchronizacją bazy", "isolator install -j 4 firefox gimp vlc"),
+    ("install --from <plik>", "Instaluje pakiety z listy lub z manifest.json innej maszyny", "isolator install --from aplikacje.txt"),
+    ("install --resume", "Wznawia przerwane instalacje od ostatniego etapu", "isolator install --resume"),
+    ("install --squash <pakiet>", "Zapisuje obraz jako jedną warstwę (mniej miejsca po wielu aktualizacjach, ale bez współdzielenia bazy)", "isolator install --squash {pakiet}"),
+    ("install --engine containerfile <pakiet>", "Buduje obraz z Containerfile z użyciem cache warstw podman", "isolator install --engine containerfile {pakiet}"),
+    ("run [--warm] <pakiet>", "Uruchamia zainstalowany pakiet (--warm: w utrzymywanym kontenerze)", "isolator run --warm {pakiet}"),
+    ("run --detach <pakiet>", "Uruchamia pakiet w tle i od razu wraca; wyjście trafia do ograniczonego logu", "isolator run -d {pakiet}"),
+    ("ps", "Pokazuje aplikacje działające w tle z użyciem CPU i pamięci", "isolator ps"),
+    ("logs [-f] [-n N] <pakiet>", "Wyświetla log aplikacji uruchomionej w tle (-f: na bieżąco)", "isolator logs -f {pakiet}"),
+    ("stop <pakiet|--idle>", "Zatrzymuje ciepły kontener i instancje w tle pakietu lub wszystkie bezczynne", "isolator stop {pakiet}"),
+    ("remove <pakiet>", "Usuwa pakiet i powiązane pliki", "isolator remove {pakiet}"),
+    ("bundle add <zestaw> <pakiet>...", "Instaluje pakiety do wspólnego obrazu zestawu; każdy ma własny skrypt i plik .desktop", "isolator bundle add qt-apps kate okular"),
+    ("bundle remove <zestaw> <pakiet>...", "Usuwa pakiety z zestawu (ostatni usuwa cały zestaw)", "isolator bundle remove qt-apps okular"),
+    ("bundle list", "Wyświetla zestawy i ich pakiety", "isolator bundle list"),
+    ("update-all [--jobs N]", "Aktualizuje wszystkie kontenery równolegle (domyślnie N = liczba rdzeni)", "isolator update-all --jobs 4"),
+    ("update-daemon [--once]", "Aktualizuje bazę i obrazy w tle z niskim priorytetem, pomija uruchomione aplikacje i pracę na baterii", "isolator update-daemon --once"),
+    ("update-daemon install|uninstall|status", "Włącza lub usuwa timer systemd aktualizacji w tle; wynik ostatniej aktualizacji", "isolator update-daemon install"),
+    ("list", "Wyświetla listę zainstalowanych pakietów", "isolator list"),
+    ("search <fraza>", "Szuka pakietów w lokalnym indeksie repozytoriów i AUR (działa offline)", "isolator search firefox"),
+    ("index update [--aur]", "Synchronizuje bazę pakietów i przebudowuje lokalny indeks", "isolator index update --aur"),
+    ("index status|export|import", "Stan indeksu; zapis i wczytanie migawki do pracy offline", "isolator index export indeks.sqlite"),
+    ("reindex", "Odbudowuje indeks pakietów na podstawie 'podman images'", "isolator reindex"),
+    ("stats", "Pokazuje czasy etapów (p50/p95), najwolniejsze instalacje i trafienia w cache", "isolator stats"),
+    ("base refresh", "Synchronizuje wspólny obraz bazowy", "isolator base refresh"),
+    ("export [--thin] [--base] -o <cel> <pakiet>...", "Zapisuje obrazy z uruchamiaczami do archiwum .tar.zst lub katalogu (--thin: bez warstw bazowych)", "isolator export -o aplikacje.tar.zst firefox"),
+    ("import <plik|katalog> [pakiet...]", "Instaluje obrazy z eksportu bez ponownego budowania", "isolator import aplikacje.tar.zst"),
+    ("du", "Pokazuje rozmiar obrazów: część wspólną z bazą, z innymi aplikacjami i unikalną", "isolator du"),
+    ("gc [--dry-run]", "Usuwa wiszące obrazy, osierocone obrazy i tymczasowe kontenery, podaje odzyskane miejsce", "isolator gc --dry-run"),
+    ("cache prune [--max-size MB] [--max-age DNI]", "Czyści wspólną pamięć podręczną pakietów", "isolator cache prune --max-size 2048"),
+    ("base status", "Pokazuje wiek wspólnego obrazu bazowego", "isolator base status"),
+    ("help", "Wyświetla to menu pomocy", "isolator help"),
+    ("?", "Synonim dla help", "isolator ?")
+]
+
+# rich markup such as [bold red] or [/bold red], dropped from text printed in plain mode
+MARKUP = re.compile(r"\[/?[a-z][\w #().,-]*\]")
+
+def plain_text(text):
+    return MARKUP.sub("", text)
+
+def say(text, style="bold green"):
+    if PLAIN:
+        print(text)
+    else:
+        console.print(f"[{style}]{text}[/{style}]")
+
+def error_panel(message, hint):
+    if PLAIN:
+        print(f"{message}\n{hint}", file=sys.stderr)
+        return
+    from rich.panel import Panel
+    from rich.box import ROUNDED
+    console.print(Panel(
+        f"[bold red]{message}[/bold red]\n"
+        f"[red]{hint}[/red]",
+        border_style="red",
+        padding=(1, 2),
+        style="on #2d1a1a",
+        box=ROUNDED
+    ))
+
+def panel(text, border_style="green", style="on #1a2525", gap=True):
+    """text (rich markup) in a rounded panel, followed by a blank line with gap;
+    in plain mode the bare text, on stderr for red (error) panels"""
+    if PLAIN:
+        print(plain_text(text), file=sys.stderr if border_style == "red" else sys.stdout)
+        return
+    from rich.panel import Panel
+    from rich.box import ROUNDED
+    console.print(Panel(
+        text,
+        border_style=border_style,
+        padding=(1, 2),
+        style=style,
+        box=ROUNDED
+    ))
+    if gap:
+        console.print("\n")
+
+def spinner(text, style="bold cyan"):
+    """A spinner with text while the block runs; in plain mode the text is printed once"""
+    if PLAIN:
+        print(text)
+        return nullcontext()
+    return console.status(f"[{style}]{text}[/{style}]", spinner="dots")
+
+class PlainProgress:
+    """Stands in for rich's Progress in plain mode: prints a line whenever a task's description
+    changes. With disable nothing is printed at all, as with Progress(disable=True)."""
+
+    def __init__(self, disable=False):
+        self.disable = disable
+        self.ids = itertools.count()
+        self.descriptions = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_task(self, description, **fields):
+        task = next(self.ids)
+        self.descriptions[task] = description
+        return task
+
+    def update(self, task, description=None, **fields):
+        if description is None or self.descriptions.get(task) == description:
+            return
+        self.descriptions[task] = description
+        if not self.disable:
+            print(plain_text(description))
+
+    def advance(self, task, advance=1):
+        pass
+
+    def remove_task(self, task):
+        self.descriptions.pop(task, None)
+
+def progress(percentage=True):
+    """The install/update progress display: spinner, description, bar, done/total and times,
+    plus percentage and time remaining with percentage; a PlainProgress in plain mode"""
+    if PLAIN:
+        return PlainProgress()
+    from rich.progress import (
+        Progress, BarColumn, TextColumn, TimeRemainingColumn,
+        TimeElapsedColumn, SpinnerColumn, MofNCompleteColumn
+    )
+    columns = [
+        SpinnerColumn(spinner_name="dots"),
+        TextColumn("[progress.description]{task.description}", style="bold cyan"),
+        BarColumn(bar_width=None, style="blue", complete_style="green"),
+        MofNCompleteColumn(),
+    ]
+    if percentage:
+        columns += [TextColumn("[progress.percentage]{task.percentage:>3.1f}%", style="white"), TimeElapsedColumn(), TimeRemainingColumn()]
+    else:
+        columns.append(TimeElapsedColumn())
+    return Progress(*columns, console=console)
+
+def show_results(title, rows, gap=True, column="Pakiet"):
+    """Per-package outcomes of a batch as (package, result with markup) rows: a table in a panel,
+    or tab separated lines in plain mode"""
+    if PLAIN:
+        print("\n".join(f"{name}\t{plain_text(result)}" for name, result in rows))
+        return
+    from rich.table import Table
+    from rich.box import ROUNDED
+    table = Table(
+        title=title,
+        title_style="bold color(201) on #1a2525",
+        show_lines=True,
+        border_style="bright_cyan",
+        header_style="bold white on #2d3b3b",
+        padding=(0, 1),
+        box=ROUNDED
+    )
+    table.add_column(column, style="cyan", width=25)
+    table.add_column("Wynik")
+    for row in rows:
+        table.add_row(*row)
+    panel(table, "cyan", gap=gap)
+
+def usage_error(usage, example):
+    error_panel(f"Błąd: Użycie: {usage}", f"Przykład: {example}")
 
 def print_header():
+    if PLAIN:
+        return
+    from rich.panel import Panel
+    from rich.text import Text
+    from rich.box import ROUNDED
     console.print("\n")
     title = Text("Isolator: Kontenerowy Menedżer Pakietów", style="bold white")
     title.stylize("color(75) bold", 0, 9) # Gradient effect on "Isolator"
@@ -21,6 +195,13 @@ def print_header():
     console.print("\n")
 
 def show_help():
+    if PLAIN:
+        width = max(len(cmd) for cmd, _, _ in COMMANDS)
+        print("\n".join(f"{cmd:<{width}}  {desc}" for cmd, desc, _ in COMMANDS))
+        return
+    from rich.table import Table
+    from rich.panel import Panel
+    from rich.box import ROUNDED
     table = Table(
         title="Dostępne Komendy",
         title_style="bold color(201) on #1a2525",
@@ -33,16 +214,7 @@ def show_help():
     table.add_column("Komenda", style="cyan", no_wrap=True, width=25)
     table.add_column("Opis", style="green", width=45)
     table.add_column("Przykład", style="yellow")
-    commands = [
-        ("install <pakiet>", "Instaluje pakiet w nowym kontenerze", "isolator install {pakiet}"),
-        ("run <pakiet>", "Uruchamia zainstalowany pakiet", "isolator run {pakiet}"),
-        ("remove <pakiet>", "Usuwa pakiet i powiązane pliki", "isolator remove {pakiet}"),
-        ("update-all", "Aktualizuje wszystkie kontenery", "isolator update-all"),
-        ("list", "Wyświetla listę zainstalowanych pakietów", "isolator list"),
-        ("help", "Wyświetla to menu pomocy", "isolator help"),
-        ("?", "Synonim dla help", "isolator ?")
-    ]
-    for cmd, desc, example in commands:
+    for cmd, desc, example in COMMANDS:
         table.add_row(cmd, desc, example)
     console.print(Panel(
         table,
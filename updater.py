@@ -0,0 +1,231 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from config import UPDATE_INTERVAL_HOURS, UPDATE_CPUS, UPDATE_STATE_FILE, SYSTEMD_USER_DIR, PLAIN, console
+from logger import main_logger, subprocess_logger, log_subprocess_output
+from utils import atomic_write_json
+from ui import say, error_panel, show_results, PlainProgress
+from base import ensure_base_image, sync_database, load_base_state
+from index import refresh_index
+from manifest import update_units, get_unit
+from detached import running
+from container import update_image
+from locks import lock, package_lock, LockTimeout
+import podman_api as podman
+
+# Background updates: the same per-image update as update-all, one image at a time, at idle CPU and IO
+# priority and with a CPU limit on the update containers. An image is swapped in by the commit that
+# retags it, so a launch sees either the old image or the finished new one, never a half-updated one.
+UNIT_NAME = "isolator-update"
+BATTERY_RETRY_MINUTES = 15
+POWER_SUPPLY = Path("/sys/class/power_supply")
+
+def on_battery():
+    """True when the machine has a battery and no mains adapter is online; desktops never are"""
+    batteries, mains = False, False
+    for supply in POWER_SUPPLY.glob("*"):
+        try:
+            kind = (supply / "type").read_text().strip()
+            online = kind == "Mains" and (supply / "online").read_text().strip() == "1"
+        except OSError:
+            continue
+        batteries = batteries or kind == "Battery"
+        mains = mains or online
+    return batteries and not mains
+
+def throttle():
+    """Lowest CPU and idle IO priority for this process; podman, conmon and pacman inherit both"""
+    os.nice(19 - os.nice(0))
+    if shutil.which("ionice"):
+        subprocess.run(["ionice", "-c", "3", "-p", str(os.getpid())], capture_output=True)
+
+def container_limits():
+    """The update containers run in their own cgroups, outside the service's CPUQuota, so they get their own limit"""
+    return ["--cpus", f"{UPDATE_CPUS:g}"]
+
+def busy_packages(records):
+    """Packages and bundles with a running or paused container: attached, warm or detached (of any member, for a bundle)"""
+    in_use = podman.running_images()
+    detached = {entry["package"] for entry in running()}
+    busy = set()
+    for name, record in records.items():
+        if record.get("image") in in_use or record.get("image_id") in in_use or detached & set(record.get("packages") or [name]):
+            busy.add(name)
+    return busy
+
+def update_pass():
+    """One background pass: refresh the base, then update every idle image. Returns {pkg: (status, detail)}."""
+    results = {}
+    if on_battery():
+        main_logger.info("Background update skipped: running on battery")
+        return None
+    ensure_base_image()
+    sync_database()
+    refresh_index()
+    base_id = load_base_state().get("image_id")
+    records = update_units(reload=True)
+    busy = busy_packages(records)
+    # No progress display; update_image still reports through one
+    progress = PlainProgress(disable=True)
+    for name in sorted(records):
+        if on_battery():
+            main_logger.info("Background update stopped: switched to battery")
+            results.update({rest: ("skipped", "zasilanie z baterii") for rest in sorted(records) if rest not in results})
+            break
+        if name in busy:
+            results[name] = ("skipped", "aplikacja jest uruchomiona")
+            continue
+        try:
+            with package_lock(name, timeout=0):
+                record = get_unit(name, reload=True)
+                if record is None:
+                    continue
+                results[name] = update_image(name, record, base_id, progress, progress.add_task(name, total=5), limits=container_limits())
+        except LockTimeout:
+            results[name] = ("skipped", "zajęty przez inny proces isolator")
+    return results
+
+def record_pass(results):
+    state = {"finished_at": time.time(), "on_battery": results is None,
+             "results": {name: [status, detail if isinstance(detail, (int, float)) else str(detail)] for name, (status, detail) in (results or {}).items()}}
+    atomic_write_json(UPDATE_STATE_FILE, state)
+    if results:
+        counts = {}
+        for status, _ in results.values():
+            counts[status] = counts.get(status, 0) + 1
+        main_logger.info(f"Background update pass: {', '.join(f'{count} {status}' for status, count in sorted(counts.items()))}")
+
+def run_once():
+    """A single throttled pass, skipped when another one is still running; True unless an update failed"""
+    throttle()
+    try:
+        with lock("update-daemon", timeout=0):
+            results = update_pass()
+    except LockTimeout:
+        main_logger.info("Background update skipped: another pass is running")
+        return True
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"Background update error: {str(e)}")
+        log_subprocess_output(subprocess_logger, e, "Background update error")
+        return False
+    record_pass(results)
+    return not any(status == "failed" for status, _ in (results or {}).values())
+
+def daemon_loop():
+    """Without systemd: a pass every UPDATE_INTERVAL_HOURS, retried sooner when it was skipped on battery"""
+    main_logger.info(f"Update daemon started, interval {UPDATE_INTERVAL_HOURS}h")
+    say(f"Aktualizacje w tle co {UPDATE_INTERVAL_HOURS} h (Ctrl+C kończy)", "bold cyan")
+    try:
+        while True:
+            run_once()
+            skipped = on_battery()
+            time.sleep(BATTERY_RETRY_MINUTES * 60 if skipped else UPDATE_INTERVAL_HOURS * 3600)
+    except KeyboardInterrupt:
+        main_logger.info("Update daemon stopped")
+
+def unit_files():
+    script = Path(__file__).resolve().parent / "isolator.py"
+    service = f"""[Unit]
+Description=Isolator background image updates
+After=network-online.target
+ConditionACPower=true
+
+[Service]
+Type=oneshot
+ExecStart={sys.executable} {script} update-daemon --once
+Environment=ISOLATOR_PLAIN=1
+Nice=19
+IOSchedulingClass=idle
+CPUQuota={int(UPDATE_CPUS * 100)}%
+IOWeight=10
+"""
+    timer = f"""[Unit]
+Description=Run isolator background image updates every {UPDATE_INTERVAL_HOURS}h
+
+[Timer]
+OnBootSec=15min
+OnUnitActiveSec={UPDATE_INTERVAL_HOURS}h
+RandomizedDelaySec=15min
+
+[Install]
+WantedBy=timers.target
+"""
+    return {SYSTEMD_USER_DIR / f"{UNIT_NAME}.service": service, SYSTEMD_USER_DIR / f"{UNIT_NAME}.timer": timer}
+
+def install_units():
+    if not shutil.which("systemctl"):
+        error_panel("Błąd: Brak systemctl", "Uruchom 'isolator update-daemon' jako zwykły proces w tle.")
+        main_logger.error("Cannot install update timer: systemctl not found")
+        sys.exit(1)
+    SYSTEMD_USER_DIR.mkdir(parents=True, exist_ok=True)
+    for path, text in unit_files().items():
+        path.write_text(text)
+    try:
+        subprocess.run(["systemctl", "--user", "daemon-reload"], check=True, capture_output=True)
+        subprocess.run(["systemctl", "--user", "enable", "--now", f"{UNIT_NAME}.timer"], check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        main_logger.error(f"Enabling update timer failed: {str(e)}")
+        log_subprocess_output(subprocess_logger, e, "Enabling update timer failed")
+        error_panel(f"Błąd podczas włączania timera: {str(e)}", "Sprawdź 'systemctl --user status'.")
+        sys.exit(1)
+    main_logger.info(f"Installed and enabled {UNIT_NAME}.timer")
+    say(f"Włączono {UNIT_NAME}.timer: aktualizacje co {UPDATE_INTERVAL_HOURS} h, tylko przy zasilaniu sieciowym\n")
+
+def uninstall_units():
+    paths = [path for path in unit_files() if path.exists()]
+    if not paths:
+        say("Timer aktualizacji nie jest zainstalowany\n", "bold yellow")
+        return
+    if shutil.which("systemctl"):
+        subprocess.run(["systemctl", "--user", "disable", "--now", f"{UNIT_NAME}.timer"], capture_output=True)
+    for path in paths:
+        path.unlink()
+    if shutil.which("systemctl"):
+        subprocess.run(["systemctl", "--user", "daemon-reload"], capture_output=True)
+    main_logger.info(f"Removed {UNIT_NAME} units")
+    say(f"Usunięto {UNIT_NAME}.timer\n")
+
+def show_status():
+    installed = all(path.exists() for path in unit_files())
+    try:
+        with open(UPDATE_STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = None
+    last = time.strftime("%Y-%m-%d %H:%M", time.localtime(state["finished_at"])) if state else "nigdy"
+    if PLAIN:
+        print(f"timer\t{'tak' if installed else 'nie'}\nostatnio\t{last}")
+        for name, (status, detail) in sorted((state or {}).get("results", {}).items()):
+            print(f"{name}\t{status}\t{detail}")
+        return
+    rows = []
+    for name, (status, detail) in sorted((state or {}).get("results", {}).items()):
+        if status == "updated":
+            rows.append((name, f"[green]zaktualizowany ({detail / 1024 / 1024:+.1f} MB)[/green]"))
+        elif status == "up to date":
+            rows.append((name, "[green]aktualny[/green]"))
+        elif status == "skipped":
+            rows.append((name, f"[yellow]pominięty: {detail}[/yellow]"))
+        else:
+            rows.append((name, f"[red]błąd: {detail}[/red]"))
+    show_results(f"Ostatnia aktualizacja w tle: {last}", rows, gap=False)
+    note = "pominięta (zasilanie z baterii)" if state and state.get("on_battery") else ""
+    console.print(f"[cyan]Timer systemd: {'włączony' if installed else 'nie zainstalowany'}[/cyan]{f'  [yellow]Ostatnia próba {note}[/yellow]' if note else ''}\n")
+    main_logger.info("Displayed background update status")
+
+def update_daemon_command(action):
+    if action == "--once":
+        if not run_once():
+            sys.exit(1)
+    elif action == "install":
+        install_units()
+    elif action == "uninstall":
+        uninstall_units()
+    elif action == "status":
+        show_status()
+    else:
+        daemon_loop()
@@ -1,7 +1,9 @@
+import json
+import os
 import sys
 import termios
 import fcntl
-from config import console
+from config import PLAIN, console
 
 def get_key():
     fd = sys.stdin.fileno()
@@ -16,21 +18,27 @@ def get_key():
             try:
                 c = sys.stdin.read(1)
                 if c:
-                    termios.tcsetattr(fd, termios.TCDRAIN, oldterm)
+                    termios.tcsetattr(fd, termios.TCSADRAIN, oldterm)
                     fcntl.fcntl(fd, fcntl.F_SETFL, oldflags)
                     return c
             except IOError:
                 pass
     finally:
-        termios.tcsetattr(fd, termios.TCDRAIN, oldterm)
+        termios.tcsetattr(fd, termios.TCSADRAIN, oldterm)
         fcntl.fcntl(fd, fcntl.F_SETFL, oldflags)
 
-def choose_yes_no():
+def choose_yes_no(question="Pakiet nie znaleziony w standardowych repozytoriach. Czy sprawdzić AUR?"):
+    if PLAIN:
+        # No arrow-key menu without a terminal to draw it on; anything but "t" / "tak" declines
+        try:
+            return input(f"{question} [t/N] ").strip().lower() in ("t", "tak")
+        except EOFError:
+            return False
     options = ["Tak", "Nie"]
     selected = 0
     while True:
         console.clear()
-        console.print("[bold cyan]Pakiet nie znaleziony w standardowych repozytoriach. Czy sprawdzić AUR?[/bold cyan]\n")
+        console.print(f"[bold cyan]{question}[/bold cyan]\n")
         for i, opt in enumerate(options):
             if i == selected:
                 console.print(f"> [bold green]{opt}[/bold green]")
@@ -48,3 +56,18 @@ def choose_yes_no():
         elif key in ('\r', '\n'):
             console.clear()
             return options[selected] == "Tak"
+
+def atomic_write_json(path, data):
+    """Write JSON so readers only ever see the old or the new file: temp file, fsync, rename"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
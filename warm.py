@@ -0,0 +1,122 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from config import RUNTIME, LOGS, LAUNCH_TIMINGS_FILE, WARM_IDLE_TIMEOUT_MINUTES, WARM_PAUSE, ensure_dirs
+from logger import main_logger
+from runner import run_streaming
+
+def warm_name(pkg):
+    return f"isolator-warm-{pkg}"
+
+def marker(pkg):
+    """RUNTIME/<pkg>.warm: its mtime is the last launch, its content the image ID the container runs"""
+    ensure_dirs(RUNTIME)
+    return RUNTIME / f"{pkg}.warm"
+
+def warm_image_id(pkg):
+    try:
+        return marker(pkg).read_text().strip() or None
+    except OSError:
+        return None
+
+def container_status(name):
+    """running / paused / exited / ... or None when the container does not exist"""
+    proc = subprocess.run(["podman", "container", "inspect", "--format", "{{.State.Status}}", name], capture_output=True)
+    return proc.stdout.decode().strip() if proc.returncode == 0 else None
+
+def active_execs(name):
+    proc = subprocess.run(["podman", "container", "inspect", "--format", "{{len .ExecIDs}}", name], capture_output=True)
+    return int(proc.stdout.decode().strip() or 0) if proc.returncode == 0 else 0
+
+def record_timing(pkg, mode, seconds):
+    ensure_dirs(LOGS)
+    with open(LAUNCH_TIMINGS_FILE, "a") as f:
+        f.write(json.dumps({"package": pkg, "mode": mode, "seconds": round(seconds, 4), "at": time.time()}) + "\n")
+    main_logger.info(f"{mode} start for {pkg} took {seconds:.3f}s")
+
+def start_warm_container(pkg, image, image_id=None):
+    name = warm_name(pkg)
+    display = os.environ.get("DISPLAY", "")
+    subprocess.run(["xhost", f"+SI:localuser:{os.environ.get('USER', '')}"], capture_output=True)
+    run_streaming(["podman", "rm", "-f", name], f"Remove stale warm container for {pkg}")
+    run_streaming([
+        "podman", "run", "-d", "--name", name,
+        "-e", f"DISPLAY={display}",
+        "-v", "/tmp/.X11-unix:/tmp/.X11-unix:rw",
+        "-v", f"{os.path.expanduser('~')}:/home/user:rw",
+        "--device", "/dev/dri",
+        str(image), "sleep", "infinity"
+    ], f"Start warm container for {pkg}", check=True)
+    marker(pkg).write_text(image_id or "")
+
+def ensure_warm(pkg, image, image_id=None):
+    """Bring the warm container to running state; returns ("warm" | "cold", seconds spent).
+    A container still on an image the package has since been updated away from is recreated,
+    unless an app from an earlier launch is still open in it."""
+    started = time.monotonic()
+    status = container_status(warm_name(pkg))
+    if status in ("running", "paused") and image_id and warm_image_id(pkg) != image_id:
+        if status == "running" and active_execs(warm_name(pkg)) > 0:
+            main_logger.info(f"Warm container for {pkg} runs an outdated image but is in use, reusing it")
+        else:
+            main_logger.info(f"Warm container for {pkg} runs an outdated image, recreating it")
+            stop_warm(pkg)
+            status = None
+    if status == "running":
+        mode = "warm"
+    elif status == "paused":
+        run_streaming(["podman", "unpause", warm_name(pkg)], f"Unpause warm container for {pkg}", check=True)
+        mode = "warm"
+    else:
+        start_warm_container(pkg, image, image_id)
+        mode = "cold"
+    return mode, time.monotonic() - started
+
+def exec_warm(pkg):
+    """Run the app inside the warm container, attached to the caller's terminal"""
+    marker(pkg).touch()
+    args = ["podman", "exec"]
+    if sys.stdin.isatty():
+        args.append("-it")
+    args += ["-e", f"DISPLAY={os.environ.get('DISPLAY', '')}", warm_name(pkg), pkg]
+    try:
+        return subprocess.run(args).returncode
+    finally:
+        marker(pkg).touch()
+        if WARM_PAUSE and active_execs(warm_name(pkg)) == 0:
+            run_streaming(["podman", "pause", warm_name(pkg)], f"Pause warm container for {pkg}")
+
+def run_warm(pkg, image, image_id=None):
+    reap_idle()
+    mode, seconds = ensure_warm(pkg, image, image_id)
+    record_timing(pkg, mode, seconds)
+    return mode, seconds, exec_warm(pkg)
+
+def stop_warm(pkg):
+    name = warm_name(pkg)
+    if container_status(name) is None:
+        marker(pkg).unlink(missing_ok=True)
+        return False
+    run_streaming(["podman", "rm", "-f", "-t", "2", name], f"Stop warm container for {pkg}", check=True)
+    marker(pkg).unlink(missing_ok=True)
+    main_logger.info(f"Stopped warm container for {pkg}")
+    return True
+
+def reap_idle(timeout_minutes=WARM_IDLE_TIMEOUT_MINUTES):
+    """Stop warm containers whose app has not been launched for timeout_minutes"""
+    reaped = []
+    now = time.time()
+    for path in RUNTIME.glob("*.warm"):
+        pkg = path.stem
+        if now - path.stat().st_mtime < timeout_minutes * 60:
+            continue
+        # An app still open from an earlier launch keeps its container alive
+        if container_status(warm_name(pkg)) == "running" and active_execs(warm_name(pkg)) > 0:
+            continue
+        stop_warm(pkg)
+        reaped.append(pkg)
+    if reaped:
+        main_logger.info(f"Reaped idle warm containers: {', '.join(reaped)}")
+    return reaped